@@ -0,0 +1,98 @@
+"""Canal de secours des alertes (webhook HTTP générique).
+
+Quand une alerte WhatsApp n'atteint pas un contact (abandonnée par l'outbox
+après tous les essais, ou statut `failed` renvoyé par Meta), le même
+avertissement est envoyé en JSON à `ALERT_FALLBACK_WEBHOOK_URL` (Slack,
+Discord, ntfy, Home Assistant...: champ `text` + détails).
+
+Le message de secours passe lui aussi par l'outbox (type `alert_fallback`,
+transport dédié): durable et réessayé comme une alerte, une seule fois par
+alerte non délivrée (clé de déduplication).
+"""
+
+from __future__ import annotations
+
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+
+from config import ALERT_FALLBACK_WEBHOOK_URL
+from outbound_dispatcher import Attempt, PRIORITY_HIGH
+from outbox import OutboxEntry, OutboxMessage, get_outbox, register_handler, register_transport
+
+logger = logging.getLogger("whatsapp_bot")
+
+KIND_ALERT_FALLBACK = "alert_fallback"
+
+_session = requests.Session()
+_executor: ThreadPoolExecutor | None = None
+
+
+def _post(payload: dict) -> Attempt:
+    """Un envoi au webhook de secours (même classement que les appels WhatsApp)"""
+    try:
+        r = _session.post(ALERT_FALLBACK_WEBHOOK_URL, json=payload, timeout=10)
+    except requests.exceptions.RequestException as e:
+        logger.error(f"❌ Canal de secours injoignable: {e}")
+        return Attempt(retry_after=0)
+    if 200 <= r.status_code < 300:
+        return Attempt(response=r)
+    if r.status_code == 429 or r.status_code >= 500:
+        logger.warning(f"⚠️ Canal de secours indisponible ({r.status_code})")
+        return Attempt(retry_after=0, rate_limited=r.status_code == 429)
+    logger.error(f"❌ Canal de secours: erreur {r.status_code}: {r.text[:200]}")
+    return Attempt()
+
+
+def submit(payload: dict, priority: int) -> Future:
+    """Transport outbox des messages de secours (pool dédié, créé au premier envoi)"""
+    global _executor
+    if not ALERT_FALLBACK_WEBHOOK_URL:
+        future: Future = Future()
+        future.set_result(Attempt())
+        return future
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="alert-fallback")
+    return _executor.submit(_post, payload)
+
+
+def enqueue_fallback(entry: OutboxEntry, reason: str) -> bool:
+    """Met en file le message de secours d'une alerte non délivrée (une fois par alerte)"""
+    if not ALERT_FALLBACK_WEBHOOK_URL:
+        logger.warning(f"⚠️ Alerte non délivrée à {entry.recipient} ({entry.tenant_id}), aucun canal de secours configuré")
+        return False
+
+    from services import get_tenant_registry
+
+    tenant = get_tenant_registry().get(entry.tenant_id) if entry.tenant_id else None
+    name = (tenant.name if tenant and tenant.name else None) or entry.tenant_id
+    payload = {
+        "text": (
+            f"⚠️ Alerte bien-être : {name} n'a pas répondu au message quotidien. "
+            f"L'alerte WhatsApp n'a pas pu être remise à {entry.recipient} ({reason})."
+        ),
+        "tenant": entry.tenant_id,
+        "recipient": entry.recipient,
+        "reason": reason,
+    }
+    added = get_outbox().enqueue([
+        OutboxMessage(
+            KIND_ALERT_FALLBACK, ALERT_FALLBACK_WEBHOOK_URL, payload, tenant_id=entry.tenant_id,
+            priority=PRIORITY_HIGH, dedup_key=f"{KIND_ALERT_FALLBACK}:{entry.id}",
+        )
+    ])
+    if added:
+        logger.warning(f"📝 Alerte non délivrée à {entry.recipient} ({entry.tenant_id}): envoi au canal de secours")
+    return bool(added)
+
+
+def _on_fallback_done(entry: OutboxEntry, delivered: bool) -> None:
+    if delivered:
+        logger.info(f"✅ Alerte transmise au canal de secours ({entry.tenant_id})")
+    else:
+        logger.error(f"❌ Canal de secours en échec, alerte perdue ({entry.tenant_id})")
+
+
+register_transport(KIND_ALERT_FALLBACK, submit)
+register_handler(KIND_ALERT_FALLBACK, _on_fallback_done)
@@ -14,12 +14,13 @@ configure_logging(
 
 from flask import Flask
 from flask_cors import CORS
-from config import (
-    CORS_ORIGINS, TZ, DAILY_HOUR, RESPONSE_TIMEOUT_MIN, ALERT_PHONES,
-    validate_config
-)
+from config import CORS_ORIGINS, WA_TRANSPORT, validate_config
 from scheduler_service import start_scheduler, stop_scheduler
-from routes import webhooks, health, debug, widget
+from routes import webhooks, health, debug, widget, metrics, events
+from services import get_state_manager, get_tenant_registry
+from outbox import stop_outbox
+from webhook_queue import get_webhook_queue
+from whatsapp_api import get_dispatcher
 
 logger = logging.getLogger("whatsapp_bot")
 
@@ -54,6 +55,14 @@ def shutdown_handler(signum=None, frame=None):
     """Arrête proprement le scheduler et l'application"""
     logger.info("🛑 Signal d'arrêt reçu, arrêt du scheduler...")
     stop_scheduler()
+    get_webhook_queue().stop()
+    get_dispatcher().stop()
+    # Après le répartiteur: les envois en cours reviennent en file (nouvel essai)
+    stop_outbox()
+    get_state_manager().close()
+    if WA_TRANSPORT == "httpx":
+        import whatsapp_async
+        whatsapp_async.stop()
     sys.exit(0)
 
 # Enregistrer les handlers de signal pour un shutdown propre
@@ -66,13 +75,17 @@ app.register_blueprint(webhooks.bp)
 app.register_blueprint(health.bp)
 app.register_blueprint(debug.bp)
 app.register_blueprint(widget.bp)
+app.register_blueprint(metrics.bp)
+app.register_blueprint(events.bp)
 
 # ================== MAIN ==================
 if __name__ == "__main__":
     logger.info("🚀 Démarrage du bot WhatsApp Wellbeing")
-    logger.info(f"📅 Ping quotidien à {DAILY_HOUR}h")
-    logger.info(f"⏱️ Timeout: {RESPONSE_TIMEOUT_MIN} minutes")
-    logger.info(f"📞 Contacts d'alerte: {len(ALERT_PHONES)}")
+    for tenant in get_tenant_registry().all():
+        logger.info(
+            f"👤 {tenant.tenant_id}: ping à {tenant.daily_hour}h ({tenant.tz}), "
+            f"timeout {tenant.timeout_min} min, {len(tenant.alert_phones)} contact(s) d'alerte"
+        )
     
     logger.info("🔧 Démarrage du serveur Flask intégré (développement)")
     logger.warning("⚠️ En production, utilisez Gunicorn (USE_GUNICORN=true via Dockerfile)")
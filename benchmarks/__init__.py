@@ -0,0 +1 @@
+"""Benchmarks du bot WhatsApp Wellbeing (hors production, sans appel à Meta)"""
@@ -0,0 +1,88 @@
+"""Débit des mutations d'état sous une rafale de webhooks: commit sync contre group.
+
+Usage:
+    python -m benchmarks.bench_state_commit --replies 2000 --tenants 200 --threads 4
+
+Pour chaque backend (json, sqlite) et chaque mode de commit, `--threads`
+threads appellent `set_reply` sur des tenants tirés au hasard (comme les
+consommateurs de la file webhook). Mesure les mutations/s et le nombre
+d'écritures (fsync) effectives, puis vérifie que rien n'est perdu.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from state_manager import StateManager  # noqa: E402
+from state_storage import JsonStateStorage, SqliteStateStorage  # noqa: E402
+
+
+def run(backend: str, mode: str, replies: int, tenants: int, threads: int, delay_ms: int, batch: int) -> tuple[float, int]:
+    with tempfile.TemporaryDirectory() as tmp:
+        state_file = os.path.join(tmp, "state.json")
+        if backend == "sqlite":
+            storage = SqliteStateStorage(os.path.join(tmp, "state.db"))
+        else:
+            storage = JsonStateStorage(state_file)
+        manager = StateManager(state_file, storage=storage, commit_mode=mode,
+                               commit_delay=delay_ms / 1000, commit_batch=batch)
+        tenant_ids = [f"t{i}" for i in range(tenants)]
+        per_thread = replies // threads
+
+        def storm(seed: int):
+            rnd = random.Random(seed)
+            for _ in range(per_thread):
+                manager.set_reply(rnd.choice(tenant_ids))
+
+        workers = [threading.Thread(target=storm, args=(i,)) for i in range(threads)]
+        start = time.perf_counter()
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        manager.flush()
+        elapsed = time.perf_counter() - start
+
+        writes = manager.flushes
+        manager.close()
+        storage.close()
+
+        # Relecture depuis le disque: aucune réponse perdue
+        reloaded = StateManager(state_file, storage=(
+            SqliteStateStorage(os.path.join(tmp, "state.db")) if backend == "sqlite" else JsonStateStorage(state_file)
+        ))
+        total = sum(reloaded.get_state(tid).total_replies for tid in tenant_ids)
+        reloaded.storage.close()
+        assert total == per_thread * threads, f"{per_thread * threads - total} réponse(s) perdue(s)"
+        return per_thread * threads / elapsed, writes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replies", type=int, default=2000)
+    parser.add_argument("--tenants", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--delay-ms", type=int, default=50)
+    parser.add_argument("--batch", type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"{args.replies} set_reply, {args.tenants} tenants, {args.threads} threads"
+          f" (group: {args.delay_ms} ms / {args.batch} tenants)")
+    for backend in ("json", "sqlite"):
+        for mode in ("sync", "group"):
+            rate, writes = run(backend, mode, args.replies, args.tenants, args.threads, args.delay_ms, args.batch)
+            print(f"{backend:6} {mode:5}: {rate:10.0f} mutations/s, {writes:6d} écriture(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Mémoire et coût d'accès: état en dict (dates ISO) contre `TenantState`.
+
+Usage:
+    python -m benchmarks.bench_state_model --tenants 100000
+
+Construit N états de tenant réalistes (en attente, compteurs non nuls) dans
+les deux modèles, mesure la mémoire allouée (tracemalloc) puis le coût d'une
+vérification de deadline (parsing ISO contre lecture d'un entier).
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import time
+import argparse
+import datetime
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import TZ  # noqa: E402
+from state_model import TenantState  # noqa: E402
+
+
+def make_dict_state(i: int, now: datetime.datetime) -> dict:
+    """État au format historique (celui de l'ancien StateManager)"""
+    return {
+        "waiting": True,
+        "deadline": (now + datetime.timedelta(minutes=120, seconds=i)).isoformat(),
+        "last_reply": (now - datetime.timedelta(days=1, seconds=i)).isoformat(),
+        "last_ping": (now - datetime.timedelta(seconds=i)).isoformat(),
+        "alert_sent": False,
+        "stats": {
+            "total_pings": 300 + i % 50,
+            "total_alerts": i % 7,
+            "total_replies": 290 + i % 40,
+            "first_ping_date": (now - datetime.timedelta(days=365, seconds=i)).isoformat(),
+        },
+    }
+
+
+def measure(build) -> tuple[object, int]:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    obj = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, after - before
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tenants", type=int, default=100_000)
+    args = parser.parse_args()
+    n = args.tenants
+    now = datetime.datetime.now(tz=TZ)
+
+    raw = [make_dict_state(i, now) for i in range(n)]
+    dict_states, dict_bytes = measure(lambda: {f"t{i}": make_dict_state(i, now) for i in range(n)})
+    slot_states, slot_bytes = measure(lambda: {f"t{i}": TenantState.from_dict(raw[i]) for i in range(n)})
+    del raw
+
+    print(f"{n} tenants")
+    print(f"dict (ISO)   : {dict_bytes / 1e6:8.1f} Mo ({dict_bytes / n:6.0f} o/tenant)")
+    print(f"TenantState  : {slot_bytes / 1e6:8.1f} Mo ({slot_bytes / n:6.0f} o/tenant)"
+          f" -> x{dict_bytes / max(slot_bytes, 1):.1f}")
+
+    # Vérification de deadline sur tous les tenants
+    start = time.perf_counter()
+    due = sum(1 for st in dict_states.values()
+              if st["waiting"] and datetime.datetime.now(tz=TZ) >= datetime.datetime.fromisoformat(st["deadline"]))
+    dict_ns = (time.perf_counter() - start) / n * 1e9
+
+    start = time.perf_counter()
+    now_ts = time.time()
+    due_slots = sum(1 for st in slot_states.values() if st.waiting and now_ts >= st.deadline)
+    slot_ns = (time.perf_counter() - start) / n * 1e9
+    assert due == due_slots
+
+    print(f"check dict   : {dict_ns:8.0f} ns/tenant")
+    print(f"check slots  : {slot_ns:8.0f} ns/tenant -> x{dict_ns / max(slot_ns, 1e-9):.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Coût d'une observation de métrique (compteur, histogramme) par thread.
+
+Usage:
+    python -m benchmarks.bench_telemetry --observations 1000000 --threads 1,4,8
+
+Chaque thread écrit dans sa propre copie des valeurs (sans verrou): le coût
+par observation doit rester sous la microseconde, quel que soit le nombre de
+threads (durée totale / nombre total d'observations). Mesure aussi le coût d'un export `/metrics` (instantané + rendu).
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("METRICS_DIR", tempfile.mkdtemp(prefix="bench-metrics-"))
+
+from telemetry import Counter, Histogram, render_metrics  # noqa: E402
+
+
+def run(threads: int, observations: int, metric, observe) -> float:
+    """Coût moyen d'une observation (ns): durée totale / observations de tous les threads"""
+    barrier = threading.Barrier(threads + 1)
+
+    def worker():
+        barrier.wait()
+        for i in range(observations):
+            observe(metric, i)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in pool:
+        t.join()
+    return (time.perf_counter() - start) / (threads * observations) * 1e9
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--observations", type=int, default=1_000_000, help="observations par thread")
+    parser.add_argument("--threads", default="1,4,8")
+    args = parser.parse_args()
+
+    counter = Counter("bench_counter", "bench", ("status",))
+    histogram = Histogram("bench_histogram", "bench", ("status", "template"))
+    cases = [
+        ("compteur", counter, lambda m, i: m.inc("200")),
+        ("histogramme", histogram, lambda m, i: m.observe(0.042, "200", "mc_daily_ping")),
+    ]
+    empty = run(1, args.observations, None, lambda m, i: None)
+    print(f"boucle à vide: {empty:.0f} ns (déduite ci-dessous)")
+    print("métrique      threads  ns/observation")
+    for label, metric, observe in cases:
+        for threads in (int(t) for t in args.threads.split(",")):
+            cost = run(threads, args.observations, metric, observe) - empty
+            print(f"{label:12s}  {threads:7d}  {cost:14.0f}")
+
+    start = time.perf_counter()
+    text = render_metrics()
+    elapsed = time.perf_counter() - start
+    print(f"export /metrics: {elapsed * 1000:.1f} ms ({len(text.splitlines())} lignes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Débit d'envoi (messages/s) des transports requests et httpx contre un mock local.
+
+Usage:
+    python -m benchmarks.bench_transport --messages 2000 --latency-ms 20
+
+Le mock parle HTTP/1.1 en clair: httpx y utilise donc HTTP/1.1 (le multiplexage
+HTTP/2 ne s'applique qu'en TLS vers graph.facebook.com). Le benchmark compare
+surtout le coût du modèle threads + requests face à asyncio + httpx.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.mock_graph import MockGraphServer  # noqa: E402
+
+
+def _configure_env(base_url: str) -> None:
+    """Variables lues par config.py: à définir avant tout import du bot."""
+    os.environ.update({
+        "WA_API_BASE_URL": base_url,
+        "WHATSAPP_TOKEN": "bench",
+        "WHATSAPP_PHONE_ID": "123",
+        "WA_RATE_PER_SEC": "1000000",  # pas de limite de débit pour la mesure
+        "LOG_LEVEL": "WARNING",
+    })
+
+
+def bench_requests(n: int) -> float:
+    import whatsapp_api
+    start = time.perf_counter()
+    futures = [whatsapp_api.wa_submit(whatsapp_api.template_payload("+33600000000", "mc_ok", "fr")) for _ in range(n)]
+    ok = sum(1 for f in futures if f.result() is not None)
+    elapsed = time.perf_counter() - start
+    assert ok == n, f"{n - ok} échec(s)"
+    return n / elapsed
+
+
+def bench_httpx(n: int, concurrency: int) -> float:
+    import whatsapp_async
+    client = whatsapp_async.AsyncWhatsAppClient(rate=1_000_000)
+    # Borne les requêtes en vol à la taille du pool: sinon les coroutines en
+    # attente d'une connexion consomment leur timeout httpx (pool timeout)
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with slots:
+            return await client.call({"messaging_product": "whatsapp", "to": "+33600000000"})
+
+    async def run():
+        tasks = [one() for _ in range(n)]
+        results = await asyncio.gather(*tasks)
+        await client.aclose()
+        return sum(1 for r in results if r is not None)
+
+    start = time.perf_counter()
+    ok = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+    assert ok == n, f"{n - ok} échec(s)"
+    return n / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    mock = MockGraphServer(latency_ms=args.latency_ms).start()
+    _configure_env(mock.base_url)
+    import logging_config
+    logging_config.configure_logging("WARNING")
+
+    from config import WA_SENDER_THREADS, WA_HTTP_MAX_CONNECTIONS
+    print(f"Mock: {mock.base_url} (latence {args.latency_ms} ms), {args.messages} messages")
+    print(f"requests (threads={WA_SENDER_THREADS}): {bench_requests(args.messages):8.1f} msg/s")
+    try:
+        print(f"httpx    (connexions={WA_HTTP_MAX_CONNECTIONS}): {bench_httpx(args.messages, WA_HTTP_MAX_CONNECTIONS):8.1f} msg/s")
+    except RuntimeError as e:
+        print(f"httpx    : ignoré ({e})")
+    mock.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""Serveur local imitant l'endpoint `POST /{phone_id}/messages` de la Graph API.
+
+Usage:
+    python -m benchmarks.mock_graph --port 8765 --latency-ms 20
+    python -m benchmarks.mock_graph --latency-ms 20 --jitter-ms 30 --rate-429 0.05 --rate-5xx 0.02
+
+Puis `WA_API_BASE_URL=http://127.0.0.1:8765` pour y envoyer les messages du bot.
+
+Pannes injectées (proportion des requêtes, tirage aléatoire reproductible):
+- `429`: `Retry-After` de `--retry-after` secondes, erreur Graph 130429
+- `5xx`: 503, erreur Graph temporaire
+- `timeout`: aucune réponse pendant `--timeout-sec` secondes, puis connexion
+  fermée (au-delà de WA_HTTP_TIMEOUT_SEC, le client abandonne avant)
+"""
+
+from __future__ import annotations
+
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import itertools
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockGraphServer:
+    """Serveur HTTP/1.1 multi-thread, démarré dans un thread daemon."""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        rate_429: float = 0.0,
+        rate_5xx: float = 0.0,
+        rate_timeout: float = 0.0,
+        retry_after: int = 1,
+        timeout_sec: float = 20.0,
+        seed: int | None = 0,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.rate_timeout = rate_timeout
+        self.retry_after = retry_after
+        self.timeout_sec = timeout_sec
+        self.requests = 0
+        self.outcomes: Counter = Counter()
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+
+            def setup(self):
+                super().setup()
+                # En-têtes et body partent en deux écritures: éviter l'attente Nagle/ACK retardé
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status: int, body: dict, headers: dict | None = None):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                self.rfile.read(length)
+                outcome, delay, message_id = server._draw()
+                if outcome == "timeout":
+                    time.sleep(server.timeout_sec)
+                    self.close_connection = True
+                    return
+                if delay:
+                    time.sleep(delay)
+                if outcome == "429":
+                    self._reply(429, _graph_error(130429, "Rate limit hit"), {"Retry-After": str(server.retry_after)})
+                elif outcome == "5xx":
+                    self._reply(503, _graph_error(2, "Service temporarily unavailable"))
+                else:
+                    self._reply(200, {"messaging_product": "whatsapp", "messages": [{"id": message_id}]})
+
+        class Server(ThreadingHTTPServer):
+            request_queue_size = 512  # défaut 5: les connexions simultanées seraient refusées
+
+            def handle_error(self, request, client_address):
+                # Client parti avant la réponse (process de mesure terminé): sans intérêt
+                if not isinstance(sys.exc_info()[1], ConnectionError):
+                    super().handle_error(request, client_address)
+
+        self.httpd = Server((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://{host}:{self.httpd.server_address[1]}"
+
+    def _draw(self) -> tuple[str, float, str]:
+        """Issue de la requête (ok, 429, 5xx, timeout), latence et wamid"""
+        with self._lock:
+            self.requests += 1
+            draw = self._random.random()
+            jitter = self._random.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0
+            if draw < self.rate_timeout:
+                outcome = "timeout"
+            elif draw < self.rate_timeout + self.rate_429:
+                outcome = "429"
+            elif draw < self.rate_timeout + self.rate_429 + self.rate_5xx:
+                outcome = "5xx"
+            else:
+                outcome = "ok"
+            self.outcomes[outcome] += 1
+            message_id = f"wamid.mock{next(self._ids)}"
+        return outcome, (self.latency_ms + jitter) / 1000, message_id
+
+    def configure(self, **faults) -> None:
+        """Change latence ou pannes en cours de route (ex: `rate_429=0.1`)"""
+        with self._lock:
+            for name, value in faults.items():
+                if not hasattr(self, name) or name.startswith("_"):
+                    raise AttributeError(f"Paramètre inconnu: {name}")
+                setattr(self, name, value)
+
+    def start(self) -> "MockGraphServer":
+        threading.Thread(target=self.httpd.serve_forever, name="mock-graph", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def _graph_error(code: int, message: str) -> dict:
+    return {"error": {"message": message, "type": "OAuthException", "code": code, "fbtrace_id": "mock"}}
+
+
+def add_fault_arguments(parser: argparse.ArgumentParser) -> None:
+    """Options de latence et de pannes du mock (partagées avec benchmarks.suite)"""
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="latence additionnelle aléatoire (0 à N ms)")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="proportion de réponses 429")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="proportion de réponses 503")
+    parser.add_argument("--rate-timeout", type=float, default=0.0, help="proportion de requêtes sans réponse")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After des 429 (secondes)")
+    parser.add_argument("--timeout-sec", type=float, default=20.0, help="attente avant fermeture (timeouts)")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def fault_options(args: argparse.Namespace) -> dict:
+    return {
+        "latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms,
+        "rate_429": args.rate_429, "rate_5xx": args.rate_5xx, "rate_timeout": args.rate_timeout,
+        "retry_after": args.retry_after, "timeout_sec": args.timeout_sec, "seed": args.seed,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+    mock = MockGraphServer(port=args.port, **fault_options(args))
+    print(f"Mock Graph API sur {mock.base_url}")
+    mock.httpd.serve_forever()
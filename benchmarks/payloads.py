@@ -0,0 +1,89 @@
+"""Générateur de payloads de webhook Meta (messages entrants et statuts de livraison).
+
+Usage:
+    python -m benchmarks.payloads --replies 3 --statuses 2 > webhook.json
+    curl -X POST -H "Content-Type: application/json" -d @webhook.json http://localhost:5000/whatsapp/webhook
+
+Même structure que les notifications de l'API WhatsApp Cloud
+(`object` / `entry[].changes[].value`), avec des identifiants uniques: chaque
+payload passe la déduplication des webhooks.
+"""
+
+from __future__ import annotations
+
+import json
+import time
+import argparse
+import itertools
+
+_ids = itertools.count(1)
+
+PHONE_NUMBER_ID = "123456789"
+
+
+def _message_id() -> str:
+    return f"wamid.bench{time.time_ns()}{next(_ids)}"
+
+
+def text_message(from_number: str, text: str = "ok", message_id: str | None = None) -> dict:
+    """Message texte entrant (`value["messages"][]`), `from_number` sans le +"""
+    return {
+        "from": from_number.lstrip("+"),
+        "id": message_id or _message_id(),
+        "timestamp": str(int(time.time())),
+        "type": "text",
+        "text": {"body": text},
+    }
+
+
+def delivery_status(message_id: str, status: str = "delivered", recipient: str = "33600000000",
+                    error_code: int | None = None) -> dict:
+    """Statut d'un message sortant (`value["statuses"][]`): sent, delivered, read ou failed"""
+    raw = {
+        "id": message_id,
+        "status": status,
+        "timestamp": str(int(time.time())),
+        "recipient_id": recipient.lstrip("+"),
+    }
+    if error_code is not None:
+        raw["errors"] = [{"code": error_code, "title": "Message undeliverable"}]
+    return raw
+
+
+def webhook(messages: list[dict] | None = None, statuses: list[dict] | None = None) -> dict:
+    """Notification complète (une entrée, un changement)"""
+    value = {
+        "messaging_product": "whatsapp",
+        "metadata": {"display_phone_number": "15550000000", "phone_number_id": PHONE_NUMBER_ID},
+    }
+    if messages:
+        value["contacts"] = [{"profile": {"name": "Bench"}, "wa_id": m["from"]} for m in messages]
+        value["messages"] = messages
+    if statuses:
+        value["statuses"] = statuses
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{"id": "0", "changes": [{"field": "messages", "value": value}]}],
+    }
+
+
+def reply_webhook(from_number: str, text: str = "ok") -> dict:
+    """Réponse d'une personne suivie (un message par notification, comme Meta en temps réel)"""
+    return webhook(messages=[text_message(from_number, text)])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replies", type=int, default=1)
+    parser.add_argument("--statuses", type=int, default=0)
+    parser.add_argument("--from-number", default="33600000000")
+    args = parser.parse_args()
+    payload = webhook(
+        messages=[text_message(args.from_number) for _ in range(args.replies)],
+        statuses=[delivery_status(_message_id()) for _ in range(args.statuses)],
+    )
+    print(json.dumps(payload, indent=2))
+
+
+if __name__ == "__main__":
+    main()
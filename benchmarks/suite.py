@@ -0,0 +1,396 @@
+"""Scénarios de charge de bout en bout contre un mock local de l'API Graph.
+
+Usage:
+    python -m benchmarks.suite                                  # tous les scénarios
+    python -m benchmarks.suite --scenario reply_burst --scale 2
+    python -m benchmarks.suite --latency-ms 20 --rate-429 0.05 --rate-5xx 0.02
+    python -m benchmarks.suite --save-baseline                  # écrit benchmarks/baselines.json
+    python -m benchmarks.suite --check                          # code retour 1 si régression
+
+Scénarios (chacun dans un process neuf, avec son propre dossier data/):
+- ping_storm: pings quotidiens de tous les tenants mis en file d'un coup,
+  vidés par l'outbox vers le mock (latence: mise en file -> acceptation)
+- reply_burst: réponses postées en parallèle sur /whatsapp/webhook (payloads
+  Meta de benchmarks.payloads) pendant l'attente (latence: POST -> état
+  "répondu", file webhook comprise)
+- alert_fanout: deadlines toutes dépassées, `--fanout` contacts par tenant;
+  balayage `check_deadline` puis envoi des alertes (latence: mise en file ->
+  acceptation)
+- health_flood: lectures de /health en parallèle (latence par requête)
+
+Rapport: débit (opérations/s), latence p50/p99, mémoire (tracemalloc, dans un
+second passage pour ne pas fausser les temps: pic et mémoire retenue par
+opération). `--check` compare aux baselines: baisse de débit, hausse de p99
+ou de mémoire au-delà de `--tolerance`. Les baselines dépendent de la machine:
+les régénérer (`--save-baseline`) avant de comparer sur un autre poste.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import datetime
+import tempfile
+import threading
+import subprocess
+import tracemalloc
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.mock_graph import MockGraphServer, add_fault_arguments, fault_options  # noqa: E402
+from benchmarks.payloads import reply_webhook  # noqa: E402
+
+BASELINES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+# Taille de chaque scénario pour --scale 1
+DEFAULT_SIZES = {"ping_storm": 1000, "reply_burst": 500, "alert_fanout": 200, "health_flood": 5000}
+
+# Configuration du bot dans les process de mesure (dossier data/ temporaire)
+BENCH_ENV = {
+    "WHATSAPP_TOKEN": "bench",
+    "WHATSAPP_PHONE_ID": "123",
+    "WEBHOOK_VERIFY_TOKEN": "bench",
+    "OWNER_PHONE": "",
+    "ALERT_PHONES": "",
+    "SCHEDULER_ENABLED": "false",
+    "LOG_LEVEL": "WARNING",
+    "METRICS_DIR": "",
+    # Retries rapides: les pannes injectées se résorbent pendant la mesure
+    "OUTBOX_BACKOFF_BASE_SEC": "0.05",
+    "OUTBOX_BACKOFF_MAX_SEC": "1",
+    "WA_HTTP_TIMEOUT_SEC": "2",
+}
+
+WAIT_TIMEOUT_SEC = 300.0
+
+
+# ================== PROCESS DE MESURE ==================
+
+def _wait(condition, what: str) -> None:
+    deadline = time.monotonic() + WAIT_TIMEOUT_SEC
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{what}: délai dépassé")
+        time.sleep(0.002)
+
+
+def _seed(size: int, fanout: int, waiting_until: int | None) -> list[str]:
+    """Écrit data/tenants.json (et l'état initial) avant tout import du bot"""
+    os.makedirs("data", exist_ok=True)
+    tenants = [
+        {
+            "id": f"t{i}",
+            "phone": f"+336{i:08d}",
+            "alert_phones": [f"+337{i:06d}{k:02d}" for k in range(fanout)],
+        }
+        for i in range(size)
+    ]
+    with open("data/tenants.json", "w", encoding="utf-8") as f:
+        json.dump({"tenants": tenants}, f)
+    ids = [t["id"] for t in tenants]
+    if waiting_until is not None:
+        from state_model import DEFAULT_TENANT_STATE
+        from state_storage import create_state_storage
+        now = int(time.time())
+        states = {tid: DEFAULT_TENANT_STATE.with_ping(waiting_until, now).to_dict() for tid in ids}
+        storage = create_state_storage()
+        storage.save(states, ids)
+        storage.close()
+    return ids
+
+
+class _Measure:
+    """Durée de la section et, si `alloc`, mémoire allouée (tracemalloc)"""
+
+    def __init__(self, alloc: bool):
+        self.alloc = alloc
+        self.elapsed = 0.0
+        self.peak_kib = self.retained_kib = None
+
+    def __enter__(self):
+        if self.alloc:
+            tracemalloc.start()
+            self._base = tracemalloc.get_traced_memory()[0]
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self._start
+        if self.alloc:
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.peak_kib = (peak - self._base) / 1024
+            self.retained_kib = (current - self._base) / 1024
+        return False
+
+
+def _outbox_latencies(outbox, since: float) -> list[float]:
+    return [sent_at - created_at for _, created_at, sent_at, *_ in outbox.delivery_rows(since)]
+
+
+def _parallel(items: list, threads: int, work) -> None:
+    """Répartit `items` entre `threads` threads (chacun appelle `work(chunk)`)"""
+    pool = [threading.Thread(target=work, args=(items[i::threads],)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+
+
+def scenario_ping_storm(size: int, fanout: int, threads: int, alloc: bool) -> dict:
+    ids = _seed(size, fanout, None)
+    from outbox import get_outbox
+    from scheduler_tasks import daily_ping
+    outbox = get_outbox()
+    since = time.time() - 1
+    with _Measure(alloc) as m:
+        daily_ping(ids)
+        outbox.start()
+        _wait(lambda: outbox.sent + outbox.failed >= size, "pings")
+    return {"ops": size, "measure": m, "latencies": _outbox_latencies(outbox, since), "failed": outbox.failed}
+
+
+def scenario_reply_burst(size: int, fanout: int, threads: int, alloc: bool) -> dict:
+    ids = _seed(size, fanout, int(time.time()) + 3600)
+    from app import app
+    from services import get_state_manager, get_tenant_registry
+    registry = get_tenant_registry()
+    bodies = [(tid, json.dumps(reply_webhook(registry.get(tid).wa_id))) for tid in ids]
+    posted: dict[str, float] = {}
+    replied: dict[str, float] = {}
+    rejected = []
+
+    def on_state(tenant_id, state):
+        if not state.waiting and tenant_id not in replied:
+            replied[tenant_id] = time.perf_counter()
+
+    get_state_manager().add_listener(on_state, replay=False)
+
+    def post(chunk):
+        client = app.test_client()
+        for tid, body in chunk:
+            posted[tid] = time.perf_counter()
+            r = client.post("/whatsapp/webhook", data=body, content_type="application/json")
+            if r.status_code != 200:
+                rejected.append(tid)
+
+    with _Measure(alloc) as m:
+        _parallel(bodies, threads, post)
+        _wait(lambda: len(replied) + len(rejected) >= size, "réponses")
+    latencies = [replied[tid] - posted[tid] for tid in replied if tid in posted]
+    return {"ops": size, "measure": m, "latencies": latencies, "failed": len(rejected)}
+
+
+def scenario_alert_fanout(size: int, fanout: int, threads: int, alloc: bool) -> dict:
+    _seed(size, fanout, int(time.time()) - 60)
+    from outbox import get_outbox
+    from scheduler_tasks import check_deadline
+    outbox = get_outbox()
+    since = time.time() - 1
+    alerts = size * fanout
+    with _Measure(alloc) as m:
+        check_deadline()
+        outbox.start()
+        _wait(lambda: outbox.sent + outbox.failed >= alerts, "alertes")
+    return {"ops": alerts, "measure": m, "latencies": _outbox_latencies(outbox, since), "failed": outbox.failed}
+
+
+def scenario_health_flood(size: int, fanout: int, threads: int, alloc: bool) -> dict:
+    ids = _seed(min(size, 100), fanout, None)
+    from app import app
+    requests_ = [ids[i % len(ids)] for i in range(size)]
+    latencies: list[float] = []
+    failed = []
+
+    def read(chunk):
+        client = app.test_client()
+        local = []
+        for tid in chunk:
+            start = time.perf_counter()
+            r = client.get(f"/health?tenant={tid}")
+            local.append(time.perf_counter() - start)
+            if r.status_code != 200:
+                failed.append(tid)
+        latencies.extend(local)
+
+    with _Measure(alloc) as m:
+        _parallel(requests_, threads, read)
+    return {"ops": size, "measure": m, "latencies": latencies, "failed": len(failed)}
+
+
+SCENARIOS = {
+    "ping_storm": scenario_ping_storm,
+    "reply_burst": scenario_reply_burst,
+    "alert_fanout": scenario_alert_fanout,
+    "health_flood": scenario_health_flood,
+}
+
+
+def _percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run_worker(scenario: str, size: int, fanout: int, threads: int, alloc: bool) -> dict:
+    """Exécute un scénario dans ce process (cwd: dossier temporaire) et résume"""
+    result = SCENARIOS[scenario](size, fanout, threads, alloc)
+    m, latencies = result["measure"], result["latencies"]
+    p50, p99 = _percentile(latencies, 0.50), _percentile(latencies, 0.99)
+    summary = {
+        "ops": result["ops"],
+        "failed": result["failed"],
+        "elapsed_s": round(m.elapsed, 4),
+        "throughput": round(result["ops"] / m.elapsed, 1),
+        "p50_ms": round(p50 * 1000, 3) if p50 is not None else None,
+        "p99_ms": round(p99 * 1000, 3) if p99 is not None else None,
+    }
+    if alloc:
+        summary["peak_kib_per_op"] = round(m.peak_kib / result["ops"], 3)
+        summary["retained_kib_per_op"] = round(m.retained_kib / result["ops"], 3)
+    return summary
+
+
+# ================== ORCHESTRATION ==================
+
+def _spawn(scenario: str, size: int, args, base_url: str, alloc: bool) -> dict:
+    """Lance un scénario dans un process neuf (singletons et data/ vierges)"""
+    with tempfile.TemporaryDirectory(prefix=f"bench-{scenario}-") as tmp:
+        env = {**os.environ, **BENCH_ENV, "WA_API_BASE_URL": base_url,
+               "WA_RATE_PER_SEC": str(args.rate), "STATE_BACKEND": args.state_backend}
+        cmd = [sys.executable, os.path.abspath(__file__), "--worker", scenario, "--size", str(size),
+               "--fanout", str(args.fanout), "--threads", str(args.threads)]
+        if alloc:
+            cmd.append("--alloc")
+        proc = subprocess.run(cmd, cwd=tmp, env=env, capture_output=True, text=True,
+                              timeout=WAIT_TIMEOUT_SEC + 60)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{scenario}: échec du process de mesure\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _compare(name: str, result: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Régressions de `result` par rapport à `baseline` (liste vide si aucune)"""
+    if baseline.get("ops") != result["ops"]:
+        return []  # tailles différentes: pas comparable
+    problems = []
+    if result["throughput"] < baseline["throughput"] * (1 - tolerance):
+        problems.append(f"débit {result['throughput']:.0f}/s < {baseline['throughput']:.0f}/s")
+    # Marge absolue: les p99 de quelques ms sont bruités
+    for key in ("p99_ms",):
+        if baseline.get(key) is not None and result.get(key) is not None:
+            if result[key] > baseline[key] * (1 + tolerance) + 1.0:
+                problems.append(f"{key} {result[key]:.1f} > {baseline[key]:.1f}")
+    for key in ("peak_kib_per_op", "retained_kib_per_op"):
+        if baseline.get(key) is not None and result.get(key) is not None:
+            if result[key] > baseline[key] * (1 + tolerance) + 0.5:
+                problems.append(f"{key} {result[key]:.2f} > {baseline[key]:.2f}")
+    return [f"{name}: {p}" for p in problems]
+
+
+def _fmt(value, spec: str) -> str:
+    return format(value, spec) if value is not None else "-".rjust(int(spec.split(".")[0]))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), action="append",
+                        help="scénario à lancer (répétable, défaut: tous)")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplie la taille des scénarios")
+    parser.add_argument("--fanout", type=int, default=3, help="contacts d'alerte par tenant")
+    parser.add_argument("--threads", type=int, default=8, help="clients simultanés (webhooks, /health)")
+    parser.add_argument("--rate", type=float, default=1_000_000, help="WA_RATE_PER_SEC des process de mesure")
+    parser.add_argument("--state-backend", default="sqlite", choices=("json", "sqlite", "journal"),
+                        help="STATE_BACKEND (json: fichier réécrit à chaque transition, lent au-delà de quelques centaines de tenants)")
+    parser.add_argument("--no-alloc", action="store_true", help="sans passage tracemalloc")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true", help="compare aux baselines (code retour 1 si régression)")
+    parser.add_argument("--tolerance", type=float, default=0.3)
+    add_fault_arguments(parser)
+    parser.set_defaults(latency_ms=20.0)
+    # Process de mesure (lancé par _spawn)
+    parser.add_argument("--worker", choices=sorted(SCENARIOS), help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--alloc", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        import logging_config
+        logging_config.configure_logging("WARNING")
+        print(json.dumps(run_worker(args.worker, args.size, args.fanout, args.threads, args.alloc)))
+        os._exit(0)  # sans attendre les threads daemon (outbox, file webhook)
+
+    mock = MockGraphServer(**fault_options(args)).start()
+    scenarios = args.scenario or list(SCENARIOS)
+    print(f"Mock {mock.base_url}: latence {args.latency_ms} ms (+0..{args.jitter_ms}), "
+          f"429 {args.rate_429:.0%}, 5xx {args.rate_5xx:.0%}, timeouts {args.rate_timeout:.0%}")
+    print("scénario        ops   échecs   ops/s     p50 ms    p99 ms   pic Kio/op  retenu Kio/op  mock (429/5xx/timeout)")
+
+    results = {}
+    for name in scenarios:
+        size = max(1, int(DEFAULT_SIZES[name] * args.scale))
+        before = Counter(mock.outcomes)
+        result = _spawn(name, size, args, mock.base_url, alloc=False)
+        faults = Counter(mock.outcomes) - before
+        result["mock"] = {k: faults.get(k, 0) for k in ("429", "5xx", "timeout")}
+        if not args.no_alloc:
+            memory = _spawn(name, size, args, mock.base_url, alloc=True)
+            result["peak_kib_per_op"] = memory["peak_kib_per_op"]
+            result["retained_kib_per_op"] = memory["retained_kib_per_op"]
+        results[name] = result
+        print(f"{name:13s} {result['ops']:5d} {result['failed']:8d} {result['throughput']:8.0f}  "
+              f"{_fmt(result['p50_ms'], '8.2f')}  {_fmt(result['p99_ms'], '8.2f')}   "
+              f"{_fmt(result.get('peak_kib_per_op'), '10.2f')}  {_fmt(result.get('retained_kib_per_op'), '13.2f')}  "
+              f"{result['mock']['429']}/{result['mock']['5xx']}/{result['mock']['timeout']}")
+    mock.stop()
+
+    baselines = {}
+    if os.path.exists(BASELINES_FILE):
+        with open(BASELINES_FILE, encoding="utf-8") as f:
+            baselines = json.load(f)
+
+    exit_code = 0
+    if args.check:
+        meta = baselines.get("_meta", {})
+        if (meta.get("faults"), meta.get("state_backend"), meta.get("threads"), meta.get("fanout")) != (
+            fault_options(args), args.state_backend, args.threads, args.fanout
+        ):
+            print("⚠️ Mock, backend ou concurrence différents des baselines: comparaison indicative")
+        regressions = [
+            problem
+            for name, result in results.items() if name in baselines
+            for problem in _compare(name, result, baselines[name], args.tolerance)
+        ]
+        for problem in regressions:
+            print(f"❌ Régression {problem}")
+        if not regressions:
+            print(f"✅ Aucune régression (tolérance {args.tolerance:.0%})")
+        exit_code = 1 if regressions else 0
+
+    if args.save_baseline:
+        baselines.update(results)
+        baselines["_meta"] = {
+            "python": platform.python_version(),
+            "machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} CPU",
+            "date": datetime.date.today().isoformat(),
+            "faults": fault_options(args),
+            "state_backend": args.state_backend,
+            "threads": args.threads,
+            "fanout": args.fanout,
+        }
+        with open(BASELINES_FILE, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"📝 Baselines écrites dans {BASELINES_FILE}")
+
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 """Configuration et validation du bot WhatsApp Wellbeing"""
 import os
+import hashlib
 import logging
 import datetime
 from zoneinfo import ZoneInfo
@@ -37,6 +38,72 @@ except Exception as e:
     logger.warning(f"⚠️ TZ invalide ({os.getenv('TZ', 'Europe/Paris')}), utilisation de la valeur par défaut: Europe/Paris")
     TZ = ZoneInfo("Europe/Paris")
 
+# Traitement asynchrone des webhooks: taille de la file et nombre de consommateurs
+try:
+    WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+except (ValueError, TypeError):
+    logger.warning("⚠️ WEBHOOK_QUEUE_SIZE invalide, utilisation de la valeur par défaut: 1000")
+    WEBHOOK_QUEUE_SIZE = 1000
+
+try:
+    WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "2"))
+except (ValueError, TypeError):
+    logger.warning("⚠️ WEBHOOK_WORKERS invalide, utilisation de la valeur par défaut: 2")
+    WEBHOOK_WORKERS = 2
+
+# API WhatsApp Cloud (modifiable pour pointer vers un serveur de test)
+WA_API_BASE_URL = os.getenv("WA_API_BASE_URL", "https://graph.facebook.com/v24.0").rstrip("/")
+
+# Transport HTTP: "requests" (threads) ou "httpx" (asyncio + HTTP/2, nécessite httpx[http2])
+WA_TRANSPORT = os.getenv("WA_TRANSPORT", "requests").strip().lower()
+
+# Pool de connexions du transport httpx
+try:
+    WA_HTTP_MAX_CONNECTIONS = int(os.getenv("WA_HTTP_MAX_CONNECTIONS", "20"))
+    WA_HTTP_MAX_KEEPALIVE = int(os.getenv("WA_HTTP_MAX_KEEPALIVE", "10"))
+    WA_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("WA_HTTP_KEEPALIVE_EXPIRY", "30"))
+except (ValueError, TypeError):
+    logger.warning("⚠️ WA_HTTP_* invalide, utilisation des valeurs par défaut: 20/10/30")
+    WA_HTTP_MAX_CONNECTIONS, WA_HTTP_MAX_KEEPALIVE, WA_HTTP_KEEPALIVE_EXPIRY = 20, 10, 30.0
+
+# Délai max d'un appel à l'API Graph (secondes, les deux transports)
+try:
+    WA_HTTP_TIMEOUT_SEC = float(os.getenv("WA_HTTP_TIMEOUT_SEC", "15"))
+except (ValueError, TypeError):
+    logger.warning("⚠️ WA_HTTP_TIMEOUT_SEC invalide, utilisation de la valeur par défaut: 15")
+    WA_HTTP_TIMEOUT_SEC = 15.0
+
+# Envois WhatsApp: débit max (messages/s par numéro d'envoi, 80 par défaut chez Meta)
+# et nombre de requêtes HTTP simultanées
+try:
+    WA_RATE_PER_SEC = float(os.getenv("WA_RATE_PER_SEC", "80"))
+except (ValueError, TypeError):
+    logger.warning("⚠️ WA_RATE_PER_SEC invalide, utilisation de la valeur par défaut: 80")
+    WA_RATE_PER_SEC = 80.0
+
+try:
+    WA_SENDER_THREADS = int(os.getenv("WA_SENDER_THREADS", "8"))
+except (ValueError, TypeError):
+    logger.warning("⚠️ WA_SENDER_THREADS invalide, utilisation de la valeur par défaut: 8")
+    WA_SENDER_THREADS = 8
+
+# Déduplication des webhooks (id de message WhatsApp): taille du cache local, durée
+# de rétention (Meta peut renvoyer un payload pendant plusieurs jours) et base
+# SQLite partagée entre workers (vide = cache du process seulement)
+try:
+    DEDUP_MAX_SIZE = int(os.getenv("DEDUP_MAX_SIZE", "10000"))
+except (ValueError, TypeError):
+    logger.warning("⚠️ DEDUP_MAX_SIZE invalide, utilisation de la valeur par défaut: 10000")
+    DEDUP_MAX_SIZE = 10000
+
+try:
+    DEDUP_TTL_SEC = int(os.getenv("DEDUP_TTL_SEC", str(7 * 24 * 3600)))
+except (ValueError, TypeError):
+    logger.warning("⚠️ DEDUP_TTL_SEC invalide, utilisation de la valeur par défaut: 604800 (7 jours)")
+    DEDUP_TTL_SEC = 7 * 24 * 3600
+
+DEDUP_DB_FILE = os.getenv("DEDUP_DB_FILE", "data/webhook_dedup.db").strip()
+
 # CORS: Liste des origines autorisées (séparées par des virgules)
 CORS_ORIGINS = [origin.strip() for origin in os.getenv("CORS_ORIGINS", "http://localhost,http://127.0.0.1").split(",") if origin.strip()]
 
@@ -52,6 +119,198 @@ TEMPLATE_OK = "mc_ok"
 # Fichier d'état
 STATE_FILE = "data/state.json"
 
+# Backend de stockage de l'état: "json" (state.json), "sqlite" (WAL, une ligne par tenant)
+# ou "journal" (journal en ajout seul + instantané, historique des transitions).
+# Au passage à sqlite ou journal, un state.json existant est migré automatiquement.
+STATE_BACKEND = os.getenv("STATE_BACKEND", "json").strip().lower()
+STATE_DB_FILE = os.getenv("STATE_DB_FILE", "data/state.db")
+
+# Journal d'état: dossier, taille d'un segment avant compaction (octets) et
+# conservation des segments compactés comme historique (jours, 0 = illimitée)
+STATE_JOURNAL_DIR = os.getenv("STATE_JOURNAL_DIR", "data/journal")
+
+try:
+    STATE_JOURNAL_SEGMENT_BYTES = int(os.getenv("STATE_JOURNAL_SEGMENT_BYTES", str(4 * 1024 * 1024)))
+except (ValueError, TypeError):
+    logger.warning("⚠️ STATE_JOURNAL_SEGMENT_BYTES invalide, utilisation de la valeur par défaut: 4194304")
+    STATE_JOURNAL_SEGMENT_BYTES = 4 * 1024 * 1024
+
+try:
+    STATE_JOURNAL_RETENTION_DAYS = float(os.getenv("STATE_JOURNAL_RETENTION_DAYS", "365"))
+except (ValueError, TypeError):
+    logger.warning("⚠️ STATE_JOURNAL_RETENTION_DAYS invalide, utilisation de la valeur par défaut: 365")
+    STATE_JOURNAL_RETENTION_DAYS = 365.0
+
+# Historique quotidien par tenant (ping, latence de réponse, alerte) pour /stats/history,
+# et fenêtre maximale interrogeable (jours)
+HISTORY_DB_FILE = os.getenv("HISTORY_DB_FILE", "data/history.db")
+
+try:
+    HISTORY_MAX_DAYS = int(os.getenv("HISTORY_MAX_DAYS", "3660"))
+except (ValueError, TypeError):
+    logger.warning("⚠️ HISTORY_MAX_DAYS invalide, utilisation de la valeur par défaut: 3660")
+    HISTORY_MAX_DAYS = 3660
+
+# File d'envoi durable (pings et alertes): base SQLite, taille des lots vidés,
+# tentatives max par message, délai de retry exponentiel (base et plafond, secondes)
+# et conservation des messages finalisés (jours)
+OUTBOX_DB_FILE = os.getenv("OUTBOX_DB_FILE", "data/outbox.db")
+
+try:
+    OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+    OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "15"))
+    OUTBOX_BACKOFF_BASE_SEC = float(os.getenv("OUTBOX_BACKOFF_BASE_SEC", "5"))
+    OUTBOX_BACKOFF_MAX_SEC = float(os.getenv("OUTBOX_BACKOFF_MAX_SEC", "900"))
+    OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", "7"))
+except (ValueError, TypeError):
+    logger.warning("⚠️ OUTBOX_* invalide, utilisation des valeurs par défaut: 100/15/5/900/7")
+    OUTBOX_BATCH_SIZE, OUTBOX_MAX_ATTEMPTS = 100, 15
+    OUTBOX_BACKOFF_BASE_SEC, OUTBOX_BACKOFF_MAX_SEC, OUTBOX_RETENTION_DAYS = 5.0, 900.0, 7
+
+# Canal de secours des alertes non délivrées (POST JSON: Slack, Discord, ntfy...), vide = désactivé
+ALERT_FALLBACK_WEBHOOK_URL = os.getenv("ALERT_FALLBACK_WEBHOOK_URL", "").strip()
+
+# Métriques Prometheus (/metrics): chaque process écrit ses compteurs dans un
+# fichier de METRICS_DIR toutes les METRICS_FLUSH_SEC secondes (et à chaque
+# lecture), /metrics agrège les workers Gunicorn. Vide = process courant seulement.
+METRICS_DIR = os.getenv("METRICS_DIR", "data/metrics").strip()
+
+try:
+    METRICS_FLUSH_SEC = float(os.getenv("METRICS_FLUSH_SEC", "15"))
+except (ValueError, TypeError):
+    logger.warning("⚠️ METRICS_FLUSH_SEC invalide, utilisation de la valeur par défaut: 15")
+    METRICS_FLUSH_SEC = 15.0
+
+# Profilage (profiling.py): spans durée/CPU autour des opérations clés et journal
+# des opérations plus lentes que SLOW_OP_THRESHOLD_MS (avec piles échantillonnées).
+# Le profileur par échantillonnage se lance à la demande (/debug/profile/start) et
+# écrit ses piles dans PROFILE_DIR (lisibles depuis n'importe quel worker).
+PROFILE_SPANS = os.getenv("PROFILE_SPANS", "false").lower() == "true"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "data/profiles")
+
+try:
+    SLOW_OP_THRESHOLD_MS = float(os.getenv("SLOW_OP_THRESHOLD_MS", "1000"))
+    PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "10"))
+    PROFILE_MAX_DURATION_SEC = int(os.getenv("PROFILE_MAX_DURATION_SEC", "300"))
+except (ValueError, TypeError):
+    logger.warning("⚠️ SLOW_OP_THRESHOLD_MS/PROFILE_* invalide, utilisation des valeurs par défaut: 1000/10/300")
+    SLOW_OP_THRESHOLD_MS, PROFILE_SAMPLE_INTERVAL_MS, PROFILE_MAX_DURATION_SEC = 1000.0, 10.0, 300
+
+# /stats: durée (secondes) pendant laquelle un client peut réutiliser sa copie sans
+# revalider (0 = revalidation à chaque requête, 304 si rien n'a changé)
+try:
+    STATS_MAX_AGE_SEC = int(os.getenv("STATS_MAX_AGE_SEC", "0"))
+except (ValueError, TypeError):
+    logger.warning("⚠️ STATS_MAX_AGE_SEC invalide, utilisation de la valeur par défaut: 0")
+    STATS_MAX_AGE_SEC = 0
+
+# Statut du scheduler (battement de cœur + dernières exécutions des jobs) publié par
+# le process qui le détient dans un fichier mappé en mémoire, lu par les autres.
+# Par défaut en mémoire partagée (/dev/shm), un fichier par dossier de lock.
+try:
+    SCHEDULER_HEARTBEAT_SEC = float(os.getenv("SCHEDULER_HEARTBEAT_SEC", "5"))
+except (ValueError, TypeError):
+    logger.warning("⚠️ SCHEDULER_HEARTBEAT_SEC invalide, utilisation de la valeur par défaut: 5")
+    SCHEDULER_HEARTBEAT_SEC = 5.0
+
+_lock_tag = hashlib.blake2b(
+    os.path.abspath(os.getenv("SCHEDULER_LOCK_FILE", "data/scheduler.lock")).encode(), digest_size=4
+).hexdigest()
+SCHEDULER_STATUS_FILE = os.getenv(
+    "SCHEDULER_STATUS_FILE",
+    f"/dev/shm/wellbeing-scheduler-{_lock_tag}.status" if os.path.isdir("/dev/shm") else "data/scheduler.status",
+)
+
+# Choix du process qui exécute le scheduler: "flock" (verrou fichier, un seul hôte)
+# ou "lease" (bail renouvelé dans LEADER_LEASE_DB, bascule si le leader se bloque,
+# plusieurs conteneurs/nœuds possibles) ou "shard" (chaque process exécute les jobs
+# de sa part des tenants, hachage cohérent sur les membres inscrits dans LEADER_LEASE_DB)
+SCHEDULER_ELECTION = os.getenv("SCHEDULER_ELECTION", "flock").strip().lower()
+LEADER_LEASE_DB = os.getenv("LEADER_LEASE_DB", "data/leader.db")
+
+try:
+    LEADER_LEASE_TTL_SEC = float(os.getenv("LEADER_LEASE_TTL_SEC", "30"))
+    LEADER_RENEW_SEC = float(os.getenv("LEADER_RENEW_SEC", "10"))
+except (ValueError, TypeError):
+    logger.warning("⚠️ LEADER_LEASE_TTL_SEC/LEADER_RENEW_SEC invalide, utilisation des valeurs par défaut: 30/10")
+    LEADER_LEASE_TTL_SEC, LEADER_RENEW_SEC = 30.0, 10.0
+
+# Mode shard: points virtuels par membre sur l'anneau (répartition plus régulière)
+try:
+    SHARD_VNODES = int(os.getenv("SHARD_VNODES", "128"))
+except (ValueError, TypeError):
+    logger.warning("⚠️ SHARD_VNODES invalide, utilisation de la valeur par défaut: 128")
+    SHARD_VNODES = 128
+
+# Flux SSE /events: abonnés simultanés max par process (chaque flux occupe un thread
+# Gunicorn), intervalle des commentaires keep-alive et durée max d'un flux avant
+# reconnexion automatique du navigateur (secondes)
+try:
+    EVENTS_MAX_SUBSCRIBERS = int(os.getenv("EVENTS_MAX_SUBSCRIBERS", "8"))
+    EVENTS_KEEPALIVE_SEC = float(os.getenv("EVENTS_KEEPALIVE_SEC", "15"))
+    EVENTS_MAX_STREAM_SEC = float(os.getenv("EVENTS_MAX_STREAM_SEC", "300"))
+except (ValueError, TypeError):
+    logger.warning("⚠️ EVENTS_* invalide, utilisation des valeurs par défaut: 8/15/300")
+    EVENTS_MAX_SUBSCRIBERS, EVENTS_KEEPALIVE_SEC, EVENTS_MAX_STREAM_SEC = 8, 15.0, 300.0
+
+# Multi-workers: délai max (secondes) avant qu'une lecture voie l'écriture d'un autre
+# worker. 0 = vérification à chaque lecture (un stat / PRAGMA, très peu coûteux).
+try:
+    STATE_REFRESH_INTERVAL = max(0.0, float(os.getenv("STATE_REFRESH_INTERVAL", "1")))
+except (ValueError, TypeError):
+    logger.warning("⚠️ STATE_REFRESH_INTERVAL invalide, utilisation de la valeur par défaut: 1")
+    STATE_REFRESH_INTERVAL = 1.0
+
+# Pings quotidiens: fenêtre d'étalement (minutes après DAILY_HOUR, 0 = tous à
+# l'heure pile) et taille des lots d'envoi
+try:
+    PING_WINDOW_MIN = int(os.getenv("PING_WINDOW_MIN", "0"))
+except (ValueError, TypeError):
+    logger.warning("⚠️ PING_WINDOW_MIN invalide, utilisation de la valeur par défaut: 0")
+    PING_WINDOW_MIN = 0
+
+try:
+    PING_BATCH_SIZE = int(os.getenv("PING_BATCH_SIZE", "50"))
+except (ValueError, TypeError):
+    logger.warning("⚠️ PING_BATCH_SIZE invalide, utilisation de la valeur par défaut: 50")
+    PING_BATCH_SIZE = 50
+
+# Deadlines: les alertes partent à l'échéance exacte (minuteur). Le balayage
+# complet n'est qu'un filet de sécurité; les réponses reçues par les autres
+# workers sont relues toutes les DEADLINE_RESYNC_SEC secondes.
+try:
+    DEADLINE_SWEEP_MIN = int(os.getenv("DEADLINE_SWEEP_MIN", "5"))
+except (ValueError, TypeError):
+    logger.warning("⚠️ DEADLINE_SWEEP_MIN invalide, utilisation de la valeur par défaut: 5")
+    DEADLINE_SWEEP_MIN = 5
+
+try:
+    DEADLINE_RESYNC_SEC = float(os.getenv("DEADLINE_RESYNC_SEC", "5"))
+except (ValueError, TypeError):
+    logger.warning("⚠️ DEADLINE_RESYNC_SEC invalide, utilisation de la valeur par défaut: 5")
+    DEADLINE_RESYNC_SEC = 5.0
+
+# Écriture de l'état: "sync" (fsync à chaque mutation) ou "group" (lots écrits
+# au plus tous les STATE_COMMIT_DELAY_MS ms ou STATE_COMMIT_BATCH tenants)
+STATE_COMMIT_MODE = os.getenv("STATE_COMMIT_MODE", "sync").strip().lower()
+
+try:
+    STATE_COMMIT_DELAY_MS = int(os.getenv("STATE_COMMIT_DELAY_MS", "50"))
+except (ValueError, TypeError):
+    logger.warning("⚠️ STATE_COMMIT_DELAY_MS invalide, utilisation de la valeur par défaut: 50")
+    STATE_COMMIT_DELAY_MS = 50
+
+try:
+    STATE_COMMIT_BATCH = int(os.getenv("STATE_COMMIT_BATCH", "100"))
+except (ValueError, TypeError):
+    logger.warning("⚠️ STATE_COMMIT_BATCH invalide, utilisation de la valeur par défaut: 100")
+    STATE_COMMIT_BATCH = 100
+
+# Multi-tenant: fichier JSON des personnes surveillées (optionnel).
+# Le tenant historique (OWNER_PHONE/ALERT_PHONES/...) a l'id DEFAULT_TENANT_ID.
+TENANTS_FILE = os.getenv("TENANTS_FILE", "data/tenants.json")
+DEFAULT_TENANT_ID = "default"
+
 # ================== VALIDATION ==================
 
 def validate_config():
@@ -66,9 +325,9 @@ def validate_config():
         errors.append("❌ WHATSAPP_PHONE_ID manquant")
     if not WEBHOOK_VERIFY_TOKEN:
         errors.append("❌ WEBHOOK_VERIFY_TOKEN manquant")
-    if not OWNER_PHONE:
-        errors.append("❌ OWNER_PHONE manquant")
-    if not ALERT_PHONES:
+    if not OWNER_PHONE and not os.path.exists(TENANTS_FILE):
+        errors.append(f"❌ OWNER_PHONE manquant (et aucun fichier tenants: {TENANTS_FILE})")
+    if OWNER_PHONE and not ALERT_PHONES:
         warnings.append("⚠️ ALERT_PHONES vide (aucun contact d'urgence)")
     
     # Validation des valeurs numériques
@@ -89,6 +348,98 @@ def validate_config():
         if phone and not phone.startswith("+"):
             warnings.append(f"⚠️ ALERT_PHONES[{i}] devrait commencer par '+' (format E.164): {phone}")
     
+    if WEBHOOK_QUEUE_SIZE <= 0:
+        errors.append(f"❌ WEBHOOK_QUEUE_SIZE invalide ({WEBHOOK_QUEUE_SIZE}), doit être > 0")
+    if WEBHOOK_WORKERS <= 0:
+        errors.append(f"❌ WEBHOOK_WORKERS invalide ({WEBHOOK_WORKERS}), doit être > 0")
+    
+    if WA_RATE_PER_SEC <= 0:
+        errors.append(f"❌ WA_RATE_PER_SEC invalide ({WA_RATE_PER_SEC}), doit être > 0")
+    if WA_SENDER_THREADS <= 0:
+        errors.append(f"❌ WA_SENDER_THREADS invalide ({WA_SENDER_THREADS}), doit être > 0")
+    if WA_HTTP_TIMEOUT_SEC <= 0:
+        errors.append(f"❌ WA_HTTP_TIMEOUT_SEC invalide ({WA_HTTP_TIMEOUT_SEC}), doit être > 0")
+    
+    if WA_TRANSPORT not in ("requests", "httpx"):
+        errors.append(f"❌ WA_TRANSPORT invalide ({WA_TRANSPORT}), valeurs possibles: requests, httpx")
+    elif WA_TRANSPORT == "httpx":
+        try:
+            import httpx  # noqa: F401
+        except ImportError:
+            errors.append("❌ WA_TRANSPORT=httpx nécessite le paquet httpx[http2]")
+    
+    if PING_WINDOW_MIN < 0 or PING_WINDOW_MIN >= 60:
+        errors.append(f"❌ PING_WINDOW_MIN invalide ({PING_WINDOW_MIN}), doit être entre 0 et 59")
+    if PING_BATCH_SIZE <= 0:
+        errors.append(f"❌ PING_BATCH_SIZE invalide ({PING_BATCH_SIZE}), doit être > 0")
+    
+    if DEADLINE_SWEEP_MIN <= 0:
+        errors.append(f"❌ DEADLINE_SWEEP_MIN invalide ({DEADLINE_SWEEP_MIN}), doit être > 0")
+    if DEADLINE_RESYNC_SEC <= 0:
+        errors.append(f"❌ DEADLINE_RESYNC_SEC invalide ({DEADLINE_RESYNC_SEC}), doit être > 0")
+    
+    if STATE_JOURNAL_SEGMENT_BYTES < 1024:
+        errors.append(f"❌ STATE_JOURNAL_SEGMENT_BYTES invalide ({STATE_JOURNAL_SEGMENT_BYTES}), doit être >= 1024")
+    
+    if HISTORY_MAX_DAYS <= 0:
+        errors.append(f"❌ HISTORY_MAX_DAYS invalide ({HISTORY_MAX_DAYS}), doit être > 0")
+    if OUTBOX_BATCH_SIZE <= 0 or OUTBOX_MAX_ATTEMPTS <= 0 or OUTBOX_RETENTION_DAYS <= 0:
+        errors.append("❌ OUTBOX_BATCH_SIZE, OUTBOX_MAX_ATTEMPTS et OUTBOX_RETENTION_DAYS doivent être > 0")
+    if ALERT_FALLBACK_WEBHOOK_URL and not ALERT_FALLBACK_WEBHOOK_URL.startswith(("http://", "https://")):
+        errors.append(f"❌ ALERT_FALLBACK_WEBHOOK_URL invalide ({ALERT_FALLBACK_WEBHOOK_URL}), URL http(s) attendue")
+    if OUTBOX_BACKOFF_BASE_SEC <= 0 or OUTBOX_BACKOFF_MAX_SEC < OUTBOX_BACKOFF_BASE_SEC:
+        errors.append(
+            f"❌ OUTBOX_BACKOFF_BASE_SEC ({OUTBOX_BACKOFF_BASE_SEC}) doit être > 0 "
+            f"et au plus OUTBOX_BACKOFF_MAX_SEC ({OUTBOX_BACKOFF_MAX_SEC})"
+        )
+    if METRICS_FLUSH_SEC <= 0:
+        errors.append(f"❌ METRICS_FLUSH_SEC invalide ({METRICS_FLUSH_SEC}), doit être > 0")
+    if SLOW_OP_THRESHOLD_MS <= 0:
+        errors.append(f"❌ SLOW_OP_THRESHOLD_MS invalide ({SLOW_OP_THRESHOLD_MS}), doit être > 0")
+    if PROFILE_SAMPLE_INTERVAL_MS < 1:
+        errors.append(f"❌ PROFILE_SAMPLE_INTERVAL_MS invalide ({PROFILE_SAMPLE_INTERVAL_MS}), doit être >= 1")
+    if PROFILE_MAX_DURATION_SEC <= 0:
+        errors.append(f"❌ PROFILE_MAX_DURATION_SEC invalide ({PROFILE_MAX_DURATION_SEC}), doit être > 0")
+    if STATS_MAX_AGE_SEC < 0:
+        errors.append(f"❌ STATS_MAX_AGE_SEC invalide ({STATS_MAX_AGE_SEC}), doit être >= 0")
+    if SCHEDULER_HEARTBEAT_SEC <= 0:
+        errors.append(f"❌ SCHEDULER_HEARTBEAT_SEC invalide ({SCHEDULER_HEARTBEAT_SEC}), doit être > 0")
+    
+    if SCHEDULER_ELECTION not in ("flock", "lease", "shard"):
+        errors.append(f"❌ SCHEDULER_ELECTION invalide ({SCHEDULER_ELECTION}), valeurs possibles: flock, lease, shard")
+    if LEADER_RENEW_SEC <= 0 or LEADER_LEASE_TTL_SEC < 2 * LEADER_RENEW_SEC:
+        errors.append(
+            f"❌ LEADER_RENEW_SEC ({LEADER_RENEW_SEC}) doit être > 0 et au plus la moitié "
+            f"de LEADER_LEASE_TTL_SEC ({LEADER_LEASE_TTL_SEC})"
+        )
+    if SHARD_VNODES <= 0:
+        errors.append(f"❌ SHARD_VNODES invalide ({SHARD_VNODES}), doit être > 0")
+    
+    if EVENTS_MAX_SUBSCRIBERS < 0:
+        errors.append(f"❌ EVENTS_MAX_SUBSCRIBERS invalide ({EVENTS_MAX_SUBSCRIBERS}), doit être >= 0")
+    if EVENTS_KEEPALIVE_SEC <= 0 or EVENTS_MAX_STREAM_SEC <= 0:
+        errors.append("❌ EVENTS_KEEPALIVE_SEC et EVENTS_MAX_STREAM_SEC doivent être > 0")
+    if os.getenv("USE_GUNICORN", "false").lower() == "true":
+        try:
+            gunicorn_threads = int(os.getenv("GUNICORN_THREADS", "12"))
+        except ValueError:
+            gunicorn_threads = 12
+        if EVENTS_MAX_SUBSCRIBERS and gunicorn_threads <= EVENTS_MAX_SUBSCRIBERS:
+            warnings.append(
+                f"⚠️ GUNICORN_THREADS ({gunicorn_threads}) <= EVENTS_MAX_SUBSCRIBERS ({EVENTS_MAX_SUBSCRIBERS}): "
+                "les flux /events peuvent occuper tous les threads (webhooks en attente)"
+            )
+    
+    if STATE_COMMIT_MODE not in ("sync", "group"):
+        errors.append(f"❌ STATE_COMMIT_MODE invalide ({STATE_COMMIT_MODE}), valeurs possibles: sync, group")
+    if STATE_COMMIT_DELAY_MS < 0:
+        errors.append(f"❌ STATE_COMMIT_DELAY_MS invalide ({STATE_COMMIT_DELAY_MS}), doit être >= 0")
+    if STATE_COMMIT_BATCH <= 0:
+        errors.append(f"❌ STATE_COMMIT_BATCH invalide ({STATE_COMMIT_BATCH}), doit être > 0")
+    
+    if STATE_BACKEND not in ("json", "sqlite", "journal"):
+        warnings.append(f"⚠️ STATE_BACKEND inconnu ({STATE_BACKEND}), 'json' sera utilisé")
+    
     # Validation du timezone
     try:
         datetime.datetime.now(tz=TZ)
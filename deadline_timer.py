@@ -0,0 +1,173 @@
+"""Minuteur des deadlines de réponse (tas trié par échéance).
+
+Pourquoi:
+- `check_deadline` tournait toutes les 5 minutes: une alerte pouvait partir
+  jusqu'à 5 minutes en retard.
+
+Fonctionnement:
+- Les deadlines en attente sont rangées dans un tas (`heapq`): armement et
+  annulation en O(log n), réveil exactement à la prochaine échéance.
+- Le minuteur suit les transitions du `StateManager` (`add_listener`):
+  `set_waiting` arme la deadline, `set_reply` / `reset_waiting` /
+  `mark_alert_sent` l'annulent. L'annulation est paresseuse: l'entrée reste
+  dans le tas et est ignorée à l'échéance.
+- Les écritures des autres processus (worker Gunicorn qui reçoit la réponse)
+  sont relues au plus toutes les `resync_interval` secondes (`on_idle`).
+- À l'échéance, `on_due(tenant_id)` est appelé dans un petit pool de threads:
+  il relit l'état et décide de l'alerte (une réponse arrivée entre-temps
+  annule tout).
+
+Le minuteur ne tourne que dans le process qui détient le scheduler.
+"""
+
+from __future__ import annotations
+
+import time
+import heapq
+import logging
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from state_model import TenantState
+from telemetry import SCHEDULER_JOB_LAG
+
+logger = logging.getLogger("whatsapp_bot")
+
+
+class DeadlineTimer:
+    """Tas de deadlines (epoch) + thread qui dort jusqu'à la prochaine."""
+
+    def __init__(
+        self,
+        on_due: Callable[[str], None],
+        on_idle: Callable[[], None] | None = None,
+        resync_interval: float = 5.0,
+        workers: int = 2,
+    ):
+        self.on_due = on_due
+        self.on_idle = on_idle
+        self.resync_interval = resync_interval
+        self.workers = max(1, workers)
+        self._cond = threading.Condition()
+        self._heap: list[tuple[float, int, str]] = []  # (échéance, seq, tenant)
+        self._deadlines: dict[str, float] = {}          # tenant -> échéance active
+        self._seq = itertools.count()
+        self._thread: threading.Thread | None = None
+        self._pool: ThreadPoolExecutor | None = None
+        self._stopped = False
+
+        self.fired = 0
+        self.max_delay_ms = 0.0
+
+    def arm(self, tenant_id: str, due_at: float) -> None:
+        """Arme (ou déplace) la deadline d'un tenant (timestamp epoch)."""
+        with self._cond:
+            if self._deadlines.get(tenant_id) == due_at:
+                return
+            self._deadlines[tenant_id] = due_at
+            heapq.heappush(self._heap, (due_at, next(self._seq), tenant_id))
+            # Réveil seulement si la nouvelle échéance passe en tête
+            if self._heap[0][2] == tenant_id:
+                self._cond.notify()
+
+    def cancel(self, tenant_id: str) -> None:
+        """Annule la deadline d'un tenant (l'entrée du tas sera ignorée)."""
+        with self._cond:
+            self._deadlines.pop(tenant_id, None)
+            # Purge des entrées mortes quand elles dominent le tas
+            if len(self._heap) > 64 and len(self._heap) > 2 * len(self._deadlines):
+                self._heap = [e for e in self._heap if self._deadlines.get(e[2]) == e[0]]
+                heapq.heapify(self._heap)
+
+    def on_state_change(self, tenant_id: str, state: TenantState) -> None:
+        """Listener du StateManager: arme ou annule selon l'état du tenant."""
+        if not state.waiting or state.alert_sent:
+            self.cancel(tenant_id)
+        elif state.deadline is None:
+            # Deadline invalide: traitée tout de suite (check_tenant_deadline la réinitialise)
+            self.arm(tenant_id, time.time())
+        else:
+            self.arm(tenant_id, state.deadline)
+
+    def start(self) -> None:
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._stopped = False
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="deadline")
+            self._thread = threading.Thread(target=self._run, name="deadline-timer", daemon=True)
+            self._thread.start()
+
+    def _pop_due(self, now: float) -> list[str]:
+        """Retire les tenants arrivés à échéance (avec lock)."""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due_at, _, tenant_id = heapq.heappop(self._heap)
+            if self._deadlines.get(tenant_id) != due_at:
+                continue  # annulée ou déplacée
+            del self._deadlines[tenant_id]
+            self.max_delay_ms = max(self.max_delay_ms, (now - due_at) * 1000)
+            SCHEDULER_JOB_LAG.observe(max(0.0, now - due_at), "deadline")
+            due.append(tenant_id)
+        return due
+
+    def _run(self) -> None:
+        next_resync = time.monotonic() + self.resync_interval
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                due = self._pop_due(time.time())
+                if not due:
+                    timeout = max(0.0, next_resync - time.monotonic())
+                    if self._heap:
+                        timeout = min(timeout, max(0.0, self._heap[0][0] - time.time()))
+                    self._cond.wait(timeout)
+                    if self._stopped:
+                        return
+                    due = self._pop_due(time.time())
+
+            for tenant_id in due:
+                self.fired += 1
+                self._pool.submit(self._fire, tenant_id)
+
+            if self.on_idle and time.monotonic() >= next_resync:
+                next_resync = time.monotonic() + self.resync_interval
+                try:
+                    self.on_idle()
+                except Exception as e:
+                    logger.error(f"❌ Erreur de resynchronisation des deadlines: {e}", exc_info=True)
+
+    def _fire(self, tenant_id: str) -> None:
+        try:
+            self.on_due(tenant_id)
+        except Exception as e:
+            logger.error(f"❌ Erreur à l'échéance de la deadline ({tenant_id}): {e}", exc_info=True)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        with self._cond:
+            self._stopped = True
+            thread, self._thread = self._thread, None
+            pool, self._pool = self._pool, None
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join(timeout)
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def metrics(self) -> dict:
+        with self._cond:
+            next_due = self._heap[0][0] if self._deadlines and self._heap else None
+            return {
+                "armed": len(self._deadlines),
+                "heap_size": len(self._heap),
+                "next_due_in_s": round(next_due - time.time(), 3) if next_due is not None else None,
+                "fired": self.fired,
+                "max_delay_ms": round(self.max_delay_ms, 3),
+                "running": self._thread is not None,
+            }
@@ -0,0 +1,180 @@
+"""Déduplication des webhooks (par identifiant de message WhatsApp).
+
+Meta renvoie un payload tant qu'il n'a pas été acquitté, et parfois même après,
+sur n'importe quelle connexion: avec plusieurs workers Gunicorn, le renvoi
+arrive souvent sur un autre process. Sans déduplication partagée, chaque renvoi
+relance `set_reply()` (écriture de l'état, `total_replies` incrémenté, ligne
+d'historique) et renvoie une confirmation `TEMPLATE_OK`.
+
+- Référence partagée: table SQLite (WAL) `webhook_dedup`, `message_id` en clé
+  primaire. `INSERT ... ON CONFLICT` décide atomiquement, entre tous les
+  workers, qui traite le message; les ids plus vieux que `ttl` sont purgés.
+- Chemin rapide: LRU en mémoire bornée (`max_size`) devant la base. Un doublon
+  déjà vu par ce process ne coûte qu'une recherche dans un dict.
+- Sans base (`DEDUP_DB_FILE` vide): LRU seule, valable pour un seul process.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+from config import DEDUP_MAX_SIZE, DEDUP_TTL_SEC, DEDUP_DB_FILE
+
+logger = logging.getLogger("whatsapp_bot")
+
+# Purge des ids expirés au plus toutes les PURGE_INTERVAL_SEC secondes
+PURGE_INTERVAL_SEC = 3600
+
+
+class _Statements:
+    CREATE = """
+        CREATE TABLE IF NOT EXISTS webhook_dedup (
+            message_id TEXT PRIMARY KEY,
+            seen_at    REAL NOT NULL
+        ) WITHOUT ROWID
+    """
+    CREATE_SEEN_INDEX = "CREATE INDEX IF NOT EXISTS idx_webhook_dedup_seen ON webhook_dedup(seen_at)"
+    # Nouveau, ou déjà vu mais expiré (pas encore purgé): 1 ligne modifiée
+    CLAIM = """
+        INSERT INTO webhook_dedup (message_id, seen_at) VALUES (?, ?)
+        ON CONFLICT(message_id) DO UPDATE SET seen_at = excluded.seen_at
+        WHERE webhook_dedup.seen_at <= ?
+    """
+    DELETE = "DELETE FROM webhook_dedup WHERE message_id = ?"
+    PURGE = "DELETE FROM webhook_dedup WHERE seen_at <= ?"
+    COUNT = "SELECT COUNT(*) FROM webhook_dedup"
+
+
+class DedupCache:
+    """Ids de messages récents: LRU locale devant une table SQLite partagée."""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 604800, db_file: str | None = None):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self.db_file = db_file or None
+        self.lock = threading.Lock()
+        self._entries: OrderedDict[str, float] = OrderedDict()  # id -> expiration (epoch)
+        self._conn: sqlite3.Connection | None = None
+        self._next_purge = 0.0
+
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.errors = 0
+
+        if self.db_file:
+            db_dir = os.path.dirname(self.db_file)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_file, timeout=5, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # Perte des derniers ids sur coupure de courant: au pire un doublon traité
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(_Statements.CREATE)
+            self._conn.execute(_Statements.CREATE_SEEN_INDEX)
+
+    def _evict(self, now: float) -> None:
+        """Retire les entrées expirées puis les plus anciennes au-delà de max_size (avec lock)."""
+        entries = self._entries
+        while entries:
+            key, expires_at = next(iter(entries.items()))
+            if expires_at > now and len(entries) <= self.max_size:
+                break
+            entries.popitem(last=False)
+
+    def _remember(self, key: str, expires_at: float, now: float) -> None:
+        self._entries[key] = expires_at
+        self._entries.move_to_end(key)
+        self._evict(now)
+
+    def check_and_add(self, key: str) -> bool:
+        """Renvoie True si `key` est nouveau (et l'enregistre), False si doublon."""
+        now = time.time()
+        with self.lock:
+            expires_at = self._entries.get(key)
+            if expires_at is not None and expires_at > now:
+                self.hits += 1
+                return False
+
+            if self._conn is not None:
+                try:
+                    claimed = self._conn.execute(_Statements.CLAIM, (key, now, now - self.ttl)).rowcount == 1
+                    if now >= self._next_purge:
+                        self._purge(now)
+                except sqlite3.Error as e:
+                    # Base indisponible: mieux vaut un doublon qu'une réponse perdue
+                    self.errors += 1
+                    logger.warning(f"⚠️ Déduplication partagée indisponible ({self.db_file}): {e}")
+                    claimed = True
+                if not claimed:
+                    # Déjà traité par un autre worker
+                    self.shared_hits += 1
+                    self._remember(key, now + self.ttl, now)
+                    return False
+
+            self.misses += 1
+            self._remember(key, now + self.ttl, now)
+            return True
+
+    def discard(self, key: str) -> None:
+        """Oublie `key` (ex: événement refusé, il doit être retraité au prochain renvoi)."""
+        with self.lock:
+            self._entries.pop(key, None)
+            if self._conn is not None:
+                try:
+                    self._conn.execute(_Statements.DELETE, (key,))
+                except sqlite3.Error as e:
+                    logger.warning(f"⚠️ Impossible d'oublier {key} dans {self.db_file}: {e}")
+
+    def _purge(self, now: float) -> None:
+        """Supprime les ids expirés de la base (avec lock)."""
+        deleted = self._conn.execute(_Statements.PURGE, (now - self.ttl,)).rowcount
+        self._next_purge = now + PURGE_INTERVAL_SEC
+        if deleted:
+            logger.debug(f"🧹 {deleted} id(s) de message expiré(s) purgé(s)")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def metrics(self) -> dict:
+        shared = None
+        if self._conn is not None:
+            with self.lock:
+                try:
+                    shared = self._conn.execute(_Statements.COUNT).fetchone()[0]
+                except sqlite3.Error:
+                    pass
+        return {
+            "size": len(self._entries),
+            "capacity": self.max_size,
+            "shared_size": shared,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "errors": self.errors,
+        }
+
+    def close(self) -> None:
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+
+
+# Singleton : une LRU par process, la base est partagée entre workers.
+_dedup_cache: DedupCache | None = None
+_dedup_cache_lock = threading.Lock()
+
+
+def get_dedup_cache() -> DedupCache:
+    global _dedup_cache
+    with _dedup_cache_lock:
+        if _dedup_cache is None:
+            _dedup_cache = DedupCache(DEDUP_MAX_SIZE, DEDUP_TTL_SEC, DEDUP_DB_FILE)
+        return _dedup_cache
@@ -0,0 +1,181 @@
+"""Suivi des statuts de livraison WhatsApp et latences de bout en bout.
+
+Meta notifie par webhook (`statuses`) chaque étape d'un message sortant:
+`sent` (accepté par WhatsApp), `delivered` (remis au téléphone), `read`
+(lu), ou `failed`. Ces statuts sont rattachés au message de l'outbox par son
+wamid (outbox.py), avec leur horodatage.
+
+Latences par type de message (ping, alerte) sur une fenêtre glissante,
+calculées depuis la base (tous les workers y écrivent) en histogrammes à
+seuils fixes:
+- `queue_to_api`: mise en file -> acceptation par l'API Graph (file d'envoi,
+  retries, lenteur de l'API)
+- `api_to_delivered`: acceptation -> remise au téléphone
+- `delivered_to_read`: remise -> lecture
+
+Les horodatages Meta sont à la seconde et comparés à l'horloge locale
+(NTP requis). Une alerte en `failed` est renvoyée au canal de secours
+(alert_fallback.py).
+"""
+
+from __future__ import annotations
+
+import time
+import bisect
+import logging
+import threading
+
+from outbox import KIND_ALERT
+from webhook_queue import DeliveryStatus
+
+logger = logging.getLogger("whatsapp_bot")
+
+# Seuils des histogrammes (secondes): de la seconde à la journée
+LATENCY_BUCKETS_SEC = (1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 21600, 86400)
+
+STAGES = ("queue_to_api", "api_to_delivered", "delivered_to_read")
+
+
+class Histogram:
+    """Histogramme à seuils fixes (comptes cumulés par seuil, à la Prometheus)."""
+
+    def __init__(self, bounds: tuple = LATENCY_BUCKETS_SEC):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # dernier: au-delà du plus grand seuil
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile_bound(self, q: float) -> float | None:
+        """Seuil sous lequel se trouvent au moins `q` des valeurs (None si vide ou au-delà)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+    def to_dict(self) -> dict:
+        # Liste ordonnée (un dict JSON serait trié par clé texte: "10" avant "2")
+        cumulative, buckets = 0, []
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            buckets.append({"le": bound, "count": cumulative})
+        buckets.append({"le": "+Inf", "count": self.count})
+        return {
+            "count": self.count,
+            "mean_s": round(self.total / self.count, 3) if self.count else None,
+            "p50_le_s": self.quantile_bound(0.5),
+            "p95_le_s": self.quantile_bound(0.95),
+            "buckets": buckets,
+        }
+
+
+class DeliveryTracker:
+    """Applique les statuts reçus et agrège les latences de livraison."""
+
+    # Agrégats recalculés au plus toutes les CACHE_TTL_SEC secondes par fenêtre
+    CACHE_TTL_SEC = 10.0
+
+    def __init__(self, outbox):
+        self.outbox = outbox
+        self._lock = threading.Lock()
+        self._cache: dict[int, tuple[float, dict]] = {}
+
+        self.statuses: dict[str, int] = {}
+        self.unknown = 0
+        self.fallbacks = 0
+
+    def record(self, status: DeliveryStatus) -> None:
+        """Rattache un statut à son message; alerte en échec -> canal de secours"""
+        self.statuses[status.status] = self.statuses.get(status.status, 0) + 1
+        result = self.outbox.apply_status(status.message_id, status.status, status.timestamp, status.error)
+        if result is None:
+            # Message hors outbox (confirmation mc_ok) ou déjà purgé
+            self.unknown += 1
+            return
+        entry, first_failure = result
+        if not first_failure:
+            return
+        logger.error(
+            f"❌ Message {entry.kind} non remis à {entry.recipient} ({entry.tenant_id}): "
+            f"{status.error or 'statut failed'}"
+        )
+        if entry.kind == KIND_ALERT:
+            from alert_fallback import enqueue_fallback
+            if enqueue_fallback(entry, f"statut WhatsApp failed: {status.error or 'sans détail'}"):
+                self.fallbacks += 1
+
+    def window_stats(self, hours: int = 24) -> dict:
+        """Comptes et histogrammes de latence des messages acceptés depuis `hours` heures"""
+        now = time.time()
+        with self._lock:
+            cached = self._cache.get(hours)
+            if cached is not None and now - cached[0] < self.CACHE_TTL_SEC:
+                return cached[1]
+
+        since = now - hours * 3600
+        kinds: dict[str, dict] = {}
+        for kind, created_at, sent_at, delivered_at, read_at, failed_at in self.outbox.delivery_rows(since):
+            stats = kinds.get(kind)
+            if stats is None:
+                stats = kinds[kind] = {
+                    "accepted": 0, "delivered": 0, "read": 0, "failed": 0,
+                    "histograms": {stage: Histogram() for stage in STAGES},
+                }
+            stats["accepted"] += 1
+            histograms = stats["histograms"]
+            histograms["queue_to_api"].observe(max(0.0, sent_at - created_at))
+            if delivered_at is not None:
+                stats["delivered"] += 1
+                histograms["api_to_delivered"].observe(max(0.0, delivered_at - sent_at))
+                if read_at is not None:
+                    histograms["delivered_to_read"].observe(max(0.0, read_at - delivered_at))
+            if read_at is not None:
+                stats["read"] += 1
+            if failed_at is not None:
+                stats["failed"] += 1
+
+        result = {
+            "window_hours": hours,
+            "kinds": {
+                kind: {
+                    **{k: v for k, v in stats.items() if k != "histograms"},
+                    "delivery_rate": round(stats["delivered"] / stats["accepted"] * 100, 2),
+                    "latency": {stage: h.to_dict() for stage, h in stats["histograms"].items()},
+                }
+                for kind, stats in sorted(kinds.items())
+            },
+            "recent_failures": self.outbox.recent_failures(since),
+        }
+        with self._lock:
+            self._cache[hours] = (now, result)
+        return result
+
+    def metrics(self) -> dict:
+        return {
+            "statuses": dict(self.statuses),
+            "unknown_message_ids": self.unknown,
+            "fallbacks": self.fallbacks,
+        }
+
+
+# Singleton : un suivi par process (la base de l'outbox est partagée).
+_delivery_tracker: DeliveryTracker | None = None
+_delivery_tracker_lock = threading.Lock()
+
+
+def get_delivery_tracker() -> DeliveryTracker:
+    global _delivery_tracker
+    with _delivery_tracker_lock:
+        if _delivery_tracker is None:
+            from outbox import get_outbox
+            _delivery_tracker = DeliveryTracker(get_outbox())
+        return _delivery_tracker
@@ -0,0 +1,255 @@
+"""Diffusion des transitions d'état aux clients SSE (`/events`).
+
+Pourquoi:
+- Le widget et la page `/api` interrogeaient `/health` et `/stats` toutes les
+  30 secondes: N spectateurs = N requêtes par cycle, et un changement mettait
+  jusqu'à 30 secondes à s'afficher.
+
+Fonctionnement:
+- Le hub est un listener du `StateManager`: chaque transition est sérialisée
+  une seule fois en trame SSE et ajoutée à un tampon circulaire numéroté.
+  Publier coûte O(1) quel que soit le nombre d'abonnés.
+- Chaque abonné garde sa position dans le tampon et lit les trames qui
+  suivent (`Last-Event-ID` à la reconnexion). Un abonné trop lent ou
+  reconnecté trop tard reçoit un instantané au lieu des trames perdues.
+- Un seul thread par process relit l'état partagé (`refresh`) tant qu'il y a
+  des abonnés: les réponses traitées par un autre worker sont aussi poussées.
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import time
+import logging
+import itertools
+import threading
+from collections import deque
+from typing import Callable, Iterable, Iterator
+from zoneinfo import ZoneInfo
+
+from config import TZ
+from state_model import TenantState, format_ts
+
+logger = logging.getLogger("whatsapp_bot")
+
+ALL_TENANTS = "all"
+
+
+def classify(previous: TenantState | None, state: TenantState) -> str:
+    """Nature d'une transition: "ping", "reply", "alert" ou "state"."""
+    if previous is not None:
+        if state.total_pings > previous.total_pings:
+            return "ping"
+        if state.total_replies > previous.total_replies:
+            return "reply"
+        if state.alert_sent and not previous.alert_sent:
+            return "alert"
+        return "state"
+    # Premier événement vu pour ce tenant: déduit de l'état seul
+    if state.alert_sent:
+        return "alert"
+    if state.waiting:
+        return "ping"
+    if state.last_reply is not None and state.last_reply >= (state.last_ping or 0):
+        return "reply"
+    return "state"
+
+
+def event_payload(tenant_id: str, state: TenantState, kind: str, tz: ZoneInfo = TZ) -> dict:
+    """Corps d'un événement (mêmes champs que /health + tenant et nature, dates dans `tz`)"""
+    return {
+        "status": "ok",
+        "tenant": tenant_id,
+        "event": kind,
+        "waiting": state.waiting,
+        "alert_sent": state.alert_sent,
+        "last_ping": format_ts(state.last_ping, tz),
+        "last_reply": format_ts(state.last_reply, tz),
+    }
+
+
+def format_frame(payload: dict, event_id: str | None = None) -> bytes:
+    """Trame SSE (`id:` optionnel, une ligne `data:` JSON)"""
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}data: {json.dumps(payload, separators=(',', ':'))}\n\n".encode()
+
+
+class EventHub:
+    """Tampon circulaire de trames SSE + abonnés qui le lisent à leur rythme."""
+
+    def __init__(
+        self,
+        refresh: Callable[[], None] | None = None,
+        tenant_tz: Callable[[str], ZoneInfo] | None = None,
+        capacity: int = 256,
+        refresh_interval: float = 1.0,
+        keepalive: float = 15.0,
+    ):
+        self.refresh = refresh
+        # Fuseau d'affichage des dates d'un tenant (celui de /stats et /health)
+        self.tenant_tz = tenant_tz or (lambda tenant_id: TZ)
+        self.refresh_interval = refresh_interval
+        self.keepalive = keepalive
+        self._cond = threading.Condition()
+        self._frames: deque[tuple[int, str, bytes]] = deque(maxlen=max(1, capacity))  # (id, tenant, trame)
+        self._ids = itertools.count(1)
+        self._last_id = 0
+        # Préfixe des id SSE: un Last-Event-ID d'un autre process (ou d'avant
+        # un redémarrage) ne correspond à aucune position de ce tampon
+        self.epoch = os.urandom(4).hex()
+        self._previous: dict[str, TenantState] = {}
+        self._pump: threading.Thread | None = None
+
+        self.subscribers = 0
+        self.published = 0
+        self.resyncs = 0
+
+    # ---------- Publication ----------
+
+    def on_state_change(self, tenant_id: str, state: TenantState) -> None:
+        """Listener du StateManager (appelé avec son lock: rapide)"""
+        kind = classify(self._previous.get(tenant_id), state)
+        self._previous[tenant_id] = state
+        with self._cond:
+            event_id = next(self._ids)
+            if not self.subscribers:
+                # Rien à sérialiser; le tampon vidé force un instantané à la reprise
+                self._frames.clear()
+                self._last_id = event_id
+                return
+            frame = format_frame(event_payload(tenant_id, state, kind, self.tenant_tz(tenant_id)), f"{self.epoch}-{event_id}")
+            self._frames.append((event_id, tenant_id, frame))
+            self._last_id = event_id
+            self.published += 1
+            self._cond.notify_all()
+
+    # ---------- Abonnés ----------
+
+    def _resume_position(self, last_event_id: str | None) -> int | None:
+        """Position d'un `Last-Event-ID` de ce process encore dans le tampon (avec lock)"""
+        epoch, _, raw_id = (last_event_id or "").partition("-")
+        if epoch != self.epoch or not raw_id.isdigit():
+            return None
+        position = int(raw_id)
+        oldest = self._frames[0][0] if self._frames else self._last_id + 1
+        if not oldest - 1 <= position <= self._last_id:
+            return None
+        return position
+
+    def _read_after(self, position: int, tenant_id: str) -> tuple[list[bytes], int, bool]:
+        """Trames après `position` pour `tenant_id` (avec lock) -> (trames, position, perte)"""
+        if position >= self._last_id:
+            return [], self._last_id, False
+        oldest = self._frames[0][0] if self._frames else self._last_id + 1
+        if position < oldest - 1:
+            return [], self._last_id, True
+        frames = [
+            frame for event_id, tid, frame in itertools.islice(self._frames, position - oldest + 1, None)
+            if tenant_id == ALL_TENANTS or tid == tenant_id
+        ]
+        return frames, self._last_id, False
+
+    def stream(
+        self,
+        tenant_id: str,
+        snapshot: Callable[[], Iterable[bytes]],
+        last_event_id: str | None = None,
+        max_duration: float = 300.0,
+        retry_ms: int = 5000,
+    ) -> Iterator[bytes]:
+        """Générateur SSE d'un abonné (`tenant_id` ou ALL_TENANTS).
+
+        Commence par l'instantané courant (sauf reprise via `last_event_id`
+        encore dans le tampon), puis pousse les transitions. Ferme le flux
+        après `max_duration` secondes: le navigateur se reconnecte seul.
+        """
+        with self._cond:
+            self.subscribers += 1
+            self._ensure_pump()
+            resumed = self._resume_position(last_event_id)
+            position = self._last_id if resumed is None else resumed
+        try:
+            yield f"retry: {retry_ms}\n\n".encode()
+            if resumed is None:
+                yield from snapshot()
+            end = time.monotonic() + max_duration
+            while True:
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    return
+                wake = time.monotonic() + min(self.keepalive, remaining)
+                with self._cond:
+                    frames, position, lost = self._read_after(position, tenant_id)
+                    # Les trames des autres tenants ne réveillent pas le client
+                    while not frames and not lost:
+                        timeout = wake - time.monotonic()
+                        if timeout <= 0:
+                            break
+                        self._cond.wait(timeout)
+                        frames, position, lost = self._read_after(position, tenant_id)
+                if lost:
+                    self.resyncs += 1
+                    yield from snapshot()
+                elif frames:
+                    yield b"".join(frames)
+                else:
+                    # Commentaire SSE: garde la connexion ouverte, détecte les clients partis
+                    yield b": keepalive\n\n"
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+
+    # ---------- Relecture de l'état partagé ----------
+
+    def _ensure_pump(self) -> None:
+        """Démarre le thread de relecture (avec lock, après un éventuel fork)"""
+        if self.refresh is not None and self._pump is None:
+            self._pump = threading.Thread(target=self._run_pump, name="event-hub", daemon=True)
+            self._pump.start()
+
+    def _run_pump(self) -> None:
+        while True:
+            with self._cond:
+                if not self.subscribers:
+                    self._pump = None
+                    return
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"❌ Erreur de relecture de l'état pour /events: {e}", exc_info=True)
+            time.sleep(self.refresh_interval)
+
+    def metrics(self) -> dict:
+        with self._cond:
+            return {
+                "subscribers": self.subscribers,
+                "published": self.published,
+                "resyncs": self.resyncs,
+                "buffered": len(self._frames),
+                "last_event_id": self._last_id,
+            }
+
+
+# Singleton : un hub par process, abonné au StateManager au premier usage.
+_event_hub: EventHub | None = None
+_event_hub_lock = threading.Lock()
+
+
+def get_event_hub() -> EventHub:
+    global _event_hub
+    with _event_hub_lock:
+        if _event_hub is None:
+            from config import STATE_REFRESH_INTERVAL, EVENTS_KEEPALIVE_SEC
+            from services import get_state_manager, get_tenant_registry
+
+            state_manager = get_state_manager()
+            registry = get_tenant_registry()
+            _event_hub = EventHub(
+                refresh=state_manager.refresh,
+                tenant_tz=lambda tenant_id: registry.get(tenant_id).tz if tenant_id in registry else TZ,
+                refresh_interval=max(0.5, STATE_REFRESH_INTERVAL),
+                keepalive=EVENTS_KEEPALIVE_SEC,
+            )
+            state_manager.add_listener(_event_hub.on_state_change, replay=False)
+        return _event_hub
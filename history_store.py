@@ -0,0 +1,257 @@
+"""Historique quotidien par tenant et agrégats sur fenêtre.
+
+Une ligne par tenant et par jour de ping (table SQLite `WITHOUT ROWID`, clé
+primaire `(tenant_id, day)`): les jours d'un tenant sont stockés contigus et
+une fenêtre se lit par un seul parcours d'intervalle sur la clé.
+
+- `day`: date locale du ping (ordinal `date.toordinal()`, fuseau du tenant)
+- `ping_ts`: envoi du ping (secondes epoch)
+- `reply_latency`: secondes entre le ping et la première réponse (NULL sinon)
+- `alert`: 0 aucune alerte, 1 alerte délivrée, 2 alerte non délivrée
+- `waiting`: 1 tant que ce ping attend sa réponse (posé par le ping, levé par
+  la réponse ou la fin de l'attente, `record_reset`): une réponse n'est
+  créditée qu'au ping en attente, jamais à un ping plus ancien
+
+Les agrégats (`window_stats`) sont calculés sur des colonnes `array`
+(taux de réponse, p50/p95 de latence, séries de jours avec réponse) et mis en
+cache jusqu'à la prochaine écriture, y compris celle d'un autre processus
+(`PRAGMA data_version`).
+
+L'historique n'est pas critique: une erreur d'écriture est journalisée sans
+interrompre le ping, la réponse ou l'alerte.
+"""
+
+from __future__ import annotations
+
+import os
+import math
+import logging
+import sqlite3
+import datetime
+import threading
+from array import array
+from collections import OrderedDict
+from zoneinfo import ZoneInfo
+
+from config import TZ, HISTORY_DB_FILE
+
+logger = logging.getLogger("whatsapp_bot")
+
+ALERT_NONE = 0
+ALERT_DELIVERED = 1
+ALERT_FAILED = 2
+
+
+class _Statements:
+    CREATE = """
+        CREATE TABLE IF NOT EXISTS daily_history (
+            tenant_id     TEXT NOT NULL,
+            day           INTEGER NOT NULL,
+            ping_ts       INTEGER NOT NULL,
+            reply_latency INTEGER,
+            alert         INTEGER NOT NULL DEFAULT 0,
+            waiting       INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (tenant_id, day)
+        ) WITHOUT ROWID
+    """
+    COLUMNS = "PRAGMA table_info(daily_history)"
+    # Bases créées avant l'ajout de la colonne `waiting`
+    ADD_WAITING = "ALTER TABLE daily_history ADD COLUMN waiting INTEGER NOT NULL DEFAULT 0"
+    CREATE_WAITING_INDEX = """
+        CREATE INDEX IF NOT EXISTS daily_history_waiting ON daily_history (tenant_id)
+        WHERE waiting = 1
+    """
+    DATA_VERSION = "PRAGMA data_version"
+    # Un seul ping en attente par tenant
+    CLOSE_WAITING = "UPDATE daily_history SET waiting = 0 WHERE tenant_id = ? AND waiting = 1"
+    # Un nouveau ping le même jour (ex: /debug/ping) remplace le précédent
+    UPSERT_PING = """
+        INSERT INTO daily_history (tenant_id, day, ping_ts, waiting) VALUES (?, ?, ?, 1)
+        ON CONFLICT(tenant_id, day) DO UPDATE SET
+            ping_ts = excluded.ping_ts, reply_latency = NULL, alert = 0, waiting = 1
+    """
+    LAST_DAY = "SELECT MAX(day) FROM daily_history WHERE tenant_id = ?"
+    SET_REPLY = """
+        UPDATE daily_history SET reply_latency = MAX(0, ? - ping_ts), waiting = 0
+        WHERE tenant_id = ? AND waiting = 1 AND ping_ts <= ?
+    """
+    # Une alerte délivrée à un contact reste délivrée (échec d'un autre contact)
+    SET_ALERT = """
+        UPDATE daily_history SET alert = CASE WHEN alert = 1 THEN 1 ELSE ? END
+        WHERE tenant_id = ? AND day = ?
+    """
+    SELECT_WINDOW = """
+        SELECT day, reply_latency, alert, waiting FROM daily_history
+        WHERE tenant_id = ? AND day BETWEEN ? AND ?
+        ORDER BY day
+    """
+
+
+def _percentile(sorted_values: array, pct: float) -> int | None:
+    """Percentile au rang le plus proche sur des valeurs triées."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class HistoryStore:
+    """Historique quotidien (SQLite WAL) + cache des agrégats."""
+
+    def __init__(self, db_file: str, cache_size: int = 256):
+        self.db_file = db_file
+        db_dir = os.path.dirname(db_file)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, timeout=5, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Historique non critique: pas de fsync à chaque commit
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(_Statements.CREATE)
+        if "waiting" not in {row[1] for row in self._conn.execute(_Statements.COLUMNS)}:
+            self._conn.execute(_Statements.ADD_WAITING)
+        self._conn.execute(_Statements.CREATE_WAITING_INDEX)
+        self.cache_size = cache_size
+        self._cache: OrderedDict[tuple, dict] = OrderedDict()
+        self._cache_version = None
+
+    # ---------- Écritures ----------
+
+    def record_ping(self, tenant_id: str, ts: int, tz: ZoneInfo = TZ) -> None:
+        """Ping envoyé: il devient le ping en attente de réponse du tenant."""
+        day = datetime.datetime.fromtimestamp(ts, tz=tz).date().toordinal()
+        try:
+            with self.lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._conn.execute(_Statements.CLOSE_WAITING, (tenant_id,))
+                    self._conn.execute(_Statements.UPSERT_PING, (tenant_id, day, ts))
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    raise
+                self._conn.execute("COMMIT")
+                self._cache.clear()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Écriture de l'historique impossible ({tenant_id}): {e}")
+
+    def record_reply(self, tenant_id: str, ts: int) -> None:
+        """Réponse au ping en attente (ignorée s'il n'y en a pas: réponse tardive ou en double)."""
+        self._write(_Statements.SET_REPLY, (ts, tenant_id, ts))
+
+    def record_reset(self, tenant_id: str) -> None:
+        """Fin de l'attente sans réponse (alerte, deadline invalide): plus aucun ping à créditer."""
+        self._write(_Statements.CLOSE_WAITING, (tenant_id,))
+
+    def record_alert(self, tenant_id: str, delivered: bool) -> None:
+        outcome = ALERT_DELIVERED if delivered else ALERT_FAILED
+        self._write_on_last_day(tenant_id, _Statements.SET_ALERT, lambda day: (outcome, tenant_id, day))
+
+    def _write_on_last_day(self, tenant_id: str, sql: str, params) -> None:
+        try:
+            with self.lock:
+                row = self._conn.execute(_Statements.LAST_DAY, (tenant_id,)).fetchone()
+                if row and row[0] is not None:
+                    self._conn.execute(sql, params(row[0]))
+                    self._cache.clear()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Écriture de l'historique impossible ({tenant_id}): {e}")
+
+    def _write(self, sql: str, params: tuple) -> None:
+        try:
+            with self.lock:
+                self._conn.execute(sql, params)
+                self._cache.clear()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Écriture de l'historique impossible: {e}")
+
+    # ---------- Lectures ----------
+
+    def window_stats(self, tenant_id: str, days: int = 30, tz: ZoneInfo = TZ, today: int | None = None) -> dict:
+        """Agrégats sur les `days` derniers jours (aujourd'hui inclus)."""
+        if today is None:
+            today = datetime.datetime.now(tz=tz).date().toordinal()
+        first = today - days + 1
+        key = (tenant_id, first, today)
+        with self.lock:
+            version = self._conn.execute(_Statements.DATA_VERSION).fetchone()[0]
+            if version != self._cache_version:
+                # Écriture d'un autre processus depuis la mise en cache
+                self._cache.clear()
+                self._cache_version = version
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+            rows = self._conn.execute(_Statements.SELECT_WINDOW, key).fetchall()
+
+        result = self._aggregate(rows, first, today)
+        with self.lock:
+            self._cache[key] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    @staticmethod
+    def _aggregate(rows: list[tuple], first: int, last: int) -> dict:
+        day_col = array("l", (r[0] for r in rows))
+        latencies = array("l", sorted(r[1] for r in rows if r[1] is not None))
+        alerts = array("b", (r[2] for r in rows))
+        replied = [r[1] is not None for r in rows]
+        # Ping qui attend encore sa réponse: ni réussite ni échec pour l'instant
+        pending = bool(rows) and bool(rows[-1][3])
+
+        # Séries de jours consécutifs avec réponse
+        longest = current = before_last = 0
+        previous_day = None
+        for day, ok in zip(day_col, replied):
+            before_last = current
+            if ok and previous_day is not None and day == previous_day + 1 and current:
+                current += 1
+            else:
+                current = 1 if ok else 0
+            longest = max(longest, current)
+            previous_day = day
+        # Série en cours: elle se termine au dernier ping s'il a reçu une réponse, ou
+        # la veille d'un ping encore en attente. Sans ping depuis avant-hier, finie.
+        if not rows or day_col[-1] < last - 1:
+            current = 0
+        elif pending:
+            current = before_last if len(day_col) > 1 and day_col[-2] == day_col[-1] - 1 else 0
+
+        pings = len(day_col)
+        replies = len(latencies)
+        resolved = pings - pending
+        return {
+            "from": datetime.date.fromordinal(first).isoformat(),
+            "to": datetime.date.fromordinal(last).isoformat(),
+            "days_with_ping": pings,
+            "pending": pending,
+            "replies": replies,
+            "response_rate": round(replies / resolved * 100, 2) if resolved else 0,
+            "alerts": sum(1 for a in alerts if a != ALERT_NONE),
+            "alerts_failed": sum(1 for a in alerts if a == ALERT_FAILED),
+            "reply_latency_p50_s": _percentile(latencies, 50),
+            "reply_latency_p95_s": _percentile(latencies, 95),
+            "current_streak_days": current,
+            "longest_streak_days": longest,
+        }
+
+    def close(self) -> None:
+        try:
+            self._conn.close()
+        except Exception:
+            pass
+
+
+# Singleton : une connexion par process, ouverte au premier usage (après fork).
+_history_store: HistoryStore | None = None
+_history_lock = threading.Lock()
+
+
+def get_history_store() -> HistoryStore:
+    global _history_store
+    with _history_lock:
+        if _history_store is None:
+            _history_store = HistoryStore(HISTORY_DB_FILE)
+        return _history_store
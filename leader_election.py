@@ -0,0 +1,327 @@
+"""Élection d'un leader par bail (lease) renouvelé, avec jetons de fencing.
+
+Pourquoi:
+- Le verrou `flock` (scheduler_lock.py) ne coordonne que les processus d'un
+  même système de fichiers local: peu fiable sur un montage réseau, et un
+  détenteur bloqué (sans mourir) garde le scheduler pour toujours.
+
+Fonctionnement:
+- Un bail nommé ("scheduler") appartient à un seul candidat jusqu'à
+  `expires_at`. Le leader le renouvelle toutes les `renew_interval`
+  secondes; s'il cesse de le faire (process bloqué, nœud perdu), un autre
+  candidat le reprend à expiration.
+- Chaque changement de détenteur incrémente le jeton de fencing. Les actions
+  qui ne doivent s'exécuter qu'une fois (`claim`) vérifient, dans la même
+  transaction, que le bail est toujours le leur avec ce jeton: un ancien
+  leader qui se réveille est refusé.
+- Le leader se considère déchu dès que son bail a pu expirer selon son
+  horloge monotone (`is_leader`), même sans avoir pu joindre le backend.
+
+Backends: `LeaseBackend` (interface) et `SqliteLeaseBackend` (base locale ou
+volume partagé entre conteneurs d'un même hôte). Les horloges des candidats
+doivent être synchronisées (NTP): l'expiration est une date epoch.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+import socket
+import logging
+import sqlite3
+import threading
+import contextlib
+from dataclasses import dataclass
+from typing import Callable
+
+logger = logging.getLogger("whatsapp_bot")
+
+
+@dataclass(frozen=True)
+class Lease:
+    """Bail détenu par `owner` jusqu'à `expires_at` (epoch), jeton de fencing `token`."""
+    name: str
+    owner: str
+    token: int
+    expires_at: float
+
+
+class LeaseBackend:
+    """Interface d'un stockage de baux (opérations atomiques)."""
+
+    def try_acquire(self, name: str, owner: str, ttl: float) -> Lease | None:
+        """Prend le bail s'il est libre ou expiré (ou déjà à `owner`: renouvelé)"""
+        raise NotImplementedError
+
+    def renew(self, lease: Lease, ttl: float) -> Lease | None:
+        """Prolonge le bail s'il appartient toujours à `lease.owner` avec ce jeton"""
+        raise NotImplementedError
+
+    def release(self, lease: Lease) -> None:
+        raise NotImplementedError
+
+    def current(self, name: str) -> Lease | None:
+        raise NotImplementedError
+
+    def claim(self, lease: Lease, run_key: str) -> bool:
+        """Réserve l'exécution `run_key` si `lease` est toujours valide et que
+        personne ne l'a déjà réservée (une seule exécution par clé)."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class _Statements:
+    CREATE_LEASES = """
+        CREATE TABLE IF NOT EXISTS leases (
+            name       TEXT PRIMARY KEY,
+            owner      TEXT NOT NULL,
+            token      INTEGER NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    """
+    CREATE_RUNS = """
+        CREATE TABLE IF NOT EXISTS job_runs (
+            run_key    TEXT PRIMARY KEY,
+            token      INTEGER NOT NULL,
+            claimed_at REAL NOT NULL
+        )
+    """
+    SELECT = "SELECT name, owner, token, expires_at FROM leases WHERE name = ?"
+    UPSERT = """
+        INSERT INTO leases (name, owner, token, expires_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET
+            owner = excluded.owner, token = excluded.token, expires_at = excluded.expires_at
+    """
+    RENEW = "UPDATE leases SET expires_at = ? WHERE name = ? AND owner = ? AND token = ? AND expires_at > ?"
+    RELEASE = "UPDATE leases SET expires_at = 0 WHERE name = ? AND owner = ? AND token = ?"
+    CLAIM = "INSERT OR IGNORE INTO job_runs (run_key, token, claimed_at) VALUES (?, ?, ?)"
+    PURGE_RUNS = "DELETE FROM job_runs WHERE claimed_at < ?"
+
+
+class SqliteLeaseBackend(LeaseBackend):
+    """Baux dans une base SQLite (transactions BEGIN IMMEDIATE)."""
+
+    # Réservations conservées (une semaine): au-delà, une clé peut être réutilisée
+    RUNS_RETENTION_SEC = 7 * 86400
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        db_dir = os.path.dirname(db_file)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, timeout=5, isolation_level=None, check_same_thread=False)
+        # Pas de WAL: la base peut être sur un volume partagé entre conteneurs
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(_Statements.CREATE_LEASES)
+        self._conn.execute(_Statements.CREATE_RUNS)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    @staticmethod
+    def _row_to_lease(row) -> Lease | None:
+        return Lease(*row) if row else None
+
+    def try_acquire(self, name: str, owner: str, ttl: float) -> Lease | None:
+        now = time.time()
+        with self._transaction() as conn:
+            lease = self._row_to_lease(conn.execute(_Statements.SELECT, (name,)).fetchone())
+            if lease is not None and lease.expires_at > now and lease.owner != owner:
+                return None
+            # Nouveau détenteur (ou bail expiré): nouveau jeton
+            if lease is not None and lease.owner == owner and lease.expires_at > now:
+                token = lease.token
+            else:
+                token = (lease.token if lease else 0) + 1
+            acquired = Lease(name, owner, token, now + ttl)
+            conn.execute(_Statements.UPSERT, (name, owner, token, acquired.expires_at))
+            return acquired
+
+    def renew(self, lease: Lease, ttl: float) -> Lease | None:
+        now = time.time()
+        expires_at = now + ttl
+        with self._transaction() as conn:
+            updated = conn.execute(
+                _Statements.RENEW, (expires_at, lease.name, lease.owner, lease.token, now)
+            ).rowcount
+        if not updated:
+            return None
+        return Lease(lease.name, lease.owner, lease.token, expires_at)
+
+    def release(self, lease: Lease) -> None:
+        with self._transaction() as conn:
+            conn.execute(_Statements.RELEASE, (lease.name, lease.owner, lease.token))
+
+    def current(self, name: str) -> Lease | None:
+        with self._lock:
+            return self._row_to_lease(self._conn.execute(_Statements.SELECT, (name,)).fetchone())
+
+    def claim(self, lease: Lease, run_key: str) -> bool:
+        now = time.time()
+        with self._transaction() as conn:
+            current = self._row_to_lease(conn.execute(_Statements.SELECT, (lease.name,)).fetchone())
+            if current is None or current.owner != lease.owner or current.token != lease.token \
+                    or current.expires_at <= now:
+                return False
+            conn.execute(_Statements.PURGE_RUNS, (now - self.RUNS_RETENTION_SEC,))
+            return conn.execute(_Statements.CLAIM, (run_key, lease.token, now)).rowcount == 1
+
+    def close(self) -> None:
+        try:
+            self._conn.close()
+        except Exception:
+            pass
+
+
+def default_candidate_id() -> str:
+    """Identifiant de candidat: hôte (conteneur) + pid"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class LeaderElector:
+    """Candidat à un bail: thread qui prend puis renouvelle le bail.
+
+    `on_elected(lease)` et `on_revoked()` sont appelés depuis ce thread.
+    """
+
+    def __init__(
+        self,
+        backend: LeaseBackend,
+        name: str = "scheduler",
+        candidate_id: str | None = None,
+        ttl: float = 30.0,
+        renew_interval: float = 10.0,
+        on_elected: Callable[[Lease], None] | None = None,
+        on_revoked: Callable[[], None] | None = None,
+    ):
+        self.backend = backend
+        self.name = name
+        self.candidate_id = candidate_id or default_candidate_id()
+        self.ttl = ttl
+        self.renew_interval = renew_interval
+        self.on_elected = on_elected
+        self.on_revoked = on_revoked
+        self._lease: Lease | None = None
+        # Fin de validité du bail selon l'horloge monotone locale
+        self._valid_until = 0.0
+        # Dernier bail vu dans le backend (tous détenteurs confondus)
+        self.observed: Lease | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+        self.elections = 0
+        self.revocations = 0
+
+    @property
+    def lease(self) -> Lease | None:
+        return self._lease if self.is_leader() else None
+
+    def is_leader(self) -> bool:
+        """Vrai tant que le bail ne peut pas avoir expiré (horloge monotone)"""
+        return self._lease is not None and time.monotonic() < self._valid_until
+
+    def leader_alive(self) -> bool:
+        """Un leader (ce candidat ou un autre) détenait un bail valide au dernier passage"""
+        if self.is_leader():
+            return True
+        return self.observed is not None and self.observed.expires_at > time.time()
+
+    def claim(self, run_key: str) -> bool:
+        """Réserve une exécution unique (voir LeaseBackend.claim)"""
+        lease = self.lease
+        if lease is None:
+            return False
+        try:
+            return self.backend.claim(lease, run_key)
+        except sqlite3.Error as e:
+            logger.error(f"❌ Réservation impossible ({run_key}): {e}")
+            return False
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="leader-election", daemon=True)
+        self._thread.start()
+
+    def _step(self) -> None:
+        started = time.monotonic()
+        if self._lease is None:
+            lease = self.backend.try_acquire(self.name, self.candidate_id, self.ttl)
+            if lease is None:
+                self.observed = self.backend.current(self.name)
+                return
+            self._lease, self._valid_until = lease, started + self.ttl
+            self.observed = lease
+            self.elections += 1
+            logger.info(f"✅ Élu leader '{self.name}' ({self.candidate_id}, jeton {lease.token})")
+            if self.on_elected:
+                self.on_elected(lease)
+            return
+
+        lease = self.backend.renew(self._lease, self.ttl) if self.is_leader() else None
+        if lease is None:
+            self._revoke("bail perdu ou expiré")
+            return
+        self._lease, self._valid_until = lease, started + self.ttl
+        self.observed = lease
+
+    def _revoke(self, reason: str) -> None:
+        lease, self._lease = self._lease, None
+        self._valid_until = 0.0
+        if lease is None:
+            return
+        self.revocations += 1
+        logger.warning(f"⚠️ Leader '{self.name}' déchu ({self.candidate_id}, jeton {lease.token}): {reason}")
+        if self.on_revoked:
+            try:
+                self.on_revoked()
+            except Exception as e:
+                logger.error(f"❌ Erreur à la perte du leadership: {e}", exc_info=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self._step()
+            except Exception as e:
+                logger.error(f"❌ Erreur d'élection du leader: {e}", exc_info=True)
+                if self._lease is not None and not self.is_leader():
+                    self._revoke("backend injoignable")
+            # Leader: renouvellement régulier; candidat: nouvel essai au même rythme
+            self._stop.wait(self.renew_interval)
+
+    def stop(self, release: bool = True) -> None:
+        """Arrête le thread et rend le bail (un autre candidat le prend sans attendre l'expiration)"""
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(5.0)
+        lease = self._lease
+        self._revoke("arrêt")
+        if release and lease is not None:
+            try:
+                self.backend.release(lease)
+            except Exception as e:
+                logger.warning(f"⚠️ Bail non rendu ({self.name}): {e}")
+
+    def metrics(self) -> dict:
+        observed = self.observed
+        return {
+            "candidate": self.candidate_id,
+            "leader": self.is_leader(),
+            "token": self._lease.token if self._lease else None,
+            "current_owner": observed.owner if observed and observed.expires_at > time.time() else None,
+            "elections": self.elections,
+            "revocations": self.revocations,
+        }
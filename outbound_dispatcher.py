@@ -0,0 +1,215 @@
+"""Répartiteur des messages sortants vers l'API WhatsApp.
+
+Pourquoi:
+- Meta limite le débit par numéro d'envoi; un 429 imposait un `time.sleep()`
+  dans le thread appelant (worker APScheduler ou requête Flask).
+
+Fonctionnement:
+- Un seau à jetons (`TokenBucket`) cale le débit sur `WA_RATE_PER_SEC`.
+- Les appelants reçoivent un `Future` (`submit`); un seul thread planificateur
+  distribue les envois à un petit pool de threads d'envoi.
+- Les retries (429, 5xx, erreurs réseau) sont replanifiés à `now + délai` dans
+  un tas: aucun thread n'est bloqué pendant l'attente. Un 429 suspend aussi le
+  seau pour tous les envois jusqu'à la fin du `Retry-After`.
+- Les alertes passent avant les pings (`PRIORITY_HIGH`).
+"""
+
+from __future__ import annotations
+
+import time
+import heapq
+import logging
+import itertools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable
+
+logger = logging.getLogger("whatsapp_bot")
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+
+
+class TokenBucket:
+    """Seau à jetons: `rate` jetons/s, au plus `burst` d'avance."""
+
+    def __init__(self, rate: float, burst: float | None = None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, now: float) -> float:
+        """Prend un jeton si possible (renvoie 0), sinon renvoie l'attente en secondes."""
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def pause(self, until: float) -> None:
+        """Suspend la distribution de jetons (ex: 429 avec Retry-After)."""
+        self.paused_until = max(self.paused_until, until)
+        self.tokens = 0.0
+
+
+@dataclass
+class Attempt:
+    """Résultat d'une tentative d'envoi.
+
+    `retry_after` à None: résultat final (`response` ou None si échec définitif).
+    Sinon: nouvelle tentative souhaitée après `retry_after` secondes.
+    """
+    response: object | None = None
+    retry_after: float | None = None
+    rate_limited: bool = False
+
+
+@dataclass(order=True)
+class _Job:
+    sort_key: tuple
+    payload: dict = field(compare=False)
+    future: Future = field(compare=False)
+    attempts_left: int = field(compare=False)
+    attempt: int = field(compare=False, default=0)
+    priority: int = field(compare=False, default=PRIORITY_NORMAL)
+    detailed: bool = field(compare=False, default=False)
+
+
+class OutboundDispatcher:
+    """Planificateur unique + pool d'envoi, partagé par tout le process."""
+
+    def __init__(self, send_once: Callable[[dict, int], Attempt], rate: float, senders: int = 8):
+        self.send_once = send_once
+        self.bucket = TokenBucket(rate)
+        self.senders = max(1, senders)
+        self._cond = threading.Condition()
+        self._delayed: list[tuple[float, int, _Job]] = []  # (prêt_à, seq, job)
+        self._ready: list[_Job] = []                       # tas (priorité, seq)
+        self._seq = itertools.count()
+        self._inflight = 0
+        self._pool: ThreadPoolExecutor | None = None
+        self._thread: threading.Thread | None = None
+        self._stopped = False
+
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.rate_limited = 0
+
+    def _ensure_started(self) -> None:
+        """Démarre les threads au premier envoi (après un éventuel fork Gunicorn)."""
+        if self._thread is not None:
+            return
+        self._pool = ThreadPoolExecutor(max_workers=self.senders, thread_name_prefix="wa-send")
+        self._thread = threading.Thread(target=self._run, name="wa-dispatcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, payload: dict, retry: int = 2, priority: int = PRIORITY_NORMAL, detailed: bool = False) -> Future:
+        """Planifie un envoi (`retry` tentatives au total). Renvoie un Future.
+
+        Le Future renvoie la réponse (ou None), ou la dernière `Attempt` si
+        `detailed` (l'appelant distingue alors échec définitif et retry).
+        """
+        future: Future = Future()
+        job = _Job((priority, next(self._seq)), payload, future, max(1, retry), priority=priority, detailed=detailed)
+        with self._cond:
+            if self._stopped:
+                future.set_result(None)
+                return future
+            self._ensure_started()
+            heapq.heappush(self._ready, job)
+            self._cond.notify()
+        return future
+
+    def _run(self) -> None:
+        with self._cond:
+            while not self._stopped:
+                now = time.monotonic()
+                # Les retries arrivés à échéance redeviennent prêts
+                while self._delayed and self._delayed[0][0] <= now:
+                    _, _, job = heapq.heappop(self._delayed)
+                    heapq.heappush(self._ready, job)
+
+                timeout = None
+                if self._delayed:
+                    timeout = self._delayed[0][0] - now
+
+                if self._ready and self._inflight < self.senders:
+                    wait = self.bucket.try_take(now)
+                    if wait == 0:
+                        job = heapq.heappop(self._ready)
+                        self._inflight += 1
+                        self._pool.submit(self._send, job)
+                        continue
+                    timeout = wait if timeout is None else min(timeout, wait)
+
+                self._cond.wait(timeout)
+
+    def _send(self, job: _Job) -> None:
+        try:
+            result = self.send_once(job.payload, job.attempt)
+        except Exception as e:
+            logger.error(f"❌ Erreur inattendue lors de l'envoi: {e}", exc_info=True)
+            result = Attempt()
+
+        with self._cond:
+            self._inflight -= 1
+            if result.rate_limited:
+                self.rate_limited += 1
+                if result.retry_after:
+                    self.bucket.pause(time.monotonic() + result.retry_after)
+
+            job.attempt += 1
+            job.attempts_left -= 1
+            if result.retry_after is not None and job.attempts_left > 0 and not self._stopped:
+                # Retry planifié, sans bloquer de thread
+                self.retries += 1
+                ready_at = time.monotonic() + result.retry_after
+                job.sort_key = (job.priority, next(self._seq))
+                heapq.heappush(self._delayed, (ready_at, next(self._seq), job))
+                self._cond.notify()
+                return
+
+            if result.response is not None:
+                self.sent += 1
+            else:
+                self.failed += 1
+            self._cond.notify()
+
+        job.future.set_result(result if job.detailed else result.response)
+
+    def stop(self) -> None:
+        """Arrêt: les envois en attente se terminent en échec (None)."""
+        with self._cond:
+            self._stopped = True
+            pending = [job for _, _, job in self._delayed] + list(self._ready)
+            self._delayed.clear()
+            self._ready.clear()
+            self._cond.notify_all()
+        for job in pending:
+            if not job.future.done():
+                job.future.set_result(None)
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=False)
+
+    def metrics(self) -> dict:
+        with self._cond:
+            return {
+                "ready": len(self._ready),
+                "delayed": len(self._delayed),
+                "inflight": self._inflight,
+                "sent": self.sent,
+                "failed": self.failed,
+                "retries": self.retries,
+                "rate_limited": self.rate_limited,
+                "rate_per_sec": self.bucket.rate,
+            }
@@ -0,0 +1,612 @@
+"""File d'envoi durable (outbox) pour les pings et les alertes.
+
+Pourquoi:
+- Une alerte était réservée (`mark_alert_sent`) puis confiée au répartiteur
+  en mémoire, avec deux tentatives: un crash du process ou une API Graph
+  indisponible quelques minutes, et l'alerte était perdue.
+
+Fonctionnement:
+- Chaque message est d'abord écrit dans une table SQLite (`outbox`, WAL,
+  fsync à chaque commit), un lot de messages par transaction.
+- Un thread de vidage réserve les messages dus par lots (statut `sending`
+  jusqu'à l'échéance de la réservation, prolongée tant que l'envoi est en
+  cours) et les confie au répartiteur (débit Meta, alertes prioritaires) sans
+  attendre leur issue: chaque envoi terminé est signalé par son Future, et les
+  résultats accumulés sont écrits en une transaction au tour suivant. Une
+  alerte mise en file pendant un gros lot de pings est réservée aussitôt, même
+  quand le plafond de messages en cours (`max_inflight`) est atteint.
+- Échec temporaire (réseau, 5xx, 429): nouvel essai après un délai
+  exponentiel plafonné, avec gigue, au plus `max_attempts` tentatives. Erreur
+  définitive (400, 401...): `failed` sans nouvel essai.
+- Clé de déduplication optionnelle (unique): remettre en file la même alerte
+  (reprise après crash, minuteur et balayage concurrents) ne crée pas de
+  second envoi.
+- Un message réservé par un process mort redevient dû à l'expiration de sa
+  réservation: livraison au moins une fois.
+- L'issue finale (`sent` avec l'id wamid, ou `failed`) est notifiée aux
+  handlers enregistrés par type de message (`register_handler`), y compris
+  pour les messages repris après un redémarrage.
+- Les statuts de livraison renvoyés ensuite par Meta (webhook `statuses`)
+  sont rattachés au message par son wamid (`apply_status`): horodatages
+  d'acceptation par l'API, de remise et de lecture (delivery_tracker.py).
+- Un type de message peut avoir son propre transport (`register_transport`,
+  ex: canal de secours des alertes); WhatsApp par défaut.
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import time
+import random
+import logging
+import sqlite3
+import threading
+import functools
+import contextlib
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Callable
+
+from outbound_dispatcher import Attempt, PRIORITY_HIGH, PRIORITY_NORMAL
+from telemetry import Gauge
+
+logger = logging.getLogger("whatsapp_bot")
+
+# Types de messages
+KIND_PING = "ping"
+KIND_ALERT = "alert"
+
+STATUS_PENDING = "pending"
+STATUS_SENDING = "sending"
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+
+
+@dataclass(frozen=True)
+class OutboxMessage:
+    """Message à mettre en file (`dedup_key` à None: aucun dédoublonnage)"""
+    kind: str
+    recipient: str
+    payload: dict
+    tenant_id: str | None = None
+    priority: int = PRIORITY_NORMAL
+    dedup_key: str | None = None
+
+
+@dataclass(frozen=True)
+class OutboxEntry:
+    """Message réservé pour un envoi (`attempts`: tentatives, celle-ci comprise)"""
+    id: int
+    kind: str
+    tenant_id: str | None
+    recipient: str
+    payload: dict
+    priority: int
+    attempts: int
+
+
+@dataclass(frozen=True)
+class _Outcome:
+    entry: OutboxEntry
+    status: str
+    message_id: str | None = None
+    error: str | None = None
+    next_attempt_at: float | None = None
+
+
+class _Statements:
+    CREATE = """
+        CREATE TABLE IF NOT EXISTS outbox (
+            id              INTEGER PRIMARY KEY,
+            kind            TEXT NOT NULL,
+            tenant_id       TEXT,
+            recipient       TEXT NOT NULL,
+            payload         TEXT NOT NULL,
+            priority        INTEGER NOT NULL,
+            dedup_key       TEXT UNIQUE,
+            status          TEXT NOT NULL,
+            attempts        INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            created_at      REAL NOT NULL,
+            updated_at      REAL NOT NULL,
+            message_id      TEXT,
+            last_error      TEXT,
+            sent_at         REAL,
+            wa_sent_at      REAL,
+            delivered_at    REAL,
+            read_at         REAL,
+            failed_at       REAL,
+            delivery_status TEXT,
+            delivery_error  TEXT
+        )
+    """
+    # Colonnes ajoutées au suivi de livraison (bases créées avant: ALTER TABLE)
+    DELIVERY_COLUMNS = (
+        ("sent_at", "REAL"), ("wa_sent_at", "REAL"), ("delivered_at", "REAL"), ("read_at", "REAL"),
+        ("failed_at", "REAL"), ("delivery_status", "TEXT"), ("delivery_error", "TEXT"),
+    )
+    CREATE_MESSAGE_ID_INDEX = """
+        CREATE INDEX IF NOT EXISTS outbox_message_id ON outbox (message_id)
+        WHERE message_id IS NOT NULL
+    """
+    CREATE_SENT_AT_INDEX = """
+        CREATE INDEX IF NOT EXISTS outbox_sent_at ON outbox (sent_at)
+        WHERE sent_at IS NOT NULL
+    """
+    # Seuls les messages non finalisés sont indexés (file courte, lue en continu)
+    CREATE_DUE_INDEX = """
+        CREATE INDEX IF NOT EXISTS outbox_due ON outbox (next_attempt_at)
+        WHERE status IN ('pending', 'sending')
+    """
+    INSERT = """
+        INSERT OR IGNORE INTO outbox
+            (kind, tenant_id, recipient, payload, priority, dedup_key, status, next_attempt_at, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, 'pending', ?, ?, ?)
+    """
+    # Réservation d'un lot: `next_attempt_at` devient l'échéance de la réservation
+    CLAIM = """
+        UPDATE outbox SET status = 'sending', next_attempt_at = ?, attempts = attempts + 1, updated_at = ?
+        WHERE id IN (
+            SELECT id FROM outbox
+            WHERE status IN ('pending', 'sending') AND next_attempt_at <= ? AND priority <= ?
+            ORDER BY priority, next_attempt_at
+            LIMIT ?
+        )
+        RETURNING id, kind, tenant_id, recipient, payload, priority, attempts
+    """
+    # Envoi encore en cours: la réservation est prolongée
+    RENEW = """
+        UPDATE outbox SET next_attempt_at = ?, updated_at = ?
+        WHERE id = ? AND status = 'sending'
+    """
+    SENT = """
+        UPDATE outbox SET status = 'sent', message_id = ?, last_error = NULL, sent_at = ?, updated_at = ?
+        WHERE id = ? AND status = 'sending'
+    """
+    RETRY = """
+        UPDATE outbox SET status = 'pending', next_attempt_at = ?, last_error = ?, updated_at = ?
+        WHERE id = ? AND status = 'sending'
+    """
+    FAILED = """
+        UPDATE outbox SET status = 'failed', last_error = ?, updated_at = ?
+        WHERE id = ? AND status = 'sending'
+    """
+    BACKLOG = """
+        SELECT status, COUNT(*), MIN(created_at) FROM outbox
+        WHERE status IN ('pending', 'sending') GROUP BY status
+    """
+    PURGE = "DELETE FROM outbox WHERE status IN ('sent', 'failed') AND updated_at < ?"
+    BY_MESSAGE_ID = """
+        SELECT id, kind, tenant_id, recipient, payload, priority, attempts, delivery_status, failed_at
+        FROM outbox WHERE message_id = ?
+    """
+    # Colonne d'horodatage par statut Meta (liste fermée: interpolée dans SET_STATUS)
+    STATUS_COLUMNS = {"sent": "wa_sent_at", "delivered": "delivered_at", "read": "read_at", "failed": "failed_at"}
+    SET_STATUS = """
+        UPDATE outbox SET {column} = COALESCE({column}, ?), delivery_status = ?,
+            delivery_error = COALESCE(?, delivery_error), updated_at = ?
+        WHERE id = ?
+    """
+    DELIVERY_WINDOW = """
+        SELECT kind, created_at, sent_at, delivered_at, read_at, failed_at FROM outbox
+        WHERE sent_at >= ?
+    """
+    RECENT_FAILURES = """
+        SELECT id, kind, tenant_id, recipient, message_id, status, delivery_status,
+               COALESCE(delivery_error, last_error), updated_at
+        FROM outbox
+        WHERE updated_at >= ? AND (status = 'failed' OR delivery_status = 'failed')
+        ORDER BY updated_at DESC LIMIT ?
+    """
+
+# Ordre des statuts Meta (un statut arrivé en retard ne fait pas reculer le message)
+_STATUS_RANK = {"sent": 1, "delivered": 2, "read": 3, "failed": 4}
+
+
+def _message_id(response) -> str | None:
+    """Identifiant wamid renvoyé par l'API Graph (None si illisible)"""
+    try:
+        return response.json()["messages"][0]["id"]
+    except Exception:
+        return None
+
+
+# Handlers d'issue finale par type de message: handler(entry, delivered)
+_handlers: dict[str, list[Callable[[OutboxEntry, bool], None]]] = {}
+# Transports par type de message: submit(payload, priority) -> Future[Attempt]
+_transports: dict[str, Callable[[dict, int], Future]] = {}
+
+
+def register_handler(kind: str, handler: Callable[[OutboxEntry, bool], None]) -> None:
+    """Appelé à la livraison (True) ou à l'échec définitif (False) d'un message `kind`"""
+    _handlers.setdefault(kind, []).append(handler)
+
+
+def register_transport(kind: str, submit: Callable[[dict, int], Future]) -> None:
+    """Transport des messages `kind` (au lieu de l'API WhatsApp)"""
+    _transports[kind] = submit
+
+
+class Outbox:
+    """Table outbox (SQLite) + thread de vidage vers le répartiteur d'envois."""
+
+    # Réservation d'un lot: au-delà, un message non finalisé redevient dû
+    CLAIM_TTL_SEC = 120.0
+    PURGE_INTERVAL_SEC = 3600.0
+
+    def __init__(
+        self,
+        db_file: str,
+        submit: Callable[[dict, int], Future],
+        batch_size: int = 100,
+        max_attempts: int = 15,
+        backoff_base: float = 5.0,
+        backoff_max: float = 900.0,
+        retention_days: int = 7,
+        poll_interval: float = 1.0,
+    ):
+        self.db_file = db_file
+        db_dir = os.path.dirname(db_file)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.submit = submit
+        self.batch_size = max(1, batch_size)
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retention_sec = retention_days * 86400
+        self.poll_interval = poll_interval
+        # Messages confiés au répartiteur et pas encore finalisés (hors alertes)
+        self.max_inflight = 2 * self.batch_size
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, timeout=5, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Alertes: chaque mise en file est durable avant de rendre la main
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(_Statements.CREATE)
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")}
+        for column, sql_type in _Statements.DELIVERY_COLUMNS:
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE outbox ADD COLUMN {column} {sql_type}")
+        self._conn.execute(_Statements.CREATE_DUE_INDEX)
+        self._conn.execute(_Statements.CREATE_MESSAGE_ID_INDEX)
+        self._conn.execute(_Statements.CREATE_SENT_AT_INDEX)
+
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._thread_lock = threading.Lock()
+        self._next_purge = 0.0
+        self._inflight: dict[int, float] = {}  # id -> dernière réservation (thread de vidage)
+        self._completed: list[_Outcome] = []  # issues en attente d'écriture
+        self._completed_lock = threading.Lock()
+
+        self.enqueued = 0
+        self.deduplicated = 0
+        self.batches = 0
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    # ---------- Mise en file ----------
+
+    def enqueue(self, messages: list[OutboxMessage]) -> int:
+        """Écrit les messages en une transaction et réveille le vidage.
+
+        Renvoie le nombre de messages ajoutés (les clés de déduplication déjà
+        présentes sont ignorées). Une erreur SQLite remonte à l'appelant: le
+        message n'est pas en file.
+        """
+        if not messages:
+            return 0
+        now = time.time()
+        rows = [
+            (m.kind, m.tenant_id, m.recipient, json.dumps(m.payload, separators=(",", ":")),
+             m.priority, m.dedup_key, now, now, now)
+            for m in messages
+        ]
+        with self._transaction() as conn:
+            added = conn.executemany(_Statements.INSERT, rows).rowcount
+        self.enqueued += added
+        self.deduplicated += len(messages) - added
+        self.start()
+        self._wake.set()
+        return added
+
+    # ---------- Vidage ----------
+
+    def _claim(self, limit: int, max_priority: int) -> list[OutboxEntry]:
+        now = time.time()
+        with self._transaction() as conn:
+            rows = conn.execute(
+                _Statements.CLAIM, (now + self.CLAIM_TTL_SEC, now, now, max_priority, limit)
+            ).fetchall()
+        entries = [
+            OutboxEntry(id_, kind, tenant_id, recipient, json.loads(payload), priority, attempts)
+            for id_, kind, tenant_id, recipient, payload, priority, attempts in rows
+        ]
+        # RETURNING ne garantit pas l'ordre: alertes d'abord
+        entries.sort(key=lambda e: (e.priority, e.id))
+        return entries
+
+    def _backoff(self, attempts: int, retry_after: float | None) -> float:
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+        return max(delay, retry_after or 0.0)
+
+    def _outcome(self, entry: OutboxEntry, future: Future) -> _Outcome:
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.error(f"❌ Erreur d'envoi du message {entry.id} ({entry.kind}): {e}", exc_info=True)
+            result = None
+
+        if isinstance(result, Attempt) and result.response is not None:
+            return _Outcome(entry, STATUS_SENT, message_id=_message_id(result.response))
+        if isinstance(result, Attempt) and result.retry_after is None:
+            return _Outcome(entry, STATUS_FAILED, error="erreur définitive de l'API")
+
+        if result is None:
+            error = "non envoyé (arrêt ou configuration)"
+        elif result.rate_limited:
+            error = "rate limit (429)"
+        else:
+            error = "échec temporaire (réseau ou 5xx)"
+        if entry.attempts >= self.max_attempts:
+            return _Outcome(entry, STATUS_FAILED, error=f"{error}, {entry.attempts} tentative(s)")
+        retry_after = result.retry_after if isinstance(result, Attempt) else None
+        return _Outcome(
+            entry, STATUS_PENDING, error=error,
+            next_attempt_at=time.time() + self._backoff(entry.attempts, retry_after),
+        )
+
+    def _finalize(self, outcomes: list[_Outcome]) -> None:
+        """Écrit les résultats d'un lot en une transaction puis notifie les handlers"""
+        now = time.time()
+        with self._transaction() as conn:
+            for o in outcomes:
+                if o.status == STATUS_SENT:
+                    conn.execute(_Statements.SENT, (o.message_id, now, now, o.entry.id))
+                elif o.status == STATUS_FAILED:
+                    conn.execute(_Statements.FAILED, (o.error, now, o.entry.id))
+                else:
+                    conn.execute(_Statements.RETRY, (o.next_attempt_at, o.error, now, o.entry.id))
+
+        for o in outcomes:
+            if o.status == STATUS_PENDING:
+                self.retries += 1
+                logger.warning(
+                    f"⚠️ Message {o.entry.id} ({o.entry.kind}) non envoyé: {o.error}, "
+                    f"nouvel essai dans {o.next_attempt_at - now:.0f}s"
+                )
+                continue
+            delivered = o.status == STATUS_SENT
+            if delivered:
+                self.sent += 1
+            else:
+                self.failed += 1
+                logger.error(f"❌ Message {o.entry.id} ({o.entry.kind}) abandonné: {o.error}")
+            for handler in _handlers.get(o.entry.kind, ()):
+                try:
+                    handler(o.entry, delivered)
+                except Exception as e:
+                    logger.error(f"❌ Erreur du handler outbox '{o.entry.kind}': {e}", exc_info=True)
+
+    def _on_done(self, entry: OutboxEntry, future: Future) -> None:
+        """Issue d'un envoi (thread d'envoi): écrite par le thread de vidage"""
+        outcome = self._outcome(entry, future)
+        with self._completed_lock:
+            self._completed.append(outcome)
+        self._wake.set()
+
+    def _finalize_completed(self) -> int:
+        """Écrit en une transaction les issues arrivées depuis le dernier tour"""
+        with self._completed_lock:
+            outcomes, self._completed = self._completed, []
+        if not outcomes:
+            return 0
+        for o in outcomes:
+            self._inflight.pop(o.entry.id, None)
+        self._finalize(outcomes)
+        return len(outcomes)
+
+    def _renew_claims(self, now: float) -> None:
+        """Prolonge la réservation des envois en cours depuis une demi-échéance"""
+        stale = [id_ for id_, claimed_at in self._inflight.items() if now - claimed_at >= self.CLAIM_TTL_SEC / 2]
+        if not stale:
+            return
+        with self._transaction() as conn:
+            conn.executemany(_Statements.RENEW, [(now + self.CLAIM_TTL_SEC, now, id_) for id_ in stale])
+        for id_ in stale:
+            self._inflight[id_] = now
+
+    def drain_once(self) -> int:
+        """Écrit les issues terminées, puis réserve et confie un lot de messages
+        dus sans attendre leur envoi. Renvoie le nombre de messages réservés."""
+        self._finalize_completed()
+        now = time.time()
+        self._renew_claims(now)
+        room = self.max_inflight - len(self._inflight)
+        if room > 0:
+            entries = self._claim(min(self.batch_size, room), PRIORITY_NORMAL)
+        else:
+            # Plafond atteint (pings lents): les alertes ne l'attendent pas
+            entries = self._claim(self.batch_size, PRIORITY_HIGH)
+        if not entries:
+            self._purge_if_due()
+            return 0
+        self.batches += 1
+        for entry in entries:
+            self._inflight[entry.id] = now
+            future = _transports.get(entry.kind, self.submit)(entry.payload, entry.priority)
+            future.add_done_callback(functools.partial(self._on_done, entry))
+        return len(entries)
+
+    def _purge_if_due(self) -> None:
+        now = time.time()
+        if now < self._next_purge:
+            return
+        self._next_purge = now + self.PURGE_INTERVAL_SEC
+        with self._transaction() as conn:
+            purged = conn.execute(_Statements.PURGE, (now - self.retention_sec,)).rowcount
+        if purged:
+            logger.info(f"🔧 Outbox: {purged} message(s) finalisé(s) purgé(s)")
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wake.clear()
+            try:
+                drained = self.drain_once()
+            except Exception as e:
+                logger.error(f"❌ Erreur de vidage de l'outbox: {e}", exc_info=True)
+                drained = 0
+            # Lot complet: la suite est probablement déjà due
+            if drained < self.batch_size:
+                # Sans réveil local, relecture périodique (messages d'un autre process, retries)
+                self._wake.wait(self.poll_interval)
+
+    def start(self) -> None:
+        """Démarre le vidage (au premier envoi, ou au démarrage pour reprendre la file)"""
+        with self._thread_lock:
+            if self._thread is None and not self._stopped.is_set():
+                self._thread = threading.Thread(target=self._run, name="outbox", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Arrête le vidage; les messages non finalisés restent en file"""
+        self._stopped.set()
+        self._wake.set()
+        with self._thread_lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+            if thread.is_alive():
+                return
+        # Issues déjà connues: écrites; les envois encore en cours seront repris
+        try:
+            self._finalize_completed()
+        except Exception as e:
+            logger.error(f"❌ Erreur d'écriture des derniers envois de l'outbox: {e}", exc_info=True)
+
+    # ---------- Statuts de livraison (webhook Meta) ----------
+
+    def apply_status(self, message_id: str, status: str, ts: float, error: str | None = None) -> tuple[OutboxEntry, bool] | None:
+        """Rattache un statut Meta au message `message_id`.
+
+        Renvoie (message, premier échec) ou None si le wamid est inconnu
+        (message envoyé hors outbox, ou purgé).
+        """
+        column = _Statements.STATUS_COLUMNS.get(status)
+        if column is None:
+            return None
+        with self._transaction() as conn:
+            row = conn.execute(_Statements.BY_MESSAGE_ID, (message_id,)).fetchone()
+            if row is None:
+                return None
+            id_, kind, tenant_id, recipient, payload, priority, attempts, current, failed_at = row
+            if _STATUS_RANK.get(current, 0) > _STATUS_RANK[status]:
+                status = current
+            conn.execute(_Statements.SET_STATUS.format(column=column), (ts, status, error, time.time(), id_))
+        entry = OutboxEntry(id_, kind, tenant_id, recipient, json.loads(payload), priority, attempts)
+        return entry, column == "failed_at" and failed_at is None
+
+    def delivery_rows(self, since: float) -> list[tuple]:
+        """(kind, créé, accepté par l'API, remis, lu, échec) des messages acceptés depuis `since`"""
+        with self._lock:
+            return self._conn.execute(_Statements.DELIVERY_WINDOW, (since,)).fetchall()
+
+    def recent_failures(self, since: float, limit: int = 20) -> list[dict]:
+        with self._lock:
+            rows = self._conn.execute(_Statements.RECENT_FAILURES, (since, limit)).fetchall()
+        return [
+            {
+                "id": id_, "kind": kind, "tenant": tenant_id, "recipient": recipient,
+                "message_id": message_id, "status": status, "delivery_status": delivery_status,
+                "error": error, "at": round(updated_at, 3),
+            }
+            for id_, kind, tenant_id, recipient, message_id, status, delivery_status, error, updated_at in rows
+        ]
+
+    def metrics(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute(_Statements.BACKLOG).fetchall()
+        backlog = {status: (count, oldest) for status, count, oldest in rows}
+        oldest = min((o for _, o in backlog.values() if o is not None), default=None)
+        return {
+            "pending": backlog.get(STATUS_PENDING, (0, None))[0],
+            "sending": backlog.get(STATUS_SENDING, (0, None))[0],
+            "oldest_pending_age_s": round(time.time() - oldest, 3) if oldest is not None else None,
+            "enqueued": self.enqueued,
+            "deduplicated": self.deduplicated,
+            "batches": self.batches,
+            "inflight": len(self._inflight),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+        }
+
+    def close(self) -> None:
+        try:
+            self._conn.close()
+        except Exception:
+            pass
+
+
+# Singleton : une connexion et un thread de vidage par process (ouverts au premier usage).
+_outbox: Outbox | None = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox() -> Outbox:
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            from config import (
+                OUTBOX_DB_FILE, OUTBOX_BATCH_SIZE, OUTBOX_MAX_ATTEMPTS,
+                OUTBOX_BACKOFF_BASE_SEC, OUTBOX_BACKOFF_MAX_SEC, OUTBOX_RETENTION_DAYS,
+            )
+            from whatsapp_api import wa_submit
+            import alert_fallback  # noqa: F401  (transport du canal de secours)
+
+            _outbox = Outbox(
+                OUTBOX_DB_FILE,
+                # Une tentative par réservation: les retries sont planifiés par l'outbox
+                lambda payload, priority: wa_submit(payload, retry=1, priority=priority, detailed=True),
+                batch_size=OUTBOX_BATCH_SIZE,
+                max_attempts=OUTBOX_MAX_ATTEMPTS,
+                backoff_base=OUTBOX_BACKOFF_BASE_SEC,
+                backoff_max=OUTBOX_BACKOFF_MAX_SEC,
+                retention_days=OUTBOX_RETENTION_DAYS,
+            )
+        return _outbox
+
+
+def _backlog() -> dict:
+    if _outbox is None:
+        return {}
+    metrics = _outbox.metrics()
+    return {STATUS_PENDING: metrics["pending"], STATUS_SENDING: metrics["sending"]}
+
+
+# Base partagée par les workers: même valeur lue partout (max, pas somme)
+Gauge("outbox_messages", "Messages de l'outbox en attente d'envoi, par statut", _backlog, ("status",), aggregate="max")
+
+
+def stop_outbox() -> None:
+    """Arrêt du vidage s'il a été démarré dans ce process"""
+    with _outbox_lock:
+        outbox = _outbox
+    if outbox is not None:
+        outbox.stop()
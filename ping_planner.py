@@ -0,0 +1,52 @@
+"""Planification des pings quotidiens sur une fenêtre d'envoi.
+
+Pourquoi:
+- Tous les tenants d'un même créneau (timezone, heure) partaient à HH:00 pile:
+  avec beaucoup de personnes suivies, tout arrive sur l'API Graph dans la
+  même seconde.
+
+Fonctionnement:
+- Chaque tenant reçoit un décalage déterministe dans la fenêtre
+  (`PING_WINDOW_MIN`), dérivé d'un hash de son id: il est pingé à la même
+  heure chaque jour, sans état à stocker.
+- Les tenants triés par décalage sont regroupés en lots de `PING_BATCH_SIZE`;
+  chaque lot devient un job APScheduler ponctuel à l'heure de son premier
+  membre (voir scheduler_service.py).
+- La deadline de chaque tenant reste calculée à l'envoi effectif du ping.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from dataclasses import dataclass
+
+_HASH_SPACE = float(1 << 64)
+
+
+def ping_offset(tenant_id: str, window_sec: float) -> float:
+    """Décalage (secondes) du ping d'un tenant dans la fenêtre, dans [0, window_sec)."""
+    if window_sec <= 0:
+        return 0.0
+    digest = hashlib.blake2b(tenant_id.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / _HASH_SPACE * window_sec
+
+
+@dataclass(frozen=True)
+class PingBatch:
+    """Lot de tenants à pinger `offset_sec` secondes après le début de la fenêtre."""
+    offset_sec: float
+    tenant_ids: tuple[str, ...]
+
+
+def plan_ping_batches(tenant_ids: list[str], window_sec: float, batch_size: int) -> list[PingBatch]:
+    """Répartit les tenants en lots ordonnés sur la fenêtre d'envoi.
+
+    Fenêtre nulle: un seul lot immédiat par tranche de `batch_size`.
+    """
+    batch_size = max(1, batch_size)
+    ordered = sorted((ping_offset(tid, window_sec), tid) for tid in tenant_ids)
+    batches = []
+    for i in range(0, len(ordered), batch_size):
+        chunk = ordered[i:i + batch_size]
+        batches.append(PingBatch(chunk[0][0], tuple(tid for _, tid in chunk)))
+    return batches
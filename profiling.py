@@ -0,0 +1,360 @@
+"""Profilage intégré: spans des opérations clés, journal des lenteurs et profileur.
+
+Pourquoi:
+- Quand le bot se bloque (attente sur l'API Graph, fsync lent sur un volume
+  réseau), les métriques disent *combien* de temps, pas *où* il est passé.
+
+Fonctionnement:
+- `traced(nom)` mesure durée (horloge murale) et temps CPU du thread pour les
+  opérations clés: `incoming`, `daily_ping`, `check_deadline`,
+  `_save_state_internal`, `wa_call`. Désactivé (PROFILE_SPANS=false), le
+  décorateur se limite à un test de booléen.
+- Un thread de surveillance échantillonne la pile des spans en cours depuis
+  plus d'un quart de SLOW_OP_THRESHOLD_MS: une opération lente est journalisée
+  avec sa pile la plus fréquente (CPU faible = attente: réseau, lock, fsync).
+- Le profileur par échantillonnage (`/debug/profile/start`) relève la pile de
+  tous les threads toutes les PROFILE_SAMPLE_INTERVAL_MS ms (`sys._current_frames`,
+  sans dépendance) et produit des piles repliées (« folded »), lues par
+  flamegraph.pl, speedscope ou inferno. Le résultat est écrit dans PROFILE_DIR:
+  le téléchargement fonctionne quel que soit le worker Gunicorn qui répond.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import glob
+import time
+import logging
+import datetime
+import functools
+import threading
+import traceback
+from collections import Counter, deque
+
+from config import (
+    PROFILE_SPANS, PROFILE_DIR, SLOW_OP_THRESHOLD_MS,
+    PROFILE_SAMPLE_INTERVAL_MS, PROFILE_MAX_DURATION_SEC,
+)
+from telemetry import SPAN_CPU, SPAN_WALL
+
+logger = logging.getLogger("whatsapp_bot")
+
+# Opérations lentes conservées pour /debug/profile
+SLOW_LOG_SIZE = 50
+# Piles relevées au plus par span (et lignes affichées par pile)
+MAX_SPAN_SAMPLES = 100
+STACK_DEPTH = 15
+# Profils conservés dans PROFILE_DIR
+PROFILE_KEEP = 10
+
+
+def _format_stack(frame) -> tuple[str, ...]:
+    """Pile d'un thread, de l'appelant le plus ancien à la frame courante"""
+    return tuple(
+        f"{os.path.basename(fs.filename)}:{fs.lineno} {fs.name}"
+        for fs in traceback.extract_stack(frame)[-STACK_DEPTH:]
+    )
+
+
+class _Span:
+    __slots__ = ("name", "thread_id", "started", "cpu_started", "samples")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.thread_id = threading.get_ident()
+        self.samples: list[tuple[str, ...]] = []
+        self.cpu_started = time.thread_time()
+        self.started = time.perf_counter()
+
+
+class SpanTracker:
+    """Spans en cours, agrégats par opération et journal des opérations lentes."""
+
+    def __init__(self, threshold_sec: float, enabled: bool = False):
+        self.enabled = enabled
+        self.threshold = threshold_sec
+        # Échantillonnage des spans en cours: quatre piles au moins avant le seuil
+        self.sample_interval = min(max(threshold_sec / 4, 0.01), 1.0)
+        self._lock = threading.Lock()
+        self._active: dict[int, _Span] = {}
+        self._stats: dict[str, list] = {}  # nom -> [nombre, durée, CPU, max, lentes]
+        self.slow_ops: deque = deque(maxlen=SLOW_LOG_SIZE)
+        self._watchdog: threading.Thread | None = None
+
+    def start(self, name: str) -> _Span:
+        span = _Span(name)
+        with self._lock:
+            self._active[id(span)] = span
+            if self._watchdog is None:
+                self._watchdog = threading.Thread(target=self._watch, name="span-watchdog", daemon=True)
+                self._watchdog.start()
+        return span
+
+    def finish(self, span: _Span) -> None:
+        wall = time.perf_counter() - span.started
+        cpu = time.thread_time() - span.cpu_started
+        slow = wall >= self.threshold
+        with self._lock:
+            self._active.pop(id(span), None)
+            stats = self._stats.get(span.name)
+            if stats is None:
+                stats = self._stats[span.name] = [0, 0.0, 0.0, 0.0, 0]
+            stats[0] += 1
+            stats[1] += wall
+            stats[2] += cpu
+            stats[3] = max(stats[3], wall)
+            stats[4] += slow
+        SPAN_WALL.observe(wall, span.name)
+        SPAN_CPU.observe(cpu, span.name)
+        if slow:
+            self._record_slow(span, wall, cpu)
+
+    def _record_slow(self, span: _Span, wall: float, cpu: float) -> None:
+        stack = Counter(span.samples).most_common(1)[0][0] if span.samples else ()
+        thread = threading.current_thread().name
+        self.slow_ops.append({
+            "span": span.name,
+            "at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "wall_ms": round(wall * 1000, 1),
+            "cpu_ms": round(cpu * 1000, 1),
+            "thread": thread,
+            "samples": len(span.samples),
+            "stack": list(stack),
+        })
+        where = "\n    ".join(stack) if stack else "(pile non échantillonnée)"
+        logger.warning(
+            f"⚠️ Opération lente: {span.name} {wall * 1000:.0f} ms "
+            f"(CPU {cpu * 1000:.0f} ms, thread {thread}, {len(span.samples)} échantillon(s))\n    {where}"
+        )
+
+    def _watch(self) -> None:
+        """Relève la pile des spans qui durent (thread daemon)"""
+        while True:
+            time.sleep(self.sample_interval)
+            now = time.perf_counter()
+            with self._lock:
+                running = [s for s in self._active.values() if now - s.started >= self.sample_interval]
+            if not running:
+                continue
+            frames = sys._current_frames()
+            for span in running:
+                frame = frames.get(span.thread_id)
+                if frame is not None and len(span.samples) < MAX_SPAN_SAMPLES:
+                    span.samples.append(_format_stack(frame))
+            del frames
+
+    def stats(self) -> dict:
+        with self._lock:
+            items = sorted(self._stats.items())
+            active = [(s.name, time.perf_counter() - s.started) for s in self._active.values()]
+        return {
+            "enabled": self.enabled,
+            "slow_threshold_ms": self.threshold * 1000,
+            "spans": {
+                name: {
+                    "count": count,
+                    "wall_avg_ms": round(wall / count * 1000, 2),
+                    "cpu_avg_ms": round(cpu / count * 1000, 2),
+                    "wall_max_ms": round(wall_max * 1000, 1),
+                    "slow": slow,
+                }
+                for name, (count, wall, cpu, wall_max, slow) in items
+            },
+            "active": [{"span": name, "running_ms": round(age * 1000, 1)} for name, age in active],
+            "slow_ops": list(self.slow_ops),
+        }
+
+    def reset_after_fork(self) -> None:
+        self._lock = threading.Lock()
+        self._active.clear()
+        self._watchdog = None
+
+
+class SamplingProfiler:
+    """Profileur par échantillonnage de tous les threads du process."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._labels: dict = {}  # code -> libellé de frame
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.interval = 0.0
+        self.started_at: float | None = None
+        self.stopped_at: float | None = None
+        self.path: str | None = None
+
+    @property
+    def stop_flag(self) -> str:
+        # Arrêt demandé par un autre worker (voir request_stop)
+        return os.path.join(self.directory, "stop")
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_sec: float, duration_sec: float) -> bool:
+        """Démarre un profil (False si un profil est déjà en cours dans ce process)"""
+        with self._lock:
+            if self.running:
+                return False
+            os.makedirs(self.directory, exist_ok=True)
+            try:
+                os.remove(self.stop_flag)
+            except FileNotFoundError:
+                pass
+            self.stacks = Counter()
+            self.samples = 0
+            self.interval = interval_sec
+            self.started_at = time.time()
+            self.stopped_at = None
+            self.path = None
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, args=(duration_sec,), name="sampling-profiler", daemon=True,
+            )
+            self._thread.start()
+        logger.info(
+            f"🔧 Profil démarré (pid {os.getpid()}, {interval_sec * 1000:g} ms, {duration_sec:g} s max)"
+        )
+        return True
+
+    def request_stop(self) -> bool:
+        """Arrête le profil de ce process, ou le signale aux autres (fichier `stop`)"""
+        if self.running:
+            self._stop.set()
+            self._thread.join(timeout=5)
+            return True
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.stop_flag, "w"):
+            pass
+        return False
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def _run(self, duration_sec: float) -> None:
+        me = threading.get_ident()
+        deadline = time.monotonic() + duration_sec
+        names: dict[int, str] = {}
+        next_check = 0.0
+        while not self._stop.wait(self.interval):
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            if now >= next_check:
+                # Une fois par seconde: noms des threads, arrêt demandé par un autre worker
+                names = {t.ident: t.name for t in threading.enumerate()}
+                next_check = now + 1.0
+                if os.path.exists(self.stop_flag):
+                    break
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                stack.reverse()
+                self.stacks[";".join(stack)] += 1
+            self.samples += 1
+        self.stopped_at = time.time()
+        self._save()
+
+    def folded(self, thread_prefix: str = "") -> str:
+        """Piles repliées: `thread;appelant;...;fonction <nombre>` par ligne"""
+        return "".join(
+            f"{stack} {count}\n"
+            for stack, count in sorted(self.stacks.items())
+            if stack.startswith(thread_prefix)
+        )
+
+    def _save(self) -> None:
+        stamp = datetime.datetime.fromtimestamp(self.started_at).strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(self.directory, f"profile-{stamp}-{os.getpid()}.folded")
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(self.folded())
+            self.path = path
+            for old in list_profiles()[PROFILE_KEEP:]:
+                os.remove(old)
+            logger.info(f"✅ Profil terminé: {self.samples} échantillon(s) -> {path}")
+        except OSError as e:
+            logger.error(f"❌ Écriture du profil impossible ({path}): {e}")
+
+    def status(self, top: int = 20) -> dict:
+        # Fonctions en tête de pile (temps propre) les plus fréquentes
+        leaves: Counter = Counter()
+        for stack, count in list(self.stacks.items()):
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return {
+            "pid": os.getpid(),
+            "running": self.running,
+            "interval_ms": self.interval * 1000,
+            "started_at": self.started_at,
+            "stopped_at": self.stopped_at,
+            "samples": self.samples,
+            "distinct_stacks": len(self.stacks),
+            "file": self.path,
+            "top_functions": [{"function": name, "samples": count} for name, count in leaves.most_common(top)],
+        }
+
+    def reset_after_fork(self) -> None:
+        self._lock = threading.Lock()
+        self._thread = None
+
+
+def list_profiles() -> list[str]:
+    """Profils de PROFILE_DIR, du plus récent au plus ancien (tous workers)"""
+    return sorted(glob.glob(os.path.join(PROFILE_DIR, "profile-*.folded")), key=os.path.getmtime, reverse=True)
+
+
+# Singletons : un suivi des spans et un profileur par process.
+_tracker = SpanTracker(SLOW_OP_THRESHOLD_MS / 1000, enabled=PROFILE_SPANS)
+_profiler = SamplingProfiler(PROFILE_DIR)
+
+
+def _reset_after_fork() -> None:
+    _tracker.reset_after_fork()
+    _profiler.reset_after_fork()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_span_tracker() -> SpanTracker:
+    return _tracker
+
+
+def get_profiler() -> SamplingProfiler:
+    return _profiler
+
+
+def start_profile(interval_ms: float | None = None, duration_sec: float | None = None) -> bool:
+    """Démarre le profileur (durée bornée par PROFILE_MAX_DURATION_SEC)"""
+    interval = max(interval_ms or PROFILE_SAMPLE_INTERVAL_MS, 1.0) / 1000
+    duration = min(duration_sec or PROFILE_MAX_DURATION_SEC, PROFILE_MAX_DURATION_SEC)
+    return _profiler.start(interval, duration)
+
+
+def traced(name: str):
+    """Décorateur: span durée/CPU `name` autour de la fonction (si PROFILE_SPANS)"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _tracker.enabled:
+                return func(*args, **kwargs)
+            span = _tracker.start(name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _tracker.finish(span)
+        return wrapper
+    return decorator
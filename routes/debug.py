@@ -1,9 +1,13 @@
 """Routes pour les endpoints de debug"""
 import logging
-from flask import Blueprint, request, jsonify
+from collections import deque
+import os
+from flask import Blueprint, Response, request, jsonify
 from config import ENABLE_DEBUG, DEBUG_TOKEN
+from profiling import get_profiler, get_span_tracker, list_profiles, start_profile
 from scheduler_tasks import daily_ping
-from services import get_state_manager
+from services import get_state_manager, get_tenant_registry
+from state_storage import JournalStateStorage
 
 logger = logging.getLogger("whatsapp_bot")
 
@@ -31,8 +35,13 @@ def debug_ping():
     if not allowed:
         return jsonify({"status": "error", "message": error_msg}), 403
     
-    daily_ping()
-    return jsonify({"status": "ok", "message": "Ping envoyé"}), 200
+    registry = get_tenant_registry()
+    tenant_id = request.args.get("tenant", registry.default_id)
+    if tenant_id not in registry:
+        return jsonify({"status": "error", "message": f"Tenant inconnu: {tenant_id}"}), 404
+    
+    daily_ping([tenant_id])
+    return jsonify({"status": "ok", "message": f"Ping envoyé ({tenant_id})"}), 200
 
 
 @bp.get("/debug/state")
@@ -42,5 +51,117 @@ def debug_state():
     if not allowed:
         return jsonify({"status": "error", "message": error_msg}), 403
     
-    return jsonify(get_state_manager().get_state()), 200
+    registry = get_tenant_registry()
+    tenant_id = request.args.get("tenant", registry.default_id)
+    if registry.get(tenant_id) is None:
+        return jsonify({"status": "error", "message": f"Tenant inconnu: {tenant_id}"}), 404
+    return jsonify(get_state_manager().get_state(tenant_id).to_dict()), 200
+
+
+@bp.get("/debug/history")
+def debug_history():
+    """Dernières transitions d'un tenant lues dans le journal (STATE_BACKEND=journal)"""
+    allowed, error_msg = check_debug_access()
+    if not allowed:
+        return jsonify({"status": "error", "message": error_msg}), 403
+    
+    storage = get_state_manager().storage
+    if not isinstance(storage, JournalStateStorage):
+        return jsonify({"status": "error", "message": "Historique disponible uniquement avec STATE_BACKEND=journal"}), 400
+    
+    tenant_id = request.args.get("tenant", get_tenant_registry().default_id)
+    try:
+        limit = max(1, min(1000, int(request.args.get("limit", "50"))))
+    except ValueError:
+        limit = 50
+    events = deque(storage.iter_history(tenant_id), maxlen=limit)
+    return jsonify({"status": "ok", "tenant": tenant_id, "events": list(events)}), 200
+
+
+@bp.get("/debug/profile")
+def debug_profile():
+    """Profil en cours ou dernier profil de ce worker, spans et opérations lentes"""
+    allowed, error_msg = check_debug_access()
+    if not allowed:
+        return jsonify({"status": "error", "message": error_msg}), 403
+    
+    return jsonify({
+        "status": "ok",
+        "profiler": get_profiler().status(),
+        "profiles": [os.path.basename(path) for path in list_profiles()],
+        "spans": get_span_tracker().stats(),
+    }), 200
+
+
+@bp.post("/debug/profile/start")
+def debug_profile_start():
+    """Démarre un profil par échantillonnage (?interval_ms=10&duration=60) dans ce worker"""
+    allowed, error_msg = check_debug_access()
+    if not allowed:
+        return jsonify({"status": "error", "message": error_msg}), 403
+    
+    try:
+        interval_ms = float(request.args["interval_ms"]) if "interval_ms" in request.args else None
+        duration = float(request.args["duration"]) if "duration" in request.args else None
+    except ValueError:
+        return jsonify({"status": "error", "message": "interval_ms et duration doivent être numériques"}), 400
+    
+    profiler = get_profiler()
+    if not start_profile(interval_ms, duration):
+        return jsonify({"status": "error", "message": "Un profil est déjà en cours", "profiler": profiler.status()}), 409
+    return jsonify({"status": "ok", "profiler": profiler.status()}), 200
+
+
+@bp.post("/debug/profile/stop")
+def debug_profile_stop():
+    """Arrête le profil (celui de ce worker, sinon signalé aux autres via PROFILE_DIR)"""
+    allowed, error_msg = check_debug_access()
+    if not allowed:
+        return jsonify({"status": "error", "message": error_msg}), 403
+    
+    profiler = get_profiler()
+    if profiler.request_stop():
+        return jsonify({"status": "ok", "profiler": profiler.status()}), 200
+    return jsonify({"status": "ok", "message": "Arrêt demandé aux autres workers (effectif sous une seconde)"}), 202
+
+
+@bp.get("/debug/profile/flamegraph")
+def debug_profile_flamegraph():
+    """Piles repliées du profil (flamegraph.pl, speedscope): en cours, ?file= ou le plus récent.
+
+    `?thread=wa-send` ne garde que les threads dont le nom commence ainsi.
+    """
+    allowed, error_msg = check_debug_access()
+    if not allowed:
+        return jsonify({"status": "error", "message": error_msg}), 403
+    
+    thread_prefix = request.args.get("thread", "")
+    profiler = get_profiler()
+    if profiler.running and not request.args.get("file"):
+        name, folded = f"profile-live-{os.getpid()}.folded", profiler.folded(thread_prefix)
+    else:
+        profiles = {os.path.basename(path): path for path in list_profiles()}
+        name = request.args.get("file") or next(iter(profiles), None)
+        if name not in profiles:
+            return jsonify({"status": "error", "message": f"Profil introuvable: {name}"}), 404
+        with open(profiles[name], encoding="utf-8") as f:
+            folded = "".join(line for line in f if line.startswith(thread_prefix))
+    
+    return Response(
+        folded,
+        content_type="text/plain; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{name}"'},
+    )
 
+
+@bp.post("/debug/profile/spans")
+def debug_profile_spans():
+    """Active ou désactive les spans de ce worker (?enabled=true|false), sans redémarrage"""
+    allowed, error_msg = check_debug_access()
+    if not allowed:
+        return jsonify({"status": "error", "message": error_msg}), 403
+    
+    tracker = get_span_tracker()
+    tracker.enabled = request.args.get("enabled", "true").lower() == "true"
+    logger.info(f"🔧 Spans de profilage {'activés' if tracker.enabled else 'désactivés'} (pid {os.getpid()})")
+    return jsonify({"status": "ok", "enabled": tracker.enabled}), 200
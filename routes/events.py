@@ -0,0 +1,53 @@
+"""Route du flux Server-Sent Events (transitions d'état poussées aux clients)"""
+import logging
+from flask import Blueprint, Response, jsonify, request
+from config import EVENTS_MAX_SUBSCRIBERS, EVENTS_MAX_STREAM_SEC
+from event_hub import ALL_TENANTS, event_payload, format_frame, get_event_hub
+from routes.debug import check_debug_access
+from services import get_state_manager, get_tenant_registry
+
+logger = logging.getLogger("whatsapp_bot")
+
+bp = Blueprint('events', __name__)
+
+
+@bp.get("/events")
+def events():
+    """Flux SSE des transitions (ping, réponse, alerte) d'un tenant (?tenant=, "all" pour tous)
+
+    "all" liste tous les tenants et leur état: réservé à l'accès debug.
+    """
+    registry = get_tenant_registry()
+    tenant_id = request.args.get("tenant", registry.default_id)
+    if tenant_id == ALL_TENANTS:
+        allowed, error_msg = check_debug_access()
+        if not allowed:
+            return jsonify({"status": "error", "message": error_msg}), 403
+    elif registry.get(tenant_id) is None:
+        return jsonify({"status": "error", "message": f"Tenant inconnu: {tenant_id}"}), 404
+
+    hub = get_event_hub()
+    if hub.subscribers >= EVENTS_MAX_SUBSCRIBERS:
+        # EventSource passe en état fermé: le widget repasse en interrogation périodique
+        logger.warning(f"⚠️ /events refusé: {hub.subscribers} abonné(s), limite EVENTS_MAX_SUBSCRIBERS atteinte")
+        return jsonify({"status": "error", "message": "Trop d'abonnés, utilisez /health"}), 503
+
+    state_manager = get_state_manager()
+    tenants = registry.all() if tenant_id == ALL_TENANTS else [registry.get(tenant_id)]
+
+    def snapshot():
+        for tenant in tenants:
+            state = state_manager.get_state(tenant.tenant_id)
+            yield format_frame(event_payload(tenant.tenant_id, state, "snapshot", tenant.tz))
+
+    stream = hub.stream(
+        tenant_id,
+        snapshot,
+        last_event_id=request.headers.get("Last-Event-ID"),
+        max_duration=EVENTS_MAX_STREAM_SEC,
+    )
+    return Response(stream, mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        # Pas de mise en tampon par un reverse proxy (nginx)
+        "X-Accel-Buffering": "no",
+    })
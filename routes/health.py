@@ -1,9 +1,12 @@
 """Routes pour health check et statistiques"""
-import datetime
+import time
+import hashlib
 import logging
-from flask import Blueprint, jsonify
-from config import TZ, DAILY_HOUR, RESPONSE_TIMEOUT_MIN, ALERT_PHONES
-from services import get_state_manager
+from flask import Blueprint, Response, current_app, jsonify, request
+from config import HISTORY_MAX_DAYS, STATS_MAX_AGE_SEC
+from services import get_state_manager, get_tenant_registry
+from state_model import format_ts
+from history_store import get_history_store
 from scheduler_service import is_scheduler_active
 
 logger = logging.getLogger("whatsapp_bot")
@@ -13,64 +16,120 @@ bp = Blueprint('health', __name__)
 
 @bp.get("/health")
 def health():
-    """Endpoint pour vérifier que le bot est vivant"""
-    state_data = get_state_manager().get_state()
+    """Endpoint pour vérifier que le bot est vivant (tenant via ?tenant=)"""
+    registry = get_tenant_registry()
+    tenant_id = request.args.get("tenant", registry.default_id)
+    tenant = registry.get(tenant_id)
+    if tenant is None:
+        return jsonify({"status": "error", "message": f"Tenant inconnu: {tenant_id}"}), 404
+    state = get_state_manager().get_state(tenant_id)
     return jsonify({
         "status": "ok",
-        "waiting": state_data.get("waiting", False),
-        "last_ping": state_data.get("last_ping"),
-        "last_reply": state_data.get("last_reply")
+        "waiting": state.waiting,
+        "last_ping": format_ts(state.last_ping, tenant.tz),
+        "last_reply": format_ts(state.last_reply, tenant.tz)
     }), 200
 
 
-@bp.get("/stats")
-def stats():
-    """Retourne les statistiques d'utilisation du bot"""
-    state_data = get_state_manager().get_state()
-    stats_data = state_data.get("stats", {})
-    
+# Document /stats par tenant: (clé, corps JSON, ETag). La clé change avec la
+# version de l'état, l'état du scheduler et le jour d'uptime.
+_stats_cache: dict[str, tuple[tuple, bytes, str]] = {}
+
+
+def _build_stats(tenant_id: str, tenant, state, uptime_days, scheduler_running: bool) -> dict:
     # Calculer le taux de réponse
-    total_pings = stats_data.get("total_pings", 0)
-    total_replies = stats_data.get("total_replies", 0)
+    total_pings = state.total_pings
+    total_replies = state.total_replies
     response_rate = (total_replies / total_pings * 100) if total_pings > 0 else 0
     
-    # Calculer l'uptime (depuis le premier ping)
-    uptime_days = None
-    first_ping_date = stats_data.get("first_ping_date")
-    if first_ping_date:
-        try:
-            first_ping = datetime.datetime.fromisoformat(first_ping_date)
-            now = datetime.datetime.now(tz=TZ)
-            uptime_days = (now - first_ping).days
-        except (ValueError, TypeError):
-            pass
-    
-    # État du scheduler (importé depuis scheduler_service)
-    try:
-        scheduler_running = is_scheduler_active()
-    except Exception:
-        scheduler_running = False
-    
-    return jsonify({
+    return {
         "status": "ok",
         "stats": {
             "total_pings": total_pings,
-            "total_alerts": stats_data.get("total_alerts", 0),
+            "total_alerts": state.total_alerts,
             "total_replies": total_replies,
             "response_rate": round(response_rate, 2),
-            "first_ping_date": first_ping_date,
+            "first_ping_date": format_ts(state.first_ping, tenant.tz),
             "uptime_days": uptime_days
         },
         "current_state": {
-            "waiting": state_data.get("waiting", False),
-            "last_ping": state_data.get("last_ping"),
-            "last_reply": state_data.get("last_reply"),
+            "waiting": state.waiting,
+            "last_ping": format_ts(state.last_ping, tenant.tz),
+            "last_reply": format_ts(state.last_reply, tenant.tz),
             "scheduler_running": scheduler_running
         },
         "configuration": {
-            "daily_hour": DAILY_HOUR,
-            "response_timeout_min": RESPONSE_TIMEOUT_MIN,
-            "timezone": str(TZ),
-            "alert_phones_count": len(ALERT_PHONES)
+            "tenant": tenant_id,
+            "tenants_count": len(get_tenant_registry()),
+            "daily_hour": tenant.daily_hour,
+            "response_timeout_min": tenant.timeout_min,
+            "timezone": str(tenant.tz),
+            "alert_phones_count": len(tenant.alert_phones)
         }
-    }), 200
+    }
+
+
+@bp.get("/stats")
+def stats():
+    """Retourne les statistiques d'utilisation du bot (tenant via ?tenant=).
+
+    Le document est reconstruit seulement quand l'état du tenant change;
+    ETag fort (hash du corps, identique d'un worker à l'autre) et 304 sur
+    `If-None-Match`.
+    """
+    registry = get_tenant_registry()
+    tenant_id = request.args.get("tenant", registry.default_id)
+    tenant = registry.get(tenant_id)
+    if tenant is None:
+        return jsonify({"status": "error", "message": f"Tenant inconnu: {tenant_id}"}), 404
+    state_manager = get_state_manager()
+    # Version lue avant l'état (voir StateManager.get_version)
+    version = state_manager.get_version(tenant_id)
+    state = state_manager.get_state(tenant_id)
+    
+    # Calculer l'uptime (depuis le premier ping)
+    uptime_days = None
+    if state.first_ping is not None:
+        uptime_days = int(time.time() - state.first_ping) // 86400
+    
+    # État du scheduler (importé depuis scheduler_service)
+    try:
+        scheduler_running = is_scheduler_active()
+    except Exception:
+        scheduler_running = False
+    
+    key = (version, uptime_days, scheduler_running)
+    cached = _stats_cache.get(tenant_id)
+    if cached is None or cached[0] != key:
+        doc = _build_stats(tenant_id, tenant, state, uptime_days, scheduler_running)
+        body = current_app.json.dumps(doc).encode()
+        cached = (key, body, hashlib.blake2b(body, digest_size=16).hexdigest())
+        _stats_cache[tenant_id] = cached
+    _, body, etag = cached
+    
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, status=200, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = f"max-age={STATS_MAX_AGE_SEC}" if STATS_MAX_AGE_SEC else "no-cache"
+    return response
+
+
+@bp.get("/stats/history")
+def stats_history():
+    """Agrégats de l'historique quotidien sur une fenêtre (?tenant=&days=30)"""
+    registry = get_tenant_registry()
+    tenant_id = request.args.get("tenant", registry.default_id)
+    tenant = registry.get(tenant_id)
+    if tenant is None:
+        return jsonify({"status": "error", "message": f"Tenant inconnu: {tenant_id}"}), 404
+    try:
+        days = int(request.args.get("days", "30"))
+    except ValueError:
+        days = 0
+    if not 0 < days <= HISTORY_MAX_DAYS:
+        return jsonify({"status": "error", "message": f"days doit être entre 1 et {HISTORY_MAX_DAYS}"}), 400
+
+    history = get_history_store().window_stats(tenant_id, days=days, tz=tenant.tz)
+    return jsonify({"status": "ok", "tenant": tenant_id, "days": days, "history": history}), 200
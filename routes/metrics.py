@@ -0,0 +1,67 @@
+"""Routes pour les métriques internes (files de traitement, export Prometheus)"""
+import logging
+from flask import Blueprint, Response, jsonify, request
+from config import OUTBOX_RETENTION_DAYS
+from delivery_tracker import get_delivery_tracker
+from dedup_cache import get_dedup_cache
+from event_hub import get_event_hub
+from outbox import get_outbox
+from routes.debug import check_debug_access
+from scheduler_service import get_deadline_timer, get_leader_elector, get_scheduler_status, get_shard_coordinator
+from services import get_state_manager
+from telemetry import render_metrics
+from webhook_queue import get_webhook_queue
+from whatsapp_api import get_dispatcher
+
+logger = logging.getLogger("whatsapp_bot")
+
+bp = Blueprint('metrics', __name__)
+
+
+@bp.get("/metrics")
+def prometheus():
+    """Export Prometheus (format texte): latences, retries, écritures de l'état, files, retard des jobs"""
+    return Response(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@bp.get("/metrics/queues")
+def queues():
+    """Profondeur, débit et latence des files de traitement (accès debug: tenants, élection)"""
+    allowed, error_msg = check_debug_access()
+    if not allowed:
+        return jsonify({"status": "error", "message": error_msg}), 403
+    
+    return jsonify({
+        "status": "ok",
+        "webhook_queue": get_webhook_queue().metrics(),
+        "webhook_dedup": get_dedup_cache().metrics(),
+        "outbound": get_dispatcher().metrics(),
+        "outbox": get_outbox().metrics(),
+        "delivery": get_delivery_tracker().metrics(),
+        "deadline_timer": get_deadline_timer().metrics(),
+        "scheduler": get_scheduler_status(),
+        "leader": get_leader_elector().metrics() if get_leader_elector() else None,
+        "shard": get_shard_coordinator().metrics() if get_shard_coordinator() else None,
+        "state_commit": get_state_manager().commit_metrics(),
+        "events": get_event_hub().metrics()
+    }), 200
+
+
+@bp.get("/metrics/delivery")
+def delivery():
+    """Statuts de livraison et latences (mise en file -> API -> remise -> lecture) par type de message.
+
+    Accès debug: les derniers échecs contiennent les numéros des contacts.
+    """
+    allowed, error_msg = check_debug_access()
+    if not allowed:
+        return jsonify({"status": "error", "message": error_msg}), 403
+    
+    max_hours = OUTBOX_RETENTION_DAYS * 24
+    try:
+        hours = int(request.args.get("hours", 24))
+    except (TypeError, ValueError):
+        hours = 0
+    if not 1 <= hours <= max_hours:
+        return jsonify({"status": "error", "message": f"hours doit être entre 1 et {max_hours}"}), 400
+    return jsonify({"status": "ok", **get_delivery_tracker().window_stats(hours)}), 200
@@ -1,16 +1,33 @@
 """Routes pour les webhooks WhatsApp"""
 import json
+import time
 import logging
-from flask import Blueprint, request, jsonify
-from config import WEBHOOK_VERIFY_TOKEN, OWNER_PHONE, TEMPLATE_OK
-from services import get_state_manager
-from whatsapp_api import send_template
+from flask import Blueprint, g, request, jsonify
+from config import WEBHOOK_VERIFY_TOKEN
+from dedup_cache import get_dedup_cache
+from profiling import traced
+from services import get_tenant_registry
+from telemetry import WEBHOOK_REQUEST
+from webhook_queue import DeliveryStatus, InboundReply, get_webhook_queue
 
 logger = logging.getLogger("whatsapp_bot")
 
 bp = Blueprint('webhooks', __name__)
 
 
+@bp.before_request
+def _start_timer():
+    g.webhook_started = time.perf_counter()
+
+
+@bp.after_request
+def _observe_duration(response):
+    """Durée de traitement des POST (réponse à Meta, hors traitement en file)"""
+    if request.method == "POST":
+        WEBHOOK_REQUEST.observe(time.perf_counter() - g.webhook_started)
+    return response
+
+
 @bp.get("/whatsapp/webhook")
 def verify():
     """Vérification du webhook par Meta"""
@@ -25,8 +42,17 @@ def verify():
 
 
 @bp.post("/whatsapp/webhook")
+@traced("incoming")
 def incoming():
-    """Réception des messages WhatsApp depuis Meta"""
+    """Réception des messages WhatsApp depuis Meta.
+
+    Le payload est validé puis les réponses sont déposées dans la file de
+    traitement (webhook_queue): la requête est acquittée sans attendre l'écriture
+    de l'état ni l'envoi de la confirmation. Les messages déjà reçus (même id)
+    sont ignorés. Les statuts de livraison de nos messages (`statuses`) suivent
+    le même chemin.
+    """
+    rejected = 0
     try:
         data = request.get_json()
         
@@ -59,6 +85,14 @@ def incoming():
                 value = change.get("value", {})
                 if not isinstance(value, dict):
                     continue
+
+                # Statuts de livraison de nos messages (idempotents: pas de déduplication)
+                statuses = value.get("statuses", [])
+                if isinstance(statuses, list):
+                    for raw_status in statuses:
+                        status = DeliveryStatus.from_webhook(raw_status)
+                        if status is not None and not get_webhook_queue().submit(status):
+                            rejected += 1
                     
                 messages = value.get("messages", [])
                 if not isinstance(messages, list):
@@ -72,23 +106,37 @@ def incoming():
                     if not from_number or not isinstance(from_number, str):
                         continue
                     
+                    # Renvoi d'un message déjà traité: simple recherche dans le cache
+                    message_id = msg.get("id")
+                    if isinstance(message_id, str) and message_id:
+                        if not get_dedup_cache().check_and_add(message_id):
+                            logger.debug(f"ℹ️ Webhook: message déjà traité ({message_id})")
+                            continue
+                    else:
+                        message_id = None
+                    
                     # Extraction sécurisée du texte
                     text_body = ""
                     text_obj = msg.get("text", {})
                     if isinstance(text_obj, dict):
                         text_body = text_obj.get("body", "").strip().lower()
                     
-                    # Vérifier que OWNER_PHONE est configuré
-                    if not OWNER_PHONE:
-                        logger.warning("⚠️ OWNER_PHONE non configuré, impossible de traiter le message")
-                        continue
-                    
-                    owner_e164 = OWNER_PHONE.replace("+", "")
+                    # Recherche du tenant par numéro (index O(1))
+                    tenant = get_tenant_registry().get_by_phone(from_number)
 
-                    if from_number == owner_e164:
-                        logger.info(f"[WEBHOOK] ✅ Réponse du owner: {text_body}")
-                        get_state_manager().set_reply()
-                        send_template(OWNER_PHONE, TEMPLATE_OK)
+                    if tenant:
+                        logger.info(f"[WEBHOOK] ✅ Réponse de {tenant.tenant_id}: {text_body}")
+                        event = InboundReply(
+                            tenant_id=tenant.tenant_id,
+                            phone=tenant.phone,
+                            text=text_body,
+                            message_id=message_id,
+                        )
+                        if not get_webhook_queue().submit(event):
+                            rejected += 1
+                            # Doit être retraité quand Meta renverra le payload
+                            if message_id:
+                                get_dedup_cache().discard(message_id)
                     else:
                         logger.info(f"[WEBHOOK] ℹ️ Message d'un autre numéro: {from_number}")
                             
@@ -97,6 +145,10 @@ def incoming():
         return jsonify({"status": "error", "message": "Invalid JSON format"}), 400
     except Exception as e:
         logger.error(f"❌ Erreur dans le webhook: {e}", exc_info=True)
+    
+    if rejected:
+        # File pleine: Meta renverra le payload plus tard
+        return jsonify({"status": "error", "message": "Queue full"}), 503
         
     return jsonify({"status": "ok"}), 200
 
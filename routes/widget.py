@@ -25,7 +25,7 @@ def widget():
         <div class="text-center py-5 opacity-80"><div class="inline-block w-6 h-6 border-3 border-white border-t-transparent rounded-full animate-spin mb-2"></div><div class="text-sm">Chargement...</div></div>
     </div>
     <script>
-        function f(){{fetch('{base_url}/health').then(r=>r.json()).then(d=>{{var s=d.status!=='ok'?{{t:'offline',l:'Hors ligne',c:'red'}}:d.waiting?{{t:'waiting',l:'En attente',c:'yellow'}}:{{t:'online',l:'Actif',c:'green'}};function fmt(i){{if(!i)return 'Jamais';var m=Math.floor((Date.now()-new Date(i))/60000);if(m<1)return"A l'instant";if(m<60)return'Il y a '+m+'min';if(m<1440)return'Il y a '+Math.floor(m/60)+'h';var dt=new Date(i);return('0'+dt.getDate()).slice(-2)+'/'+('0'+(dt.getMonth()+1)).slice(-2)}}document.getElementById('w').innerHTML='<div class="flex items-center gap-3 mb-4"><div class="text-3xl">🐾</div><div><div class="text-lg font-semibold">Mathieu le Chat</div><div class="text-xs opacity-90">Bot de surveillance</div></div></div><div class="bg-white bg-opacity-20 backdrop-blur-lg rounded-xl p-4 mb-3 space-y-2"><div class="flex justify-between items-center"><span class="text-sm opacity-90">Etat</span><span class="inline-flex items-center gap-2 px-3 py-1 rounded-full text-xs font-semibold bg-'+s.c+'-500 bg-opacity-30"><span class="w-2 h-2 rounded-full bg-'+s.c+'-500 animate-pulse"></span>'+s.l+'</span></div><div class="flex justify-between items-center"><span class="text-sm opacity-90">Dernier ping</span><span class="text-sm font-semibold">'+fmt(d.last_ping)+'</span></div><div class="flex justify-between items-center"><span class="text-sm opacity-90">Dernière réponse</span><span class="text-sm font-semibold">'+fmt(d.last_reply)+'</span></div></div><div class="text-center text-xs opacity-70">Mise à jour toutes les 30s</div>'}}).catch(()=>{{document.getElementById('w').innerHTML='<div class="flex items-center gap-3 mb-4"><div class="text-3xl">🐾</div><div><div class="text-lg font-semibold">Mathieu le Chat</div><div class="text-xs opacity-90">Bot de surveillance</div></div></div><div class="bg-red-500 bg-opacity-30 rounded-xl p-3 text-center text-sm">⚠️ Erreur de connexion</div>'}})}}f();setInterval(f,30000)
+        var es=null,p=null;function r(d){{var s=d.status!=='ok'?{{t:'offline',l:'Hors ligne',c:'red'}}:d.waiting?{{t:'waiting',l:'En attente',c:'yellow'}}:{{t:'online',l:'Actif',c:'green'}};function fmt(i){{if(!i)return 'Jamais';var m=Math.floor((Date.now()-new Date(i))/60000);if(m<1)return"A l'instant";if(m<60)return'Il y a '+m+'min';if(m<1440)return'Il y a '+Math.floor(m/60)+'h';var dt=new Date(i);return('0'+dt.getDate()).slice(-2)+'/'+('0'+(dt.getMonth()+1)).slice(-2)}}document.getElementById('w').innerHTML='<div class="flex items-center gap-3 mb-4"><div class="text-3xl">🐾</div><div><div class="text-lg font-semibold">Mathieu le Chat</div><div class="text-xs opacity-90">Bot de surveillance</div></div></div><div class="bg-white bg-opacity-20 backdrop-blur-lg rounded-xl p-4 mb-3 space-y-2"><div class="flex justify-between items-center"><span class="text-sm opacity-90">Etat</span><span class="inline-flex items-center gap-2 px-3 py-1 rounded-full text-xs font-semibold bg-'+s.c+'-500 bg-opacity-30"><span class="w-2 h-2 rounded-full bg-'+s.c+'-500 animate-pulse"></span>'+s.l+'</span></div><div class="flex justify-between items-center"><span class="text-sm opacity-90">Dernier ping</span><span class="text-sm font-semibold">'+fmt(d.last_ping)+'</span></div><div class="flex justify-between items-center"><span class="text-sm opacity-90">Dernière réponse</span><span class="text-sm font-semibold">'+fmt(d.last_reply)+'</span></div></div><div class="text-center text-xs opacity-70">'+(es&&es.readyState===1?'Mise à jour en direct':'Mise à jour toutes les 30s')+'</div>'}}function e(){{document.getElementById('w').innerHTML='<div class="flex items-center gap-3 mb-4"><div class="text-3xl">🐾</div><div><div class="text-lg font-semibold">Mathieu le Chat</div><div class="text-xs opacity-90">Bot de surveillance</div></div></div><div class="bg-red-500 bg-opacity-30 rounded-xl p-3 text-center text-sm">⚠️ Erreur de connexion</div>'}}function f(){{fetch('{base_url}/health').then(x=>x.json()).then(r).catch(e)}}function poll(){{if(!p){{f();p=setInterval(f,30000)}}}}if(window.EventSource){{es=new EventSource('{base_url}/events');es.onmessage=function(m){{r(JSON.parse(m.data))}};es.onerror=function(){{if(es.readyState===2)poll()}}}}else{{poll()}}
     </script>
 </body>
 </html>""", 200, {'Content-Type': 'text/html'}
@@ -76,6 +76,25 @@ def api_docs():
                 }
             }
         },
+        {
+            "method": "GET",
+            "path": "/events",
+            "description": "Flux Server-Sent Events: état initial puis chaque transition (ping, réponse, alerte) en direct",
+            "auth": False,
+            "params": [
+                {"name": "tenant", "type": "string", "required": False, "description": "Tenant suivi (défaut: tenant par défaut, all = tous)"}
+            ],
+            "example_response": {
+                "status": "ok",
+                "tenant": "default",
+                "event": "reply",
+                "waiting": False,
+                "alert_sent": False,
+                "last_ping": "2024-01-15T09:00:00+01:00",
+                "last_reply": "2024-01-15T09:05:00+01:00"
+            },
+            "note": "Chaque message est une ligne data: JSON (EventSource côté navigateur)"
+        },
         {
             "method": "GET",
             "path": "/widget",
@@ -129,7 +148,7 @@ def api_docs():
                 "last_reply": "2024-01-15T09:05:00+01:00",
                 "last_ping": "2024-01-15T09:00:00+01:00",
                 "alert_sent": False,
-                "stats": {...}
+                "stats": {"total_pings": 150, "total_alerts": 3, "total_replies": 147, "first_ping_date": "2024-01-01T09:00:00+01:00"}
             },
             "note": "Nécessite ENABLE_DEBUG=true dans .env"
         }
@@ -287,44 +306,56 @@ def api_docs():
     </div>
     
     <script>
-        // Charger les statistiques
+        // Charger les statistiques (rechargées à chaque transition poussée par /events)
+        function loadStats() {
         fetch('""" + base_url + """/stats')
             .then(r => r.json())
-            .then(data => {{
-                const stats = data.stats || {{}};
+            .then(data => {
+                const stats = data.stats || {};
                 const html = `
                     <div class="grid grid-cols-1 md:grid-cols-3 gap-4">
                         <div class="bg-blue-50 p-4 rounded-lg">
-                            <div class="text-2xl font-bold text-blue-600">${{stats.total_pings || 0}}</div>
+                            <div class="text-2xl font-bold text-blue-600">${stats.total_pings || 0}</div>
                             <div class="text-sm text-gray-600">Pings envoyés</div>
                         </div>
                         <div class="bg-green-50 p-4 rounded-lg">
-                            <div class="text-2xl font-bold text-green-600">${{stats.total_replies || 0}}</div>
+                            <div class="text-2xl font-bold text-green-600">${stats.total_replies || 0}</div>
                             <div class="text-sm text-gray-600">Réponses reçues</div>
                         </div>
                         <div class="bg-purple-50 p-4 rounded-lg">
-                            <div class="text-2xl font-bold text-purple-600">${{stats.response_rate || 0}}%</div>
+                            <div class="text-2xl font-bold text-purple-600">${stats.response_rate || 0}%</div>
                             <div class="text-sm text-gray-600">Taux de réponse</div>
                         </div>
                         <div class="bg-red-50 p-4 rounded-lg">
-                            <div class="text-2xl font-bold text-red-600">${{stats.total_alerts || 0}}</div>
+                            <div class="text-2xl font-bold text-red-600">${stats.total_alerts || 0}</div>
                             <div class="text-sm text-gray-600">Alertes envoyées</div>
                         </div>
                         <div class="bg-yellow-50 p-4 rounded-lg">
-                            <div class="text-2xl font-bold text-yellow-600">${{stats.uptime_days || 0}}</div>
+                            <div class="text-2xl font-bold text-yellow-600">${stats.uptime_days || 0}</div>
                             <div class="text-sm text-gray-600">Jours d'activité</div>
                         </div>
                         <div class="bg-indigo-50 p-4 rounded-lg">
-                            <div class="text-2xl font-bold text-indigo-600">${{data.current_state?.scheduler_running ? '✅' : '❌'}}</div>
+                            <div class="text-2xl font-bold text-indigo-600">${data.current_state?.scheduler_running ? '✅' : '❌'}</div>
                             <div class="text-sm text-gray-600">Scheduler</div>
                         </div>
                     </div>
                 `;
                 document.getElementById('stats').innerHTML = html;
-            }})
-            .catch(err => {{
+            })
+            .catch(err => {
                 document.getElementById('stats').innerHTML = '<p class="text-red-600">Erreur de chargement des statistiques</p>';
-            }});
+            });
+        }
+        loadStats();
+        if (window.EventSource) {
+            let pending = null;
+            const es = new EventSource('""" + base_url + """/events');
+            es.onmessage = m => {
+                // L'instantané initial est déjà affiché; regroupe les rafales
+                if (JSON.parse(m.data).event === 'snapshot' || pending) return;
+                pending = setTimeout(() => { pending = null; loadStats(); }, 500);
+            };
+        }
     </script>
 </body>
 </html>"""
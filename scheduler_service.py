@@ -6,18 +6,48 @@ Pourquoi:
 
 Solution:
 - Un verrou fichier (`data/scheduler.lock`) empêche plusieurs processus de démarrer le scheduler.
+- Le process qui le détient publie un battement de cœur et l'heure des derniers
+  jobs (scheduler_status.py): `is_scheduler_active` le lit en mémoire, sans
+  toucher au verrou.
+- `SCHEDULER_ELECTION=lease`: le verrou est remplacé par un bail renouvelé
+  (leader_election.py). Chaque process démarre le scheduler en pause et le
+  reprend quand il est élu; un leader bloqué perd son bail et un autre prend
+  le relais. Chaque lot de `daily_ping` est réservé dans la base des baux
+  avec le jeton de fencing: une seule exécution même lors d'une bascule.
+- `SCHEDULER_ELECTION=shard`: chaque process démarre le scheduler mais
+  n'exécute pings et deadlines que pour sa part des tenants (sharding.py,
+  hachage cohérent sur les membres vivants). Tous les membres planifient
+  tous les lots; chacun filtre à l'exécution et réserve ses pings par tenant.
+
+Les deadlines de réponse sont suivies par un minuteur dédié (deadline_timer.py)
+qui démarre avec le scheduler; `check_deadline` ne reste qu'en balayage de sécurité.
 """
 
 from __future__ import annotations
 
 import os
 import logging
+import datetime
 
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.base import STATE_RUNNING
 
-from config import TZ, DAILY_HOUR
-from scheduler_lock import try_acquire_scheduler_lock, is_scheduler_lock_held
-from scheduler_tasks import daily_ping, check_deadline
+from config import (
+    TZ, DEADLINE_SWEEP_MIN, DEADLINE_RESYNC_SEC, PING_WINDOW_MIN, PING_BATCH_SIZE,
+    SCHEDULER_HEARTBEAT_SEC, SCHEDULER_STATUS_FILE,
+    SCHEDULER_ELECTION, LEADER_LEASE_DB, LEADER_LEASE_TTL_SEC, LEADER_RENEW_SEC, SHARD_VNODES,
+)
+from deadline_timer import DeadlineTimer
+from leader_election import LeaderElector, SqliteLeaseBackend
+from outbox import get_outbox
+from ping_planner import plan_ping_batches
+from scheduler_lock import try_acquire_scheduler_lock
+from scheduler_status import SchedulerStatusReader, SchedulerStatusWriter
+from sharding import ShardCoordinator, SqliteMembership
+from scheduler_tasks import daily_ping, check_deadline, check_tenant_deadline
+from services import get_tenant_registry, get_state_manager
+from telemetry import Gauge, SCHEDULER_JOB_LAG, SCHEDULER_JOB_MISSED
 
 logger = logging.getLogger("whatsapp_bot")
 
@@ -26,25 +56,212 @@ SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
 SCHEDULER_LOCK_FILE = os.getenv("SCHEDULER_LOCK_FILE", "data/scheduler.lock")
 
 _scheduler_lock = None
+_elector: LeaderElector | None = None
+_shard: ShardCoordinator | None = None
+_status_writer: SchedulerStatusWriter | None = None
+# Actif si un battement date de moins de 3 intervalles
+_status_reader = SchedulerStatusReader(SCHEDULER_STATUS_FILE, stale_after=3 * SCHEDULER_HEARTBEAT_SEC)
 
 # Scheduler global (par process)
 scheduler = BackgroundScheduler(timezone=str(TZ))
-scheduler.add_job(daily_ping, "cron", hour=DAILY_HOUR, minute=0)
-scheduler.add_job(check_deadline, "interval", minutes=5)
+
+
+def _owns(tenant_id: str) -> bool:
+    """Ce process exécute les jobs de ce tenant (toujours vrai hors mode shard)"""
+    return _shard is None or _shard.owns(tenant_id)
+
+
+def run_ping_batch(tenant_ids: list[str], handoff: bool = False):
+    """Envoie un lot de pings planifié, une seule fois par jour.
+
+    En mode lease, le lot est réservé (clé: date locale + premier tenant) avec
+    le jeton du leader: un ancien leader ou un second plan du même créneau
+    est refusé.
+
+    En mode shard, seuls les tenants de ce membre sont envoyés, chacun réservé
+    pour la journée. Les autres sont réexaminés une fois après l'expiration
+    d'une inscription (`handoff`): si leur propriétaire a disparu sans les
+    envoyer, l'anneau rééquilibré les attribue à un membre vivant.
+    """
+    tenant = get_tenant_registry().get(tenant_ids[0])
+    today = datetime.datetime.now(tz=tenant.tz if tenant else TZ).date()
+    if _elector is not None:
+        run_key = f"daily_ping:{today.isoformat()}:{tenant_ids[0]}"
+        if not _elector.claim(run_key):
+            logger.info(f"ℹ️ Lot de pings déjà envoyé ou leadership perdu ({run_key})")
+            return
+    elif _shard is not None:
+        others = [tid for tid in tenant_ids if not _shard.owns(tid)]
+        if others and not handoff:
+            scheduler.add_job(
+                run_ping_batch, "date",
+                run_date=datetime.datetime.now(tz=TZ) + datetime.timedelta(seconds=LEADER_LEASE_TTL_SEC + LEADER_RENEW_SEC),
+                args=[others], kwargs={"handoff": True}, id=f"ping_handoff:{others[0]}",
+                replace_existing=True, misfire_grace_time=None,
+            )
+        tenant_ids = _shard.claim_owned(f"daily_ping:{today.isoformat()}", tenant_ids)
+        if not tenant_ids:
+            return
+    daily_ping(tenant_ids)
+
+
+def plan_daily_ping(tenant_ids: list[str]):
+    """Répartit les pings d'un créneau en lots sur la fenêtre PING_WINDOW_MIN"""
+    if PING_WINDOW_MIN <= 0:
+        run_ping_batch(tenant_ids)
+        return
+
+    start = datetime.datetime.now(tz=TZ)
+    batches = plan_ping_batches(tenant_ids, PING_WINDOW_MIN * 60, PING_BATCH_SIZE)
+    for batch in batches:
+        scheduler.add_job(
+            run_ping_batch, "date", run_date=start + datetime.timedelta(seconds=batch.offset_sec),
+            args=[list(batch.tenant_ids)], id=f"ping_batch:{batch.tenant_ids[0]}",
+            replace_existing=True, misfire_grace_time=None,
+        )
+    logger.info(f"📅 {len(tenant_ids)} ping(s) répartis en {len(batches)} lot(s) sur {PING_WINDOW_MIN} min")
+
+
+# Un job cron par couple (timezone, heure) plutôt qu'un job par tenant
+for (tz_name, hour), tenant_ids in get_tenant_registry().schedule_groups().items():
+    scheduler.add_job(
+        plan_daily_ping, "cron", hour=hour, minute=0, timezone=tz_name,
+        args=[tenant_ids], id=f"daily_ping:{tz_name}:{hour}",
+    )
+scheduler.add_job(
+    check_deadline, "interval", minutes=DEADLINE_SWEEP_MIN, id="check_deadline",
+    args=[_owns] if SCHEDULER_ELECTION == "shard" else [],
+)
+
+
+def _heartbeat():
+    if _status_writer is not None:
+        _status_writer.heartbeat()
+
+
+def _on_job_event(event):
+    """Publie l'heure de la dernière exécution de chaque job (hors battement)"""
+    if _status_writer is not None and event.job_id != "scheduler_heartbeat":
+        _status_writer.record_run(event.job_id)
+
+
+scheduler.add_job(_heartbeat, "interval", seconds=SCHEDULER_HEARTBEAT_SEC, id="scheduler_heartbeat", coalesce=True)
+scheduler.add_listener(_on_job_event, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+
+
+def _on_job_timing(event):
+    """Retard entre l'heure prévue et le lancement effectif (métriques par type de job)"""
+    job = event.job_id.split(":", 1)[0]
+    if event.code == EVENT_JOB_MISSED:
+        SCHEDULER_JOB_MISSED.inc(job)
+        return
+    now = datetime.datetime.now(datetime.timezone.utc)
+    for run_time in event.scheduled_run_times:
+        SCHEDULER_JOB_LAG.observe(max(0.0, (now - run_time).total_seconds()), job)
+
+
+scheduler.add_listener(_on_job_timing, EVENT_JOB_SUBMITTED | EVENT_JOB_MISSED)
+
+def _on_deadline_due(tenant_id: str):
+    # Bail perdu entre l'échéance et l'arrêt du minuteur: le nouveau leader s'en charge
+    if _elector is not None and not _elector.is_leader():
+        return
+    # Mode shard: tenant d'un autre membre (qui a armé la même deadline)
+    if not _owns(tenant_id):
+        return
+    check_tenant_deadline(tenant_id)
+
+
+# Minuteur des deadlines (alertes à l'échéance exacte)
+deadline_timer = DeadlineTimer(
+    _on_deadline_due,
+    on_idle=get_state_manager().refresh,
+    resync_interval=DEADLINE_RESYNC_SEC,
+)
+_deadline_listener_added = False
+
+Gauge("deadline_timer_armed", "Deadlines de réponse armées dans le minuteur", lambda: len(deadline_timer))
+
+
+def _activate_scheduler(reason: str) -> None:
+    """Lance les jobs, le minuteur des deadlines et le statut (process élu)"""
+    global _deadline_listener_added, _status_writer
+
+    # Un seul écrivain par fichier de statut: pas de publication en mode shard
+    # (tous les process ont un scheduler actif)
+    if _shard is None:
+        try:
+            _status_writer = SchedulerStatusWriter(SCHEDULER_STATUS_FILE)
+        except OSError as e:
+            logger.warning(f"⚠️ Statut du scheduler non publié ({SCHEDULER_STATUS_FILE}): {e}")
+    if scheduler.running:
+        scheduler.resume()
+    else:
+        scheduler.start()
+    if not _deadline_listener_added:
+        # Arme les deadlines déjà en attente puis suit les transitions
+        get_state_manager().add_listener(deadline_timer.on_state_change)
+        _deadline_listener_added = True
+    deadline_timer.start()
+    # Reprend les messages restés en file (redémarrage, ancien process arrêté)
+    get_outbox().start()
+    logger.info(f"✅ Scheduler démarré ({reason}), {len(deadline_timer)} deadline(s) armée(s)")
+
+
+def _deactivate_scheduler() -> None:
+    """Met les jobs en pause et arrête le minuteur (leadership perdu)"""
+    global _status_writer
+
+    deadline_timer.stop()
+    if scheduler.state == STATE_RUNNING:
+        scheduler.pause()
+    if _status_writer is not None:
+        _status_writer.close()
+        _status_writer = None
 
 
 def start_scheduler() -> bool:
-    """Démarre le scheduler si activé et si le lock est acquis.
+    """Démarre le scheduler si activé et si le lock (ou le bail) est acquis.
 
     Retourne True si le scheduler a été effectivement démarré dans ce process.
+    En mode lease, le process se porte candidat et démarrera le scheduler
+    quand il sera élu (False en attendant). En mode shard, chaque process
+    démarre le scheduler pour sa part des tenants.
     """
-    global _scheduler_lock
+    global _scheduler_lock, _elector, _shard
 
     if not SCHEDULER_ENABLED:
         logger.warning("⚠️ SCHEDULER_ENABLED=false: scheduler désactivé")
         return False
 
-    if scheduler.running:
+    if scheduler.state == STATE_RUNNING:
+        return True
+
+    if SCHEDULER_ELECTION == "lease":
+        if _elector is None:
+            _elector = LeaderElector(
+                SqliteLeaseBackend(LEADER_LEASE_DB),
+                ttl=LEADER_LEASE_TTL_SEC,
+                renew_interval=LEADER_RENEW_SEC,
+                on_elected=lambda lease: _activate_scheduler(f"bail {lease.token}"),
+                on_revoked=_deactivate_scheduler,
+            )
+            scheduler.start(paused=True)
+            _elector.start()
+            logger.info(f"ℹ️ Candidat au scheduler ({_elector.candidate_id}), bail dans {LEADER_LEASE_DB}")
+        return False
+
+    if SCHEDULER_ELECTION == "shard":
+        registry = get_tenant_registry()
+        _shard = ShardCoordinator(
+            SqliteMembership(LEADER_LEASE_DB),
+            ttl=LEADER_LEASE_TTL_SEC,
+            renew_interval=LEADER_RENEW_SEC,
+            vnodes=SHARD_VNODES,
+            tenant_ids=lambda: (t.tenant_id for t in registry.all()),
+        )
+        _shard.start()
+        _activate_scheduler(f"shard {_shard.member_id}, {len(_shard.ring)} membre(s)")
         return True
 
     _scheduler_lock = try_acquire_scheduler_lock(SCHEDULER_LOCK_FILE)
@@ -56,8 +273,7 @@ def start_scheduler() -> bool:
         return False
 
     try:
-        scheduler.start()
-        logger.info("✅ Scheduler démarré (lock acquis)")
+        _activate_scheduler("lock acquis")
         return True
     except Exception as e:
         logger.error(f"❌ Échec du démarrage du scheduler: {e}", exc_info=True)
@@ -69,8 +285,20 @@ def start_scheduler() -> bool:
 
 
 def stop_scheduler() -> None:
-    """Arrêt propre du scheduler + libération du lock (best-effort)."""
-    global _scheduler_lock
+    """Arrêt propre du scheduler + libération du lock ou du bail (best-effort)."""
+    global _scheduler_lock, _elector, _shard
+
+    if _elector is not None:
+        # Rend le bail: un autre candidat reprend sans attendre l'expiration
+        _elector.stop()
+        _elector = None
+
+    if _shard is not None:
+        # Quitte l'anneau: les autres membres reprennent cette part au prochain renouvellement
+        _shard.stop()
+        _shard = None
+
+    _deactivate_scheduler()
 
     try:
         if scheduler.running:
@@ -89,9 +317,30 @@ def stop_scheduler() -> None:
 
 
 def is_scheduler_active() -> bool:
-    """Indique si un scheduler est actif (dans ce process ou un autre)."""
+    """Indique si un scheduler est actif (dans ce process ou un autre).
+
+    Lecture en mémoire du battement publié par le propriétaire du scheduler.
+    """
     if not SCHEDULER_ENABLED:
         return False
-    return is_scheduler_lock_held(SCHEDULER_LOCK_FILE) or bool(scheduler.running)
+    if scheduler.state == STATE_RUNNING or _status_reader.is_active():
+        return True
+    # Mode lease: leader sur un autre hôte (vu au dernier passage de l'élection)
+    return _elector is not None and _elector.leader_alive()
+
+
+def get_scheduler_status() -> dict | None:
+    """Statut publié par le scheduler actif (None si aucun n'a démarré)"""
+    return _status_reader.read()
+
+
+def get_leader_elector() -> LeaderElector | None:
+    return _elector
+
+
+def get_shard_coordinator() -> ShardCoordinator | None:
+    return _shard
 
 
+def get_deadline_timer() -> DeadlineTimer:
+    return deadline_timer
@@ -0,0 +1,186 @@
+"""État du scheduler partagé entre processus par un petit fichier mappé en mémoire.
+
+Pourquoi:
+- `is_scheduler_active` tentait un `flock` sur `data/scheduler.lock` à chaque
+  appel (ouverture, verrou, libération, fermeture): des appels système à
+  chaque `/stats`, lents sur un volume NAS.
+
+Fonctionnement:
+- Le process qui détient le scheduler publie un battement de cœur (toutes
+  les SCHEDULER_HEARTBEAT_SEC secondes, par un job APScheduler: un scheduler
+  bloqué cesse de battre) et l'heure de dernière exécution de chaque job.
+- Les autres processus mappent le fichier une fois (`mmap`) puis lisent
+  l'horodatage directement en mémoire: aucun appel système par lecture.
+- Cohérence par compteur de séquence (seqlock): l'écrivain le rend impair
+  pendant l'écriture, le lecteur recommence si la séquence a bougé.
+- Scheduler considéré actif si le dernier battement date de moins de
+  `stale_after` secondes (3 battements par défaut). Un process tué sans
+  arrêt propre est donc vu inactif après ce délai.
+
+Le fichier est placé par défaut dans /dev/shm (mémoire partagée, pas de
+volume réseau), sinon dans le dossier data.
+"""
+
+from __future__ import annotations
+
+import os
+import mmap
+import time
+import struct
+import logging
+import threading
+import contextlib
+
+logger = logging.getLogger("whatsapp_bot")
+
+_MAGIC = b"WBS1"
+# magic, nombre de slots, séquence, pid, démarrage, dernier battement
+_HEADER = struct.Struct("<4sIQIdd")
+_SEQ = struct.Struct("<Q")
+_SEQ_OFFSET = 8
+_IDENT = struct.Struct("<Idd")  # pid, démarrage, battement (après la séquence)
+_IDENT_OFFSET = 16
+_HEARTBEAT = struct.Struct("<d")
+_HEARTBEAT_OFFSET = _HEADER.size - 8
+# nom du job (famille: "daily_ping", "check_deadline"...), dernière exécution
+_SLOT = struct.Struct("<32sd")
+MAX_JOBS = 16
+STATUS_SIZE = _HEADER.size + MAX_JOBS * _SLOT.size
+
+
+def _slot_offset(index: int) -> int:
+    return _HEADER.size + index * _SLOT.size
+
+
+class SchedulerStatusWriter:
+    """Côté propriétaire du scheduler: écrit le statut dans le fichier mappé."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, STATUS_SIZE)
+            self._mm = mmap.mmap(fd, STATUS_SIZE)
+        finally:
+            os.close(fd)
+        self._lock = threading.Lock()
+        self._slots: dict[str, int] = {}
+        # Reprend la séquence d'un éventuel propriétaire précédent (lecteurs déjà mappés)
+        self._seq = _SEQ.unpack_from(self._mm, _SEQ_OFFSET)[0] & ~1
+        with self._write():
+            self._mm[:4] = _MAGIC
+            struct.pack_into("<I", self._mm, 4, MAX_JOBS)
+            now = time.time()
+            _IDENT.pack_into(self._mm, _IDENT_OFFSET, os.getpid(), now, now)
+            self._mm[_HEADER.size:STATUS_SIZE] = bytes(STATUS_SIZE - _HEADER.size)
+
+    @contextlib.contextmanager
+    def _write(self):
+        """Section d'écriture: séquence impaire pendant la modification"""
+        with self._lock:
+            self._seq += 1
+            _SEQ.pack_into(self._mm, _SEQ_OFFSET, self._seq)
+            try:
+                yield
+            finally:
+                self._seq += 1
+                _SEQ.pack_into(self._mm, _SEQ_OFFSET, self._seq)
+
+    def heartbeat(self, now: float | None = None) -> None:
+        with self._write():
+            _HEARTBEAT.pack_into(self._mm, _HEARTBEAT_OFFSET, now or time.time())
+
+    def record_run(self, job: str, now: float | None = None) -> None:
+        """Heure de dernière exécution d'un job (famille: préfixe avant ':')"""
+        name = job.split(":", 1)[0]
+        with self._write():
+            index = self._slots.get(name)
+            if index is None:
+                if len(self._slots) >= MAX_JOBS:
+                    return
+                index = self._slots[name] = len(self._slots)
+            _SLOT.pack_into(self._mm, _slot_offset(index), name.encode()[:32], now or time.time())
+
+    def close(self) -> None:
+        """Marque le scheduler arrêté (battement effacé) et libère le mapping"""
+        try:
+            self.heartbeat(-1.0)
+            self._mm.close()
+        except (ValueError, OSError):
+            pass
+
+
+class SchedulerStatusReader:
+    """Côté lecteurs: mapping en lecture seule, ouvert au premier usage."""
+
+    def __init__(self, path: str, stale_after: float, retry_interval: float = 5.0):
+        self.path = path
+        self.stale_after = stale_after
+        self.retry_interval = retry_interval
+        self._mm: mmap.mmap | None = None
+        self._next_attempt = 0.0
+        self._lock = threading.Lock()
+
+    def _mapping(self) -> mmap.mmap | None:
+        if self._mm is not None:
+            return self._mm
+        with self._lock:
+            now = time.monotonic()
+            if self._mm is None and now >= self._next_attempt:
+                # Fichier absent tant qu'aucun scheduler n'a démarré: nouvel essai plus tard
+                self._next_attempt = now + self.retry_interval
+                try:
+                    with open(self.path, "rb") as fh:
+                        if os.fstat(fh.fileno()).st_size >= STATUS_SIZE:
+                            self._mm = mmap.mmap(fh.fileno(), STATUS_SIZE, access=mmap.ACCESS_READ)
+                except OSError:
+                    pass
+            return self._mm
+
+    def _snapshot(self, size: int = STATUS_SIZE) -> bytes | None:
+        """Copie cohérente des `size` premiers octets du statut (seqlock), None si illisible"""
+        mm = self._mapping()
+        if mm is None:
+            return None
+        for _ in range(100):
+            seq = _SEQ.unpack_from(mm, _SEQ_OFFSET)[0]
+            if seq & 1:
+                continue
+            data = mm[:size]
+            if _SEQ.unpack_from(mm, _SEQ_OFFSET)[0] == seq:
+                return data if data[:4] == _MAGIC else None
+        return None
+
+    def heartbeat_age(self) -> float | None:
+        """Secondes depuis le dernier battement (None: jamais démarré ou arrêté)"""
+        data = self._snapshot(_HEADER.size)
+        if data is None:
+            return None
+        heartbeat = _HEADER.unpack_from(data)[5]
+        return time.time() - heartbeat if heartbeat > 0 else None
+
+    def is_active(self) -> bool:
+        age = self.heartbeat_age()
+        return age is not None and age <= self.stale_after
+
+    def read(self) -> dict | None:
+        """Statut complet: pid, démarrage, âge du battement, dernières exécutions"""
+        data = self._snapshot()
+        if data is None:
+            return None
+        _, slots, _, pid, started_at, heartbeat = _HEADER.unpack_from(data)
+        jobs = {}
+        for index in range(min(slots, MAX_JOBS)):
+            name, last_run = _SLOT.unpack_from(data, _slot_offset(index))
+            name = name.rstrip(b"\0").decode(errors="replace")
+            if name:
+                jobs[name] = round(last_run, 3)
+        now = time.time()
+        return {
+            "active": heartbeat > 0 and now - heartbeat <= self.stale_after,
+            "pid": pid,
+            "started_at": round(started_at, 3),
+            "heartbeat_age_s": round(now - heartbeat, 3) if heartbeat > 0 else None,
+            "last_runs": jobs,
+        }
@@ -1,87 +1,169 @@
 """Tâches du scheduler pour le bot WhatsApp Wellbeing"""
+import time
 import logging
 import datetime
-from config import TZ, OWNER_PHONE, ALERT_PHONES, RESPONSE_TIMEOUT_MIN, TEMPLATE_DAILY, TEMPLATE_ALERT
-from services import get_state_manager
-from whatsapp_api import send_template
+from typing import Callable
+from alert_fallback import enqueue_fallback
+from config import TEMPLATE_DAILY, TEMPLATE_ALERT
+from services import get_state_manager, get_tenant_registry
+from history_store import get_history_store
+from profiling import traced
+from outbox import KIND_ALERT, KIND_PING, OutboxEntry, OutboxMessage, get_outbox, register_handler
+from whatsapp_api import template_payload, PRIORITY_HIGH
 
 logger = logging.getLogger("whatsapp_bot")
 
 
-def daily_ping():
-    """Envoie le ping quotidien et définit la deadline"""
+def _on_ping_delivered(entry: OutboxEntry, delivered: bool):
+    """Fixe la deadline quand le ping est parti (appelée par le vidage de l'outbox)"""
     try:
-        # Vérifier que OWNER_PHONE est configuré
-        if not OWNER_PHONE:
-            logger.error("❌ OWNER_PHONE non configuré, impossible d'envoyer le ping")
+        tenant = get_tenant_registry().get(entry.tenant_id)
+        if tenant is None:
             return
-        
-        state_manager = get_state_manager()
-        now = datetime.datetime.now(tz=TZ)
-        logger.info(f"[PING] envoi du template {TEMPLATE_DAILY} à {OWNER_PHONE}")
-        
-        result = send_template(OWNER_PHONE, TEMPLATE_DAILY)
-        
-        if result and result.status_code == 200:
-            deadline = now + datetime.timedelta(minutes=RESPONSE_TIMEOUT_MIN)
-            state_manager.set_waiting(deadline)
-            logger.info(f"⏰ Deadline fixée à {deadline.strftime('%H:%M')}")
+        if delivered:
+            now = datetime.datetime.now(tz=tenant.tz)
+            deadline = now + datetime.timedelta(minutes=tenant.timeout_min)
+            get_state_manager().set_waiting(deadline, tenant_id=tenant.tenant_id)
+            get_history_store().record_ping(tenant.tenant_id, int(now.timestamp()), tenant.tz)
+            logger.info(f"⏰ Deadline fixée à {deadline.strftime('%H:%M')} ({tenant.tenant_id})")
         else:
-            logger.error("❌ Échec de l'envoi du ping quotidien")
-            
+            logger.error(f"❌ Échec de l'envoi du ping quotidien ({tenant.tenant_id})")
     except Exception as e:
-        logger.error(f"❌ Erreur dans daily_ping: {e}", exc_info=True)
+        logger.error(f"❌ Erreur dans daily_ping ({entry.tenant_id}): {e}", exc_info=True)
+
+
+def _on_alert_delivered(entry: OutboxEntry, delivered: bool):
+    """Issue finale d'une alerte (acceptée par l'API, ou abandonnée après tous les essais)"""
+    if delivered:
+        logger.info(f"✅ Alerte délivrée à {entry.recipient} ({entry.tenant_id})")
+    else:
+        logger.error(f"❌ Alerte non délivrée à {entry.recipient} ({entry.tenant_id})")
+        enqueue_fallback(entry, "échec d'envoi par l'API WhatsApp")
+    get_history_store().record_alert(entry.tenant_id, delivered=delivered)
+
 
+# Enregistrés à l'import: les messages repris après un redémarrage sont aussi suivis
+register_handler(KIND_PING, _on_ping_delivered)
+register_handler(KIND_ALERT, _on_alert_delivered)
 
-def check_deadline():
-    """Vérifie si la deadline est dépassée et envoie les alertes si nécessaire"""
+
+@traced("daily_ping")
+def daily_ping(tenant_ids: list[str] | None = None):
+    """Met en file le ping quotidien des tenants donnés (tous si None).
+
+    Un appel = une transaction dans l'outbox; le vidage respecte le débit Meta
+    et la deadline de chaque tenant est fixée à l'envoi effectif.
+    """
     try:
-        state_manager = get_state_manager()
-        state = state_manager.get_state()
-        
-        if not state.get("waiting"):
-            return
+        registry = get_tenant_registry()
+        if tenant_ids is None:
+            tenants = registry.all()
+        else:
+            tenants = [t for t in (registry.get(tid) for tid in tenant_ids) if t]
 
-        # Vérifier si une alerte a déjà été envoyée pour éviter les doublons
-        if state.get("alert_sent", False):
+        if not tenants:
+            logger.error("❌ Aucun tenant configuré, impossible d'envoyer le ping")
             return
 
-        deadline_iso = state.get("deadline")
-        if not deadline_iso:
-            return
+        get_outbox().enqueue([
+            OutboxMessage(KIND_PING, t.phone, template_payload(t.phone, TEMPLATE_DAILY, "fr"), tenant_id=t.tenant_id)
+            for t in tenants
+        ])
+        logger.info(f"[PING] {len(tenants)} ping(s) {TEMPLATE_DAILY} mis en file")
+
+    except Exception as e:
+        logger.error(f"❌ Erreur dans daily_ping: {e}", exc_info=True)
+
+
+def send_alerts(tenant_id: str, phones: list[str], deadline: int) -> int:
+    """Met `TEMPLATE_ALERT` en file durable pour tous les contacts (une transaction).
+
+    Les alertes passent en priorité dans le répartiteur d'envois et sont
+    réessayées jusqu'à leur livraison (outbox.py). La clé de déduplication
+    (tenant, deadline, contact) rend l'appel idempotent. Renvoie le nombre
+    d'alertes nouvellement mises en file.
+    """
+    return get_outbox().enqueue([
+        OutboxMessage(
+            KIND_ALERT, phone, template_payload(phone, TEMPLATE_ALERT, "fr"), tenant_id=tenant_id,
+            priority=PRIORITY_HIGH, dedup_key=f"alert:{tenant_id}:{deadline}:{phone}",
+        )
+        for phone in phones
+    ])
+
 
-        try:
-            deadline = datetime.datetime.fromisoformat(deadline_iso)
-        except (ValueError, TypeError) as e:
-            logger.error(f"❌ Deadline invalide dans l'état: {deadline_iso}, réinitialisation")
-            state_manager.reset_waiting()
+def _end_waiting(tenant_id: str):
+    """Fin de l'attente sans réponse: état réinitialisé, ping clos dans l'historique"""
+    get_state_manager().reset_waiting(tenant_id)
+    get_history_store().record_reset(tenant_id)
+
+
+def check_tenant_deadline(tenant_id: str):
+    """Vérifie la deadline d'un tenant et envoie les alertes si nécessaire.
+
+    Appelée par le minuteur des deadlines à l'échéance, et par le balayage de
+    sécurité `check_deadline`.
+    """
+    state_manager = get_state_manager()
+    # Relecture forcée: une réponse a pu arriver dans un autre worker
+    state_manager.refresh(force=True)
+    state = state_manager.get_state(tenant_id)
+
+    if not state.waiting:
+        return
+
+    if state.deadline is None:
+        # Deadline absente ou invalide dans le stockage (écartée au chargement)
+        logger.error(f"❌ Deadline invalide dans l'état ({tenant_id}), réinitialisation")
+        _end_waiting(tenant_id)
+        return
+
+    if time.time() < state.deadline:
+        return
+
+    if not state.alert_sent:
+        logger.warning(f"[ALERTE] ⚠️ Deadline dépassée ({tenant_id}), envoi aux contacts...")
+        # Réservation de l'alerte (False: déjà prise en charge par un autre process)
+        if not state_manager.mark_alert_sent(tenant_id):
             return
+    # Sinon: alerte réservée mais état non réinitialisé (process arrêté avant la
+    # mise en file, ou autre process en cours): remise en file idempotente
+
+    tenant = get_tenant_registry().get(tenant_id)
+    alert_phones = list(tenant.alert_phones) if tenant else []
+
+    # Vérifier qu'il y a des contacts d'alerte configurés
+    if not alert_phones:
+        logger.warning(f"⚠️ Aucun contact d'alerte configuré ({tenant_id})")
+        get_history_store().record_alert(tenant_id, delivered=False)
+        _end_waiting(tenant_id)
+        return
+
+    # Alertes durables avant la réinitialisation: un crash entre les deux est
+    # rattrapé par le prochain passage (clé de déduplication)
+    queued = send_alerts(tenant_id, alert_phones, state.deadline)
+    if queued:
+        logger.info(f"📝 Alertes mises en file ({tenant_id}) : {queued}/{len(alert_phones)}")
+
+    _end_waiting(tenant_id)
+
+
+@traced("check_deadline")
+def check_deadline(owns: Callable[[str], bool] | None = None):
+    """Balayage de sécurité de toutes les deadlines en attente.
+
+    Les alertes partent normalement à l'échéance exacte (deadline_timer.py);
+    ce balayage peu fréquent rattrape un éventuel oubli du minuteur.
+    `owns` restreint le balayage aux tenants de ce process (mode shard).
+    """
+    try:
+        for tenant_id in get_state_manager().get_waiting_tenants():
+            if owns is not None and not owns(tenant_id):
+                continue
+            try:
+                check_tenant_deadline(tenant_id)
+            except Exception as e:
+                logger.error(f"❌ Erreur dans check_deadline ({tenant_id}): {e}", exc_info=True)
 
-        now = datetime.datetime.now(tz=TZ)
-        
-        if now >= deadline:
-            logger.warning("[ALERTE] ⚠️ Deadline dépassée, envoi aux contacts...")
-            
-            # Marquer l'alerte comme envoyée AVANT l'envoi pour éviter les doublons
-            # même si l'envoi échoue partiellement
-            state_manager.mark_alert_sent()
-            
-            # Vérifier qu'il y a des contacts d'alerte configurés
-            if not ALERT_PHONES:
-                logger.warning("⚠️ Aucun contact d'alerte configuré (ALERT_PHONES vide)")
-                state_manager.reset_waiting()
-                return
-            
-            success_count = 0
-            for phone in ALERT_PHONES:
-                result = send_template(phone, TEMPLATE_ALERT)
-                if result and result.status_code == 200:
-                    success_count += 1
-            
-            logger.info(f"✅ Alertes envoyées : {success_count}/{len(ALERT_PHONES)}")
-            
-            state_manager.reset_waiting()
-            
     except Exception as e:
         logger.error(f"❌ Erreur dans check_deadline: {e}", exc_info=True)
-
@@ -2,22 +2,36 @@
 
 Objectif:
 - Éviter les imports circulaires du type `from app import state_manager`.
-- Centraliser l'instanciation des services (StateManager, etc.)
+- Centraliser l'instanciation des services (StateManager, TenantRegistry, etc.)
 """
 
 import logging
 
 from config import STATE_FILE
 from state_manager import StateManager
+from state_storage import create_state_storage
+from telemetry import Gauge
+from tenants import TenantRegistry, load_tenant_registry
 
 logger = logging.getLogger("whatsapp_bot")
 
 
 # Singleton : un seul StateManager par process.
-state_manager = StateManager(STATE_FILE)
+state_manager = StateManager(STATE_FILE, storage=create_state_storage())
+
+# Registre des personnes surveillées (chargé une fois au démarrage).
+tenant_registry = load_tenant_registry()
 
 
 def get_state_manager() -> StateManager:
     return state_manager
 
 
+def get_tenant_registry() -> TenantRegistry:
+    return tenant_registry
+
+
+Gauge("state_pending_writes", "Tenants modifiés en attente d'écriture (mode group)",
+      lambda: state_manager.commit_metrics()["pending"])
+
+
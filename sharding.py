@@ -0,0 +1,267 @@
+"""Répartition des tenants entre réplicas par hachage cohérent.
+
+Pourquoi:
+- Avec le verrou ou le bail, un seul process exécute tous les jobs planifiés
+  (`daily_ping`, `check_deadline`): les autres workers et réplicas restent
+  inactifs côté scheduler, quel que soit le nombre de personnes suivies.
+
+Fonctionnement (`SCHEDULER_ELECTION=shard`):
+- Chaque process est membre: il inscrit son identifiant dans la table
+  `members` de la base partagée (LEADER_LEASE_DB) et renouvelle son
+  inscription toutes les LEADER_RENEW_SEC secondes. Un membre qui cesse de
+  renouveler disparaît après LEADER_LEASE_TTL_SEC secondes.
+- Les membres vivants forment un anneau de hachage cohérent (`HashRing`,
+  plusieurs points virtuels par membre): un tenant appartient au premier
+  point qui suit son hachage. Quand un membre arrive ou part, seule la part
+  de tenants correspondante (~1/N) change de propriétaire.
+- Chaque membre n'exécute pings et deadlines que pour ses tenants. Les vues
+  de l'anneau peuvent diverger brièvement pendant un rééquilibrage: chaque
+  ping quotidien est réservé par tenant et par jour (`claim_owned`), une
+  seule exécution même si deux membres se croient propriétaires.
+- Un membre qui ne peut plus renouveler son inscription ne se considère plus
+  propriétaire de rien dès qu'elle a pu expirer (horloge monotone).
+"""
+
+from __future__ import annotations
+
+import os
+import time
+import bisect
+import hashlib
+import logging
+import sqlite3
+import threading
+import contextlib
+from typing import Callable, Iterable
+
+from leader_election import default_candidate_id
+
+logger = logging.getLogger("whatsapp_bot")
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Anneau de hachage cohérent (`vnodes` points virtuels par membre)."""
+
+    def __init__(self, members: Iterable[str], vnodes: int = 128):
+        self.members = tuple(sorted(set(members)))
+        self.vnodes = vnodes
+        points = sorted(
+            (_hash(f"{member}#{i}"), member) for member in self.members for i in range(vnodes)
+        )
+        self._keys = [point for point, _ in points]
+        self._owners = [member for _, member in points]
+
+    def owner(self, key: str) -> str | None:
+        if not self._keys:
+            return None
+        index = bisect.bisect(self._keys, _hash(key))
+        return self._owners[index % len(self._owners)]
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+
+class _Statements:
+    CREATE_MEMBERS = """
+        CREATE TABLE IF NOT EXISTS members (
+            member_id  TEXT PRIMARY KEY,
+            joined_at  REAL NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    """
+    CREATE_RUNS = """
+        CREATE TABLE IF NOT EXISTS shard_runs (
+            run_key    TEXT PRIMARY KEY,
+            member_id  TEXT NOT NULL,
+            claimed_at REAL NOT NULL
+        )
+    """
+    HEARTBEAT = """
+        INSERT INTO members (member_id, joined_at, expires_at) VALUES (?, ?, ?)
+        ON CONFLICT(member_id) DO UPDATE SET expires_at = excluded.expires_at
+    """
+    LEAVE = "DELETE FROM members WHERE member_id = ?"
+    LIVE = "SELECT member_id FROM members WHERE expires_at > ? ORDER BY member_id"
+    PURGE_MEMBERS = "DELETE FROM members WHERE expires_at < ?"
+    CLAIM = "INSERT OR IGNORE INTO shard_runs (run_key, member_id, claimed_at) VALUES (?, ?, ?)"
+    PURGE_RUNS = "DELETE FROM shard_runs WHERE claimed_at < ?"
+
+
+class SqliteMembership:
+    """Inscriptions des membres et réservations dans une base SQLite (BEGIN IMMEDIATE)."""
+
+    # Réservations conservées (une semaine): au-delà, une clé peut être réutilisée
+    RUNS_RETENTION_SEC = 7 * 86400
+    # Membres expirés conservés un jour (diagnostic), puis supprimés
+    MEMBERS_RETENTION_SEC = 86400
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        db_dir = os.path.dirname(db_file)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, timeout=5, isolation_level=None, check_same_thread=False)
+        # Pas de WAL: la base peut être sur un volume partagé entre conteneurs
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(_Statements.CREATE_MEMBERS)
+        self._conn.execute(_Statements.CREATE_RUNS)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def heartbeat(self, member_id: str, ttl: float) -> list[str]:
+        """Renouvelle l'inscription de `member_id` et retourne les membres vivants"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(_Statements.HEARTBEAT, (member_id, now, now + ttl))
+            conn.execute(_Statements.PURGE_MEMBERS, (now - self.MEMBERS_RETENTION_SEC,))
+            return [row[0] for row in conn.execute(_Statements.LIVE, (now,))]
+
+    def leave(self, member_id: str) -> None:
+        with self._transaction() as conn:
+            conn.execute(_Statements.LEAVE, (member_id,))
+
+    def claim(self, member_id: str, run_keys: list[str]) -> list[bool]:
+        """Réserve chaque clé (une seule fois, tous membres confondus)"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(_Statements.PURGE_RUNS, (now - self.RUNS_RETENTION_SEC,))
+            return [
+                conn.execute(_Statements.CLAIM, (run_key, member_id, now)).rowcount == 1
+                for run_key in run_keys
+            ]
+
+    def close(self) -> None:
+        try:
+            self._conn.close()
+        except Exception:
+            pass
+
+
+class ShardCoordinator:
+    """Membre de l'anneau: thread qui renouvelle l'inscription et suit les membres.
+
+    `tenant_ids()` sert à mesurer la part de tenants déplacée à chaque
+    rééquilibrage; `on_rebalance(ring)` est appelé depuis ce thread.
+    """
+
+    def __init__(
+        self,
+        backend: SqliteMembership,
+        member_id: str | None = None,
+        ttl: float = 30.0,
+        renew_interval: float = 10.0,
+        vnodes: int = 128,
+        tenant_ids: Callable[[], Iterable[str]] | None = None,
+        on_rebalance: Callable[[HashRing], None] | None = None,
+    ):
+        self.backend = backend
+        self.member_id = member_id or default_candidate_id()
+        self.ttl = ttl
+        self.renew_interval = renew_interval
+        self.vnodes = vnodes
+        self.tenant_ids = tenant_ids
+        self.on_rebalance = on_rebalance
+        self.ring = HashRing((), vnodes)
+        # Fin de validité de l'inscription selon l'horloge monotone locale
+        self._valid_until = 0.0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+        self.rebalances = 0
+        self.last_moved = 0
+
+    def is_member(self) -> bool:
+        """Vrai tant que l'inscription ne peut pas avoir expiré"""
+        return time.monotonic() < self._valid_until
+
+    def owns(self, tenant_id: str) -> bool:
+        return self.is_member() and self.ring.owner(tenant_id) == self.member_id
+
+    def claim_owned(self, run_prefix: str, tenant_ids: list[str]) -> list[str]:
+        """Tenants de ce membre dont l'exécution `run_prefix` est réservée ici"""
+        owned = [tid for tid in tenant_ids if self.owns(tid)]
+        if not owned:
+            return []
+        try:
+            claimed = self.backend.claim(self.member_id, [f"{run_prefix}:{tid}" for tid in owned])
+        except sqlite3.Error as e:
+            logger.error(f"❌ Réservation impossible ({run_prefix}): {e}")
+            return []
+        return [tid for tid, ok in zip(owned, claimed) if ok]
+
+    def step(self) -> None:
+        """Renouvelle l'inscription et reconstruit l'anneau si les membres ont changé"""
+        started = time.monotonic()
+        members = self.backend.heartbeat(self.member_id, self.ttl)
+        self._valid_until = started + self.ttl
+        if tuple(members) == self.ring.members:
+            return
+        previous, self.ring = self.ring, HashRing(members, self.vnodes)
+        self.rebalances += 1
+        tenants = list(self.tenant_ids()) if self.tenant_ids else []
+        self.last_moved = sum(1 for tid in tenants if previous.owner(tid) != self.ring.owner(tid))
+        owned = sum(1 for tid in tenants if self.ring.owner(tid) == self.member_id)
+        logger.info(
+            f"🔧 Rééquilibrage des shards: {len(members)} membre(s), "
+            f"{self.last_moved}/{len(tenants)} tenant(s) déplacé(s), {owned} pour {self.member_id}"
+        )
+        if self.on_rebalance:
+            self.on_rebalance(self.ring)
+
+    def start(self) -> None:
+        """Première inscription synchrone (anneau connu au retour), puis thread"""
+        if self._thread is not None:
+            return
+        try:
+            self.step()
+        except Exception as e:
+            logger.error(f"❌ Inscription à l'anneau impossible: {e}", exc_info=True)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="shard-membership", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.renew_interval):
+            try:
+                self.step()
+            except Exception as e:
+                logger.error(f"❌ Erreur de renouvellement du membre {self.member_id}: {e}", exc_info=True)
+
+    def stop(self, leave: bool = True) -> None:
+        """Arrête le thread et quitte l'anneau (les autres membres reprennent la part)"""
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(5.0)
+        self._valid_until = 0.0
+        if leave:
+            try:
+                self.backend.leave(self.member_id)
+            except Exception as e:
+                logger.warning(f"⚠️ Départ de l'anneau non enregistré ({self.member_id}): {e}")
+
+    def metrics(self) -> dict:
+        tenants = list(self.tenant_ids()) if self.tenant_ids else []
+        return {
+            "member": self.member_id,
+            "active": self.is_member(),
+            "members": list(self.ring.members),
+            "owned_tenants": sum(1 for tid in tenants if self.owns(tid)),
+            "total_tenants": len(tenants),
+            "rebalances": self.rebalances,
+            "last_moved": self.last_moved,
+        }
@@ -1,212 +1,345 @@
 """Gestionnaire d'état thread-safe pour le bot WhatsApp Wellbeing"""
-import os
-import json
 import logging
 import threading
-import time
 import datetime
-import tempfile
-import copy
-from zoneinfo import ZoneInfo
-from config import TZ, STATE_FILE
+import time
+import contextlib
+from collections.abc import Mapping
+from config import (
+    TZ, DEFAULT_TENANT_ID, STATE_REFRESH_INTERVAL,
+    STATE_COMMIT_MODE, STATE_COMMIT_DELAY_MS, STATE_COMMIT_BATCH,
+)
+from state_model import TenantState, DEFAULT_TENANT_STATE, to_epoch
+from state_storage import StateStorage, JsonStateStorage
+from profiling import traced
+from telemetry import STATE_LOCK_WAIT, STATE_SAVE
 
 logger = logging.getLogger("whatsapp_bot")
 
 
+class _SerializedStates(Mapping):
+    """Vue dict (format historique) des états, convertis à la demande.
+
+    Le backend ne sérialise ainsi que les tenants qu'il écrit réellement.
+    """
+
+    def __init__(self, states: dict):
+        self._states = states
+
+    def __getitem__(self, tenant_id: str) -> dict:
+        return self._states[tenant_id].to_dict()
+
+    def __iter__(self):
+        return iter(self._states)
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+
 class StateManager:
-    """Gestionnaire d'état thread-safe avec validation et fallback"""
-    
-    DEFAULT_STATE = {
-        "waiting": False,
-        "deadline": None,
-        "last_reply": None,
-        "last_ping": None,
-        "alert_sent": False,
-        # Statistiques
-        "stats": {
-            "total_pings": 0,
-            "total_alerts": 0,
-            "total_replies": 0,
-            "first_ping_date": None
-        }
-    }
+    """Gestionnaire d'état thread-safe avec validation et fallback.
+
+    L'état est tenu par tenant (personne surveillée) et persisté via un
+    backend `StateStorage` (state.json ou SQLite, voir state_storage.py).
+    Les méthodes publiques prennent un `tenant_id` (par défaut DEFAULT_TENANT_ID)
+    pour rester compatibles avec l'usage mono-personne.
+
+    Plusieurs processus (workers Gunicorn) peuvent partager le même backend:
+    les lectures relisent les écritures des autres processus (au plus toutes les
+    STATE_REFRESH_INTERVAL secondes), les écritures se font dans une transaction
+    inter-process après relecture.
+
+    L'état d'un tenant est un `TenantState` compact (voir state_model.py),
+    converti en dict uniquement pour le backend. Il n'est jamais modifié en
+    place: chaque transition publie un nouvel enregistrement, que `get_state`
+    renvoie sans prendre le lock ni copier. Des listeners (`add_listener`)
+    reçoivent ce même enregistrement à chaque transition, y compris celles
+    relues depuis un autre processus.
+
+    Mode de commit (`STATE_COMMIT_MODE`):
+    - "sync" (défaut): chaque mutation est écrite (fsync) avant de rendre la main;
+    - "group": les mutations s'appliquent en mémoire tout de suite et sont
+      écrites par lots (au plus `commit_delay` secondes ou `commit_batch`
+      tenants), un seul fsync par lot. Les transitions critiques passent
+      `sync=True` et vident le lot dans une transaction inter-process.
+      Entre deux lots, une écriture concurrente d'un autre processus sur le
+      même tenant peut être écrasée (dernier écrivain gagnant).
+    """
     
-    def __init__(self, state_file: str):
+    def __init__(
+        self,
+        state_file: str,
+        storage: StateStorage | None = None,
+        commit_mode: str = STATE_COMMIT_MODE,
+        commit_delay: float = STATE_COMMIT_DELAY_MS / 1000,
+        commit_batch: int = STATE_COMMIT_BATCH,
+    ):
         self.state_file = state_file
+        self.storage = storage or JsonStateStorage(state_file)
         self.lock = threading.Lock()
-        self._state = self._load_state()
-    
-    def _validate_state(self, state: dict) -> dict:
-        """Valide et normalise l'état avec valeurs par défaut"""
-        # deepcopy pour éviter des références partagées (dict stats)
-        validated = copy.deepcopy(self.DEFAULT_STATE)
-        
-        # Migration et validation des champs
-        if isinstance(state, dict):
-            validated["waiting"] = bool(state.get("waiting", False))
-            validated["alert_sent"] = bool(state.get("alert_sent", False))
-            
-            # Validation des dates ISO
-            for date_field in ["deadline", "last_reply", "last_ping"]:
-                value = state.get(date_field)
-                if value is None:
-                    validated[date_field] = None
-                elif isinstance(value, str):
-                    try:
-                        # Valider que c'est une date ISO valide
-                        datetime.datetime.fromisoformat(value)
-                        validated[date_field] = value
-                    except (ValueError, TypeError):
-                        logger.warning(f"⚠️ Date invalide dans state: {date_field}={value}, réinitialisation")
-                        validated[date_field] = None
-                else:
-                    validated[date_field] = None
-            
-            # Migration et validation des statistiques
-            if "stats" in state and isinstance(state["stats"], dict):
-                validated["stats"] = self.DEFAULT_STATE["stats"].copy()
-                validated["stats"]["total_pings"] = max(0, int(state["stats"].get("total_pings", 0)))
-                validated["stats"]["total_alerts"] = max(0, int(state["stats"].get("total_alerts", 0)))
-                validated["stats"]["total_replies"] = max(0, int(state["stats"].get("total_replies", 0)))
-                first_ping = state["stats"].get("first_ping_date")
-                if first_ping:
-                    try:
-                        datetime.datetime.fromisoformat(first_ping)
-                        validated["stats"]["first_ping_date"] = first_ping
-                    except (ValueError, TypeError):
-                        validated["stats"]["first_ping_date"] = None
-        
-        return validated
+        self.group_commit = commit_mode == "group"
+        self.commit_delay = commit_delay
+        self.commit_batch = max(1, commit_batch)
+        # Tenants modifiés en mémoire, pas encore écrits -> transitions ("ping", "reply"...)
+        self._dirty: dict[str, list[str]] = {}
+        self._flush_cond = threading.Condition(self.lock)
+        self._flusher: threading.Thread | None = None
+        self._closed = False
+        self.flushes = 0
+        self.flushed_tenants = 0
+        # tenant -> TenantState (immuable: remplacé à chaque transition)
+        self._states = self._load_state()
+        # Index des tenants en attente de réponse (évite de scanner tous les états)
+        self._waiting = {tid for tid, st in self._states.items() if st.waiting}
+        self._last_refresh = time.monotonic()
+        self._listeners = []
+        # Version de l'état (globale et par tenant), incrémentée à chaque transition
+        # publiée: sert de clé aux réponses mises en cache (/stats)
+        self.version = 0
+        self._versions: dict[str, int] = {}
     
     def _load_state(self) -> dict:
-        """Charge l'état depuis le fichier avec validation et fallback"""
+        """Charge l'état depuis le backend avec validation et fallback"""
         try:
-            if not os.path.exists(self.state_file):
+            raw_states = self.storage.load()
+            if not raw_states:
                 logger.info("📝 Création d'un nouvel état par défaut")
-                return copy.deepcopy(self.DEFAULT_STATE)
+                return {}
             
-            with open(self.state_file, "r", encoding="utf-8") as f:
-                state = json.load(f)
-            
-            # Validation et normalisation
-            validated_state = self._validate_state(state)
+            # Validation et normalisation (dates ISO -> epoch)
+            states = {tid: TenantState.from_dict(st) for tid, st in raw_states.items()}
             
             # Si l'état a été modifié par la validation, le sauvegarder
-            if validated_state != state:
+            changed = [tid for tid, st in states.items() if st.to_dict() != raw_states[tid]]
+            if changed:
                 logger.info("🔧 État corrigé et sauvegardé")
-                self._save_state_internal(validated_state)
-            
-            return validated_state
+                self.storage.save(_SerializedStates(states), changed)
             
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ Fichier state.json corrompu (JSON invalide): {e}")
-            logger.info("🔄 Restauration de l'état par défaut")
-            # Sauvegarder un backup du fichier corrompu
-            try:
-                backup_file = f"{self.state_file}.corrupt.{int(time.time())}"
-                os.rename(self.state_file, backup_file)
-                logger.info(f"💾 Backup du fichier corrompu: {backup_file}")
-            except Exception:
-                pass
-            return copy.deepcopy(self.DEFAULT_STATE)
+            return states
             
         except Exception as e:
-            logger.error(f"❌ Erreur lecture state.json: {e}", exc_info=True)
-            return copy.deepcopy(self.DEFAULT_STATE)
+            logger.error(f"❌ Erreur lecture de l'état ({self.storage.name}): {e}", exc_info=True)
+            return {}
     
-    def _save_state_internal(self, state: dict):
+    @traced("save_state")
+    def _save_state_internal(self, tenant_ids, events=None):
         """Sauvegarde interne (sans lock, appelée depuis méthodes avec lock)"""
+        self.storage.save(_SerializedStates(self._states), tenant_ids, events)
+    
+    def _flush_locked(self):
+        """Écrit les tenants modifiés en un seul lot (appelée avec lock, dans une transaction)"""
+        if not self._dirty:
+            return
+        pending, self._dirty = self._dirty, {}
+        started = time.perf_counter()
         try:
-            # Créer le dossier si nécessaire
-            state_dir = os.path.dirname(self.state_file)
-            if state_dir:  # Si le fichier est dans un sous-dossier
-                os.makedirs(state_dir, exist_ok=True)
-
-            # Écriture atomique (NAS-friendly): tmp -> fsync -> os.replace
-            tmp_dir = state_dir or "."
-            fd, tmp_path = tempfile.mkstemp(prefix=".state.", suffix=".tmp", dir=tmp_dir)
-            try:
-                with os.fdopen(fd, "w", encoding="utf-8") as f:
-                    json.dump(state, f, indent=2, ensure_ascii=False)
-                    f.flush()
-                    try:
-                        os.fsync(f.fileno())
-                    except Exception:
-                        # best-effort (certains FS / environnements)
-                        pass
-
-                os.replace(tmp_path, self.state_file)
-            finally:
-                # Si os.replace a échoué, nettoyer le tmp
-                try:
-                    if os.path.exists(tmp_path):
-                        os.remove(tmp_path)
-                except Exception:
-                    pass
-        except Exception as e:
-            logger.error(f"❌ Erreur écriture state.json: {e}", exc_info=True)
+            self._save_state_internal(list(pending), pending)
+        except Exception:
+            # Conservés pour le prochain lot
+            for tenant_id, events in pending.items():
+                self._dirty.setdefault(tenant_id, [])[:0] = events
             raise
+        STATE_SAVE.observe(time.perf_counter() - started, self.storage.name)
+        self.flushes += 1
+        self.flushed_tenants += len(pending)
     
-    def get_state(self) -> dict:
-        """Récupère une copie de l'état actuel"""
+    def _refresh_locked(self):
+        """Applique les écritures des autres processus (appelée avec lock)"""
+        if not self.storage.has_changed():
+            return
+        for tenant_id, raw_state in self.storage.load_changes().items():
+            if tenant_id in self._dirty:
+                continue  # la version locale, pas encore écrite, l'emporte
+            state = TenantState.from_dict(raw_state)
+            # Le backend JSON renvoie tout le fichier: seuls les tenants modifiés
+            # changent de version et réveillent les listeners
+            if state == self._states.get(tenant_id):
+                continue
+            self._publish(tenant_id, state)
+
+    def refresh(self, force: bool = False):
+        """Relit l'état partagé si un autre processus l'a modifié.
+
+        Sans `force`, un lecteur n'attend jamais un écrivain: si le lock est
+        pris, l'état courant est servi et la relecture se fera plus tard.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_refresh < STATE_REFRESH_INTERVAL:
+            return
+        if not self.lock.acquire(blocking=force):
+            return
+        try:
+            self._last_refresh = now
+            self._refresh_locked()
+        finally:
+            self.lock.release()
+
+    @contextlib.contextmanager
+    def _mutation(self, sync: bool = False):
+        """Lock local + état fraîchement relu; écriture immédiate ou par lot.
+
+        Immédiate (mode "sync" ou `sync=True`): transaction inter-process qui
+        écrit aussi les éventuelles mutations en attente.
+        """
+        started = time.perf_counter()
         with self.lock:
-            return copy.deepcopy(self._state)
-    
-    def update_state(self, updates: dict):
-        """Met à jour l'état de manière thread-safe"""
+            STATE_LOCK_WAIT.observe(time.perf_counter() - started)
+            if self.group_commit and not sync:
+                self._refresh_locked()
+                yield
+                if len(self._dirty) >= self.commit_batch:
+                    with self.storage.transaction():
+                        self._flush_locked()
+                elif self._dirty:
+                    self._ensure_flusher()
+                    self._flush_cond.notify()
+                return
+            with self.storage.transaction():
+                self._refresh_locked()
+                yield
+                self._flush_locked()
+
+    def _commit(self, tenant_id: str, state: TenantState, event: str):
+        """Publie la nouvelle version d'un tenant et la marque à écrire (appelée avec lock)"""
+        self._dirty.setdefault(tenant_id, []).append(event)
+        self._publish(tenant_id, state)
+
+    def _ensure_flusher(self):
+        """Démarre le thread d'écriture par lots (appelée avec lock, après un éventuel fork)"""
+        if self._flusher is None and not self._closed:
+            self._flusher = threading.Thread(target=self._run_flusher, name="state-flusher", daemon=True)
+            self._flusher.start()
+
+    def _run_flusher(self):
+        with self.lock:
+            while not self._closed:
+                if not self._dirty:
+                    self._flush_cond.wait()
+                    continue
+                # Laisse le lot se remplir pendant au plus commit_delay
+                deadline = time.monotonic() + self.commit_delay
+                while self._dirty and len(self._dirty) < self.commit_batch and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._flush_cond.wait(remaining)
+                try:
+                    with self.storage.transaction():
+                        self._flush_locked()
+                except Exception as e:
+                    logger.error(f"❌ Échec de l'écriture groupée de l'état: {e}", exc_info=True)
+                    self._flush_cond.wait(1.0)
+
+    def flush(self):
+        """Écrit immédiatement les mutations en attente (mode "group")"""
+        with self.lock:
+            if self._dirty:
+                with self.storage.transaction():
+                    self._flush_locked()
+
+    def close(self):
+        """Écrit les mutations en attente et arrête le thread d'écriture"""
+        self.flush()
+        with self.lock:
+            self._closed = True
+            self._flush_cond.notify_all()
+            flusher, self._flusher = self._flusher, None
+        if flusher is not None:
+            flusher.join(5.0)
+
+    def _publish(self, tenant_id: str, state: TenantState):
+        """Remplace l'état d'un tenant, met à jour l'index et prévient les listeners (appelée avec lock)"""
+        self._states[tenant_id] = state
+        self.version += 1
+        self._versions[tenant_id] = self.version
+        if state.waiting:
+            self._waiting.add(tenant_id)
+        else:
+            self._waiting.discard(tenant_id)
+        for listener in self._listeners:
+            try:
+                listener(tenant_id, state)
+            except Exception as e:
+                logger.error(f"❌ Erreur dans un listener d'état ({tenant_id}): {e}", exc_info=True)
+
+    def add_listener(self, listener, replay: bool = True):
+        """Abonne `listener(tenant_id, state)` aux transitions d'état.
+
+        Appelé avec le lock tenu: le listener doit être rapide. Avec `replay`,
+        il reçoit d'abord les tenants en attente.
+        """
         with self.lock:
-            self._state.update(updates)
-            self._save_state_internal(self._state)
+            self._listeners.append(listener)
+            if replay:
+                for tenant_id in self._waiting:
+                    listener(tenant_id, self._states[tenant_id])
+
+    def get_state(self, tenant_id: str = DEFAULT_TENANT_ID) -> TenantState:
+        """État courant d'un tenant (enregistrement immuable, sans lock ni copie)"""
+        self.refresh()
+        return self._states.get(tenant_id, DEFAULT_TENANT_STATE)
+
+    def get_version(self, tenant_id: str = DEFAULT_TENANT_ID) -> int:
+        """Version de l'état d'un tenant dans ce process (change à chaque transition).
+
+        À lire avant `get_state`: une transition publiée entre les deux donne
+        une version plus récente que l'état lu, jamais l'inverse.
+        """
+        self.refresh()
+        return self._versions.get(tenant_id, 0)
+
+    def commit_metrics(self) -> dict:
+        """Compteurs du mode de commit (lots écrits, tenants en attente d'écriture)"""
+        return {
+            "mode": "group" if self.group_commit else "sync",
+            "pending": len(self._dirty),
+            "flushes": self.flushes,
+            "flushed_tenants": self.flushed_tenants,
+        }
+
+    def get_waiting_tenants(self) -> list[str]:
+        """Liste des tenants en attente de réponse"""
+        self.refresh()
+        with self.lock:
+            return list(self._waiting)
+    
+    def update_state(self, updates: dict, tenant_id: str = DEFAULT_TENANT_ID, sync: bool = False):
+        """Met à jour l'état de manière thread-safe (clés du format historique)"""
+        with self._mutation(sync):
+            state = self._states.get(tenant_id, DEFAULT_TENANT_STATE).to_dict()
+            state.update(updates)
+            self._commit(tenant_id, TenantState.from_dict(state), "update")
     
-    def reset_waiting(self):
+    def reset_waiting(self, tenant_id: str = DEFAULT_TENANT_ID, sync: bool = False):
         """Réinitialise l'état d'attente"""
-        with self.lock:
-            self._state["waiting"] = False
-            self._state["deadline"] = None
-            self._state["alert_sent"] = False
-            self._save_state_internal(self._state)
+        with self._mutation(sync):
+            self._commit(tenant_id, self._states.get(tenant_id, DEFAULT_TENANT_STATE).reset(), "reset")
     
-    def set_waiting(self, deadline: datetime.datetime):
+    def set_waiting(self, deadline: datetime.datetime, tenant_id: str = DEFAULT_TENANT_ID, sync: bool = False):
         """Définit l'état d'attente avec une deadline"""
-        with self.lock:
-            now = datetime.datetime.now(tz=TZ)
-            self._state["waiting"] = True
-            self._state["deadline"] = deadline.isoformat()
-            self._state["last_ping"] = now.isoformat()
-            self._state["alert_sent"] = False
-            
-            # Mise à jour des statistiques
-            if "stats" not in self._state:
-                self._state["stats"] = self.DEFAULT_STATE["stats"].copy()
-            self._state["stats"]["total_pings"] = self._state["stats"].get("total_pings", 0) + 1
-            if not self._state["stats"].get("first_ping_date"):
-                self._state["stats"]["first_ping_date"] = now.isoformat()
-            
-            self._save_state_internal(self._state)
+        with self._mutation(sync):
+            state = self._states.get(tenant_id, DEFAULT_TENANT_STATE)
+            now = to_epoch(datetime.datetime.now(tz=TZ))
+            self._commit(tenant_id, state.with_ping(to_epoch(deadline), now), "ping")
     
-    def set_reply(self):
+    def set_reply(self, tenant_id: str = DEFAULT_TENANT_ID, sync: bool = False):
         """Enregistre une réponse reçue"""
-        with self.lock:
-            self._state["waiting"] = False
-            self._state["deadline"] = None
-            self._state["alert_sent"] = False
-            self._state["last_reply"] = datetime.datetime.now(tz=TZ).isoformat()
-            
-            # Mise à jour des statistiques
-            if "stats" not in self._state:
-                self._state["stats"] = self.DEFAULT_STATE["stats"].copy()
-            self._state["stats"]["total_replies"] = self._state["stats"].get("total_replies", 0) + 1
-            
-            self._save_state_internal(self._state)
+        with self._mutation(sync):
+            state = self._states.get(tenant_id, DEFAULT_TENANT_STATE)
+            now = to_epoch(datetime.datetime.now(tz=TZ))
+            self._commit(tenant_id, state.with_reply(now), "reply")
     
-    def mark_alert_sent(self):
-        """Marque qu'une alerte a été envoyée"""
-        with self.lock:
-            self._state["alert_sent"] = True
-            
-            # Mise à jour des statistiques
-            if "stats" not in self._state:
-                self._state["stats"] = self.DEFAULT_STATE["stats"].copy()
-            self._state["stats"]["total_alerts"] = self._state["stats"].get("total_alerts", 0) + 1
-            
-            self._save_state_internal(self._state)
+    def mark_alert_sent(self, tenant_id: str = DEFAULT_TENANT_ID) -> bool:
+        """Marque qu'une alerte a été envoyée.
+
+        Renvoie False si l'alerte était déjà marquée ou si le tenant n'attend
+        plus de réponse: l'appelant ne doit alors rien envoyer (évite les
+        doublons entre le minuteur et le balayage de sécurité). Toujours écrit
+        de façon synchrone: c'est la réservation de l'alerte entre processus.
+        """
+        with self._mutation(sync=True):
+            state = self._states.get(tenant_id, DEFAULT_TENANT_STATE)
+            if state.alert_sent or not state.waiting:
+                return False
+            self._commit(tenant_id, state.with_alert_sent(), "alert")
+            return True
@@ -0,0 +1,173 @@
+"""Modèle compact de l'état d'un tenant.
+
+`TenantState` remplace le dict imbriqué (dates ISO en chaînes) en mémoire:
+- `__slots__`, dates en secondes epoch (int), drapeaux dans un entier;
+- immuable par convention: chaque transition (`with_ping`, `with_reply`...)
+  renvoie un nouvel enregistrement, que le StateManager publie tel quel aux
+  lecteurs (pas de copie, pas de lock);
+- la conversion en dict au format historique (dates ISO) n'a lieu qu'aux
+  frontières: stockage (`to_dict` / `from_dict`) et réponses JSON.
+"""
+
+from __future__ import annotations
+
+import math
+import logging
+import datetime
+from zoneinfo import ZoneInfo
+
+from config import TZ
+
+logger = logging.getLogger("whatsapp_bot")
+
+FLAG_WAITING = 1
+FLAG_ALERT_SENT = 2
+
+_DATE_FIELDS = ("deadline", "last_reply", "last_ping")
+
+
+def to_epoch(value: datetime.datetime) -> int:
+    """Datetime (avec fuseau) -> secondes epoch, arrondi à la seconde supérieure"""
+    return math.ceil(value.timestamp())
+
+
+def format_ts(ts: int | None, tz: ZoneInfo = TZ) -> str | None:
+    """Secondes epoch -> date ISO dans le fuseau `tz` (None si absent)"""
+    if ts is None:
+        return None
+    return datetime.datetime.fromtimestamp(ts, tz=tz).isoformat()
+
+
+def _parse_ts(name: str, value) -> int | None:
+    """Date ISO (format historique) -> secondes epoch, None si absente ou invalide"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        try:
+            parsed = datetime.datetime.fromisoformat(value)
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=TZ)
+            return to_epoch(parsed)
+        except (ValueError, TypeError):
+            pass
+    logger.warning(f"⚠️ Date invalide dans state: {name}={value}, réinitialisation")
+    return None
+
+
+def _parse_count(value) -> int:
+    try:
+        return max(0, int(value))
+    except (ValueError, TypeError):
+        return 0
+
+
+class TenantState:
+    """État d'un tenant: attente en cours, dates clés et compteurs."""
+
+    __slots__ = (
+        "flags", "deadline", "last_reply", "last_ping",
+        "total_pings", "total_alerts", "total_replies", "first_ping",
+    )
+
+    def __init__(
+        self,
+        flags: int = 0,
+        deadline: int | None = None,
+        last_reply: int | None = None,
+        last_ping: int | None = None,
+        total_pings: int = 0,
+        total_alerts: int = 0,
+        total_replies: int = 0,
+        first_ping: int | None = None,
+    ):
+        self.flags = flags
+        self.deadline = deadline
+        self.last_reply = last_reply
+        self.last_ping = last_ping
+        self.total_pings = total_pings
+        self.total_alerts = total_alerts
+        self.total_replies = total_replies
+        self.first_ping = first_ping
+
+    @property
+    def waiting(self) -> bool:
+        return bool(self.flags & FLAG_WAITING)
+
+    @property
+    def alert_sent(self) -> bool:
+        return bool(self.flags & FLAG_ALERT_SENT)
+
+    def _replace(self, **changes) -> "TenantState":
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(changes)
+        return TenantState(**values)
+
+    # ---------- Transitions ----------
+
+    def with_ping(self, deadline: int, now: int) -> "TenantState":
+        """Ping envoyé: attente jusqu'à `deadline`"""
+        return self._replace(
+            flags=FLAG_WAITING,
+            deadline=deadline,
+            last_ping=now,
+            total_pings=self.total_pings + 1,
+            first_ping=self.first_ping or now,
+        )
+
+    def with_reply(self, now: int) -> "TenantState":
+        """Réponse reçue: fin de l'attente"""
+        return self._replace(flags=0, deadline=None, last_reply=now, total_replies=self.total_replies + 1)
+
+    def with_alert_sent(self) -> "TenantState":
+        return self._replace(flags=self.flags | FLAG_ALERT_SENT, total_alerts=self.total_alerts + 1)
+
+    def reset(self) -> "TenantState":
+        """Fin de l'attente sans réponse (alertes traitées)"""
+        return self._replace(flags=0, deadline=None)
+
+    # ---------- Frontière stockage / API ----------
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "TenantState":
+        """Dict au format historique (validé et normalisé) -> TenantState"""
+        if not isinstance(state, dict):
+            return cls()
+        stats = state.get("stats") if isinstance(state.get("stats"), dict) else {}
+        flags = (FLAG_WAITING if state.get("waiting") else 0) | (FLAG_ALERT_SENT if state.get("alert_sent") else 0)
+        dates = {name: _parse_ts(name, state.get(name)) for name in _DATE_FIELDS}
+        return cls(
+            flags=flags,
+            total_pings=_parse_count(stats.get("total_pings", 0)),
+            total_alerts=_parse_count(stats.get("total_alerts", 0)),
+            total_replies=_parse_count(stats.get("total_replies", 0)),
+            first_ping=_parse_ts("first_ping_date", stats.get("first_ping_date")),
+            **dates,
+        )
+
+    def to_dict(self, tz: ZoneInfo = TZ) -> dict:
+        """TenantState -> dict au format historique (dates ISO dans `tz`)"""
+        return {
+            "waiting": self.waiting,
+            "deadline": format_ts(self.deadline, tz),
+            "last_reply": format_ts(self.last_reply, tz),
+            "last_ping": format_ts(self.last_ping, tz),
+            "alert_sent": self.alert_sent,
+            "stats": {
+                "total_pings": self.total_pings,
+                "total_alerts": self.total_alerts,
+                "total_replies": self.total_replies,
+                "first_ping_date": format_ts(self.first_ping, tz),
+            },
+        }
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, TenantState):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"TenantState({fields})"
+
+
+DEFAULT_TENANT_STATE = TenantState()
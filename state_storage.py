@@ -0,0 +1,729 @@
+"""Backends de stockage de l'état (pluggables).
+
+- `JsonStateStorage`: fichier `state.json` réécrit en entier (tmp -> fsync -> os.replace).
+  Simple et lisible, mais coût O(état total) à chaque mutation.
+- `SqliteStateStorage`: base SQLite en mode WAL, une ligne par tenant.
+  Seules les lignes modifiées sont réécrites (upsert).
+- `JournalStateStorage`: journal en ajout seul (un enregistrement par
+  transition) + instantané compacté en arrière-plan. Écriture O(1), et le
+  journal sert d'historique consultable (`iter_history`).
+
+Les backends manipulent des dicts "bruts" (format de state.json); la validation
+reste dans StateManager.
+
+Partage entre processus (workers Gunicorn):
+- `has_changed()` détecte à moindre coût une écriture d'un autre processus
+  (stat du fichier pour JSON, `PRAGMA data_version` pour SQLite);
+- `load_changes()` relit ce qui a changé (tout le fichier pour JSON, seulement
+  les lignes plus récentes pour SQLite);
+- `transaction()` sérialise les écritures entre processus (flock / BEGIN IMMEDIATE).
+
+`save()` reçoit aussi, quand le StateManager les connaît, les transitions à
+l'origine de l'écriture (`events`: "ping", "reply", "alert", "reset"...);
+seul le journal les conserve.
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import time
+import logging
+import sqlite3
+import tempfile
+import threading
+import contextlib
+from typing import Iterable, Iterator, Mapping
+
+from config import (
+    DEFAULT_TENANT_ID, STATE_BACKEND, STATE_FILE, STATE_DB_FILE,
+    STATE_JOURNAL_DIR, STATE_JOURNAL_SEGMENT_BYTES, STATE_JOURNAL_RETENTION_DAYS,
+)
+from telemetry import STATE_FSYNC
+
+logger = logging.getLogger("whatsapp_bot")
+
+
+@contextlib.contextmanager
+def _flock(lock_file: str) -> Iterator[None]:
+    """Verrou exclusif inter-process sur `lock_file` (best-effort hors POSIX)."""
+    if os.name != "posix":
+        yield
+        return
+
+    import fcntl  # type: ignore
+
+    fh = None
+    try:
+        lock_dir = os.path.dirname(lock_file)
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+        fh = open(lock_file, "a+", encoding="utf-8")
+        fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+    except OSError as e:
+        # best-effort (certains FS réseau ne supportent pas flock)
+        logger.debug(f"Verrou {lock_file} indisponible: {e}")
+    try:
+        yield
+    finally:
+        if fh:
+            try:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+            except OSError:
+                pass
+            fh.close()
+
+
+class StateStorage:
+    """Interface commune des backends d'état."""
+
+    name = "base"
+
+    def load(self) -> dict[str, dict]:
+        """Renvoie `{tenant_id: état brut}` (dict vide si aucun état)."""
+        raise NotImplementedError
+
+    def save(self, states: Mapping[str, dict], tenant_ids: Iterable[str],
+             events: Mapping[str, list[str]] | None = None) -> None:
+        """Persiste les tenants `tenant_ids` (`states` contient l'état complet)."""
+        raise NotImplementedError
+
+    def has_changed(self) -> bool:
+        """Indique si un autre processus a écrit depuis le dernier load/save."""
+        return False
+
+    def load_changes(self) -> dict[str, dict]:
+        """Renvoie les tenants modifiés par d'autres processus depuis le dernier appel."""
+        return {}
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[None]:
+        """Section critique d'écriture partagée entre processus."""
+        yield
+
+    def close(self) -> None:
+        pass
+
+
+class JsonStateStorage(StateStorage):
+    """Fichier JSON unique `{"tenants": {...}}`, écrit de façon atomique."""
+
+    name = "json"
+
+    def __init__(self, state_file: str):
+        self.state_file = state_file
+        self.lock_file = f"{state_file}.lock"
+        self._stat_token = None
+
+    def _current_token(self):
+        """(inode, mtime, taille): change à chaque os.replace d'un autre processus."""
+        try:
+            st = os.stat(self.state_file)
+            return (st.st_ino, st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def has_changed(self) -> bool:
+        return self._current_token() != self._stat_token
+
+    def load_changes(self) -> dict[str, dict]:
+        # Le fichier étant réécrit en entier, on le relit en entier
+        return self.load()
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[None]:
+        with _flock(self.lock_file):
+            yield
+
+    def load(self) -> dict[str, dict]:
+        try:
+            self._stat_token = self._current_token()
+            if self._stat_token is None:
+                return {}
+
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+
+            if not isinstance(data, dict):
+                return {}
+            if "tenants" not in data:
+                # Ancien format: l'état du owner à la racine
+                logger.info(f"🔧 Migration de l'état mono-personne vers le tenant '{DEFAULT_TENANT_ID}'")
+                return {DEFAULT_TENANT_ID: data}
+            tenants = data.get("tenants")
+            if not isinstance(tenants, dict):
+                return {}
+            return {str(tid): st for tid, st in tenants.items()}
+
+        except json.JSONDecodeError as e:
+            logger.error(f"❌ Fichier state.json corrompu (JSON invalide): {e}")
+            logger.info("🔄 Restauration de l'état par défaut")
+            # Sauvegarder un backup du fichier corrompu
+            try:
+                backup_file = f"{self.state_file}.corrupt.{int(time.time())}"
+                os.rename(self.state_file, backup_file)
+                logger.info(f"💾 Backup du fichier corrompu: {backup_file}")
+            except Exception:
+                pass
+            return {}
+
+        except Exception as e:
+            logger.error(f"❌ Erreur lecture state.json: {e}", exc_info=True)
+            return {}
+
+    def save(self, states: Mapping[str, dict], tenant_ids: Iterable[str],
+             events: Mapping[str, list[str]] | None = None) -> None:
+        # Le fichier est réécrit en entier quel que soit `tenant_ids`
+        try:
+            # Créer le dossier si nécessaire
+            state_dir = os.path.dirname(self.state_file)
+            if state_dir:  # Si le fichier est dans un sous-dossier
+                os.makedirs(state_dir, exist_ok=True)
+
+            # Écriture atomique (NAS-friendly): tmp -> fsync -> os.replace
+            tmp_dir = state_dir or "."
+            fd, tmp_path = tempfile.mkstemp(prefix=".state.", suffix=".tmp", dir=tmp_dir)
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump({"tenants": {tid: states[tid] for tid in states}}, f, indent=2, ensure_ascii=False)
+                    f.flush()
+                    try:
+                        started = time.perf_counter()
+                        os.fsync(f.fileno())
+                        STATE_FSYNC.observe(time.perf_counter() - started, self.name)
+                    except Exception:
+                        # best-effort (certains FS / environnements)
+                        pass
+
+                os.replace(tmp_path, self.state_file)
+                self._stat_token = self._current_token()
+            finally:
+                # Si os.replace a échoué, nettoyer le tmp
+                try:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                except Exception:
+                    pass
+        except Exception as e:
+            logger.error(f"❌ Erreur écriture state.json: {e}", exc_info=True)
+            raise
+
+
+class _Statements:
+    """Requêtes SQL du backend SQLite.
+
+    Les chaînes sont constantes: le module sqlite3 garde les requêtes préparées
+    en cache par connexion (`cached_statements`), elles ne sont compilées qu'une fois.
+    """
+
+    CREATE = """
+        CREATE TABLE IF NOT EXISTS tenant_state (
+            tenant_id       TEXT PRIMARY KEY,
+            waiting         INTEGER NOT NULL DEFAULT 0,
+            deadline        TEXT,
+            last_reply      TEXT,
+            last_ping       TEXT,
+            alert_sent      INTEGER NOT NULL DEFAULT 0,
+            total_pings     INTEGER NOT NULL DEFAULT 0,
+            total_alerts    INTEGER NOT NULL DEFAULT 0,
+            total_replies   INTEGER NOT NULL DEFAULT 0,
+            first_ping_date TEXT,
+            version         INTEGER NOT NULL DEFAULT 0
+        )
+    """
+    # Bases créées avant l'ajout de la colonne `version`
+    ADD_VERSION = "ALTER TABLE tenant_state ADD COLUMN version INTEGER NOT NULL DEFAULT 0"
+    CREATE_VERSION_INDEX = "CREATE INDEX IF NOT EXISTS idx_tenant_state_version ON tenant_state(version)"
+    COLUMNS = "PRAGMA table_info(tenant_state)"
+    DATA_VERSION = "PRAGMA data_version"
+    SELECT_SINCE = """
+        SELECT tenant_id, waiting, deadline, last_reply, last_ping, alert_sent,
+               total_pings, total_alerts, total_replies, first_ping_date, version
+        FROM tenant_state
+        WHERE version > ?
+    """
+    MAX_VERSION = "SELECT COALESCE(MAX(version), 0) FROM tenant_state"
+    COUNT = "SELECT COUNT(*) FROM tenant_state"
+    # `version` croît à chaque écriture: les autres processus ne relisent que le delta
+    UPSERT = """
+        INSERT INTO tenant_state (
+            tenant_id, waiting, deadline, last_reply, last_ping, alert_sent,
+            total_pings, total_alerts, total_replies, first_ping_date, version
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+                  (SELECT COALESCE(MAX(version), 0) + 1 FROM tenant_state))
+        ON CONFLICT(tenant_id) DO UPDATE SET
+            waiting = excluded.waiting,
+            deadline = excluded.deadline,
+            last_reply = excluded.last_reply,
+            last_ping = excluded.last_ping,
+            alert_sent = excluded.alert_sent,
+            total_pings = excluded.total_pings,
+            total_alerts = excluded.total_alerts,
+            total_replies = excluded.total_replies,
+            first_ping_date = excluded.first_ping_date,
+            version = excluded.version
+    """
+
+
+class SqliteStateStorage(StateStorage):
+    """Base SQLite (WAL), une ligne par tenant, mises à jour ligne par ligne.
+
+    Au premier démarrage, un `state.json` existant est importé puis renommé
+    en `state.json.migrated`.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, db_file: str, legacy_json_file: str | None = None):
+        self.db_file = db_file
+        db_dir = os.path.dirname(db_file)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        # Accès sérialisés par le lock de StateManager: une connexion partagée suffit
+        self._conn = sqlite3.connect(
+            db_file,
+            timeout=10,
+            isolation_level=None,  # transactions explicites (BEGIN/COMMIT)
+            check_same_thread=False,
+            cached_statements=32,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # FULL: fsync à chaque commit, même garantie que l'écriture atomique JSON
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(_Statements.CREATE)
+        columns = {row[1] for row in self._conn.execute(_Statements.COLUMNS)}
+        if "version" not in columns:
+            self._conn.execute(_Statements.ADD_VERSION)
+        self._conn.execute(_Statements.CREATE_VERSION_INDEX)
+
+        self._in_transaction = False
+        self._last_version = 0
+        self._data_version = None
+
+        if legacy_json_file:
+            self._migrate_json(legacy_json_file)
+
+    def _migrate_json(self, json_file: str) -> None:
+        """Importe un state.json existant si la base est vide."""
+        if not os.path.exists(json_file):
+            return
+        if self._conn.execute(_Statements.COUNT).fetchone()[0] > 0:
+            return
+
+        states = JsonStateStorage(json_file).load()
+        if states:
+            self.save(states, states.keys())
+        try:
+            os.replace(json_file, f"{json_file}.migrated")
+        except Exception as e:
+            logger.warning(f"⚠️ Impossible de renommer {json_file} après migration: {e}")
+        logger.info(f"🔄 {len(states)} état(s) migré(s) de {json_file} vers {self.db_file}")
+
+    @staticmethod
+    def _to_row(tenant_id: str, state: dict) -> tuple:
+        stats = state.get("stats") or {}
+        return (
+            tenant_id,
+            int(bool(state.get("waiting"))),
+            state.get("deadline"),
+            state.get("last_reply"),
+            state.get("last_ping"),
+            int(bool(state.get("alert_sent"))),
+            int(stats.get("total_pings", 0)),
+            int(stats.get("total_alerts", 0)),
+            int(stats.get("total_replies", 0)),
+            stats.get("first_ping_date"),
+        )
+
+    @staticmethod
+    def _from_row(row: tuple) -> dict:
+        return {
+            "waiting": bool(row[1]),
+            "deadline": row[2],
+            "last_reply": row[3],
+            "last_ping": row[4],
+            "alert_sent": bool(row[5]),
+            "stats": {
+                "total_pings": row[6],
+                "total_alerts": row[7],
+                "total_replies": row[8],
+                "first_ping_date": row[9],
+            },
+        }
+
+    def load(self) -> dict[str, dict]:
+        self._last_version = 0
+        return self.load_changes()
+
+    def has_changed(self) -> bool:
+        # data_version ne change que sur commit d'une *autre* connexion
+        try:
+            return self._conn.execute(_Statements.DATA_VERSION).fetchone()[0] != self._data_version
+        except sqlite3.Error:
+            return True
+
+    def load_changes(self) -> dict[str, dict]:
+        # Une seule transaction de lecture (un seul instantané WAL), et la version
+        # connue avance jusqu'à la dernière ligne *lue*: un commit d'un autre
+        # process entre deux requêtes ne peut pas être sauté
+        own_transaction = not self._in_transaction
+        try:
+            if own_transaction:
+                self._conn.execute("BEGIN")
+            try:
+                self._data_version = self._conn.execute(_Statements.DATA_VERSION).fetchone()[0]
+                changes = {}
+                for row in self._conn.execute(_Statements.SELECT_SINCE, (self._last_version,)):
+                    changes[row[0]] = self._from_row(row)
+                    self._last_version = max(self._last_version, row[10])
+            finally:
+                if own_transaction:
+                    self._conn.execute("COMMIT")
+            return changes
+        except sqlite3.Error as e:
+            logger.error(f"❌ Erreur lecture {self.db_file}: {e}", exc_info=True)
+            return {}
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[None]:
+        # BEGIN IMMEDIATE: verrou d'écriture pris tout de suite (lecture + écriture cohérentes)
+        self._conn.execute("BEGIN IMMEDIATE")
+        self._in_transaction = True
+        try:
+            yield
+        except BaseException:
+            self._in_transaction = False
+            self._conn.execute("ROLLBACK")
+            raise
+        self._in_transaction = False
+        # synchronous=FULL: le fsync a lieu au COMMIT
+        started = time.perf_counter()
+        self._conn.execute("COMMIT")
+        STATE_FSYNC.observe(time.perf_counter() - started, self.name)
+
+    def save(self, states: Mapping[str, dict], tenant_ids: Iterable[str],
+             events: Mapping[str, list[str]] | None = None) -> None:
+        rows = [self._to_row(tid, states[tid]) for tid in tenant_ids if tid in states]
+        if not rows:
+            return
+        try:
+            if self._in_transaction:
+                self._upsert(rows)
+            else:
+                with self.transaction():
+                    self._upsert(rows)
+        except Exception as e:
+            logger.error(f"❌ Erreur écriture {self.db_file}: {e}", exc_info=True)
+            raise
+
+    def _upsert(self, rows: list[tuple]) -> None:
+        """Écrit les lignes (dans une transaction) et avance la version connue.
+
+        Seulement si aucune écriture d'un autre process n'attend d'être relue
+        (mode par lots: pas de relecture juste avant l'écriture).
+        """
+        before = self._conn.execute(_Statements.MAX_VERSION).fetchone()[0]
+        self._conn.executemany(_Statements.UPSERT, rows)
+        if before == self._last_version:
+            self._last_version = self._conn.execute(_Statements.MAX_VERSION).fetchone()[0]
+
+    def close(self) -> None:
+        try:
+            self._conn.close()
+        except Exception:
+            pass
+
+
+class JournalStateStorage(StateStorage):
+    """Journal d'état en ajout seul, découpé en segments, + instantané.
+
+    Fichiers (dans `journal_dir`):
+    - `segment-00000001.log`: une ligne JSON par écriture d'un tenant,
+      `[ts, tenant_id, [événements], état complet]`. Seul le dernier segment
+      reçoit des ajouts (O_APPEND + fsync, sous flock).
+    - `snapshot.json`: `{"segment": N, "tenants": {...}}`, l'état obtenu en
+      rejouant tous les segments < N.
+    - `journal.lock` / `compact.lock`: verrous inter-process.
+
+    Chargement: instantané, puis rejeu des segments >= N (le dernier
+    enregistrement d'un tenant l'emporte). Quand le segment actif dépasse
+    `segment_bytes`, un nouveau segment est ouvert et un thread compacte les
+    segments précédents dans un nouvel instantané. Les anciens segments restent
+    sur disque comme historique (`iter_history`) pendant `retention_days`.
+    """
+
+    name = "journal"
+
+    SNAPSHOT = "snapshot.json"
+
+    def __init__(
+        self,
+        journal_dir: str,
+        legacy_json_file: str | None = None,
+        segment_bytes: int = STATE_JOURNAL_SEGMENT_BYTES,
+        retention_days: float = STATE_JOURNAL_RETENTION_DAYS,
+    ):
+        self.journal_dir = journal_dir
+        self.segment_bytes = max(1024, segment_bytes)
+        self.retention_days = retention_days
+        self.lock_file = os.path.join(journal_dir, "journal.lock")
+        self.compact_lock_file = os.path.join(journal_dir, "compact.lock")
+        os.makedirs(journal_dir, exist_ok=True)
+
+        self._in_transaction = False
+        self._active_seq = 1
+        self._read_pos = (1, 0)  # (segment, offset) déjà relus
+        self._compactor: threading.Thread | None = None
+
+        if legacy_json_file:
+            self._migrate_json(legacy_json_file)
+
+    # ---------- Fichiers ----------
+
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.journal_dir, f"segment-{seq:08d}.log")
+
+    def _segments(self) -> list[int]:
+        """Numéros des segments présents, triés."""
+        seqs = []
+        for name in os.listdir(self.journal_dir):
+            if name.startswith("segment-") and name.endswith(".log"):
+                try:
+                    seqs.append(int(name[8:-4]))
+                except ValueError:
+                    continue
+        return sorted(seqs)
+
+    def _read_snapshot(self) -> tuple[int, dict[str, dict]]:
+        path = os.path.join(self.journal_dir, self.SNAPSHOT)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return int(data.get("segment", 1)), dict(data.get("tenants") or {})
+        except FileNotFoundError:
+            return 1, {}
+
+    def _write_snapshot(self, segment: int, tenants: dict[str, dict]) -> None:
+        """Écriture atomique de l'instantané (tmp -> fsync -> os.replace)."""
+        fd, tmp_path = tempfile.mkstemp(prefix=".snapshot.", suffix=".tmp", dir=self.journal_dir)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"segment": segment, "tenants": tenants}, f, ensure_ascii=False, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, os.path.join(self.journal_dir, self.SNAPSHOT))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @staticmethod
+    def _read_records(path: str, offset: int = 0) -> tuple[list[list], int]:
+        """Enregistrements complets à partir de `offset`; renvoie aussi la nouvelle position."""
+        try:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], offset
+        end = data.rfind(b"\n") + 1  # ignore une ligne en cours d'écriture
+        records = []
+        for line in data[:end].splitlines():
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                logger.warning(f"⚠️ Enregistrement illisible ignoré dans {path}")
+        return records, offset + end
+
+    def _migrate_json(self, json_file: str) -> None:
+        """Importe un state.json existant si le journal est vide."""
+        if not os.path.exists(json_file) or self._segments() or \
+                os.path.exists(os.path.join(self.journal_dir, self.SNAPSHOT)):
+            return
+        states = JsonStateStorage(json_file).load()
+        self._write_snapshot(1, states)
+        try:
+            os.replace(json_file, f"{json_file}.migrated")
+        except Exception as e:
+            logger.warning(f"⚠️ Impossible de renommer {json_file} après migration: {e}")
+        logger.info(f"🔄 {len(states)} état(s) migré(s) de {json_file} vers {self.journal_dir}")
+
+    # ---------- Interface StateStorage ----------
+
+    def load(self) -> dict[str, dict]:
+        try:
+            first_seq, states = self._read_snapshot()
+            seqs = [seq for seq in self._segments() if seq >= first_seq] or [first_seq]
+            offset = 0
+            for seq in seqs:
+                records, offset = self._read_records(self._segment_path(seq))
+                for _, tenant_id, _, state in records:
+                    states[tenant_id] = state
+            self._active_seq = seqs[-1]
+            self._read_pos = (seqs[-1], offset)
+            return states
+        except Exception as e:
+            logger.error(f"❌ Erreur lecture du journal {self.journal_dir}: {e}", exc_info=True)
+            return {}
+
+    def has_changed(self) -> bool:
+        seq, offset = self._read_pos
+        try:
+            if os.stat(self._segment_path(seq)).st_size != offset:
+                return True
+        except FileNotFoundError:
+            return True
+        return os.path.exists(self._segment_path(seq + 1))
+
+    def load_changes(self) -> dict[str, dict]:
+        changes: dict[str, dict] = {}
+        seq, offset = self._read_pos
+        while True:
+            path = self._segment_path(seq)
+            if not os.path.exists(path):
+                # Segment supprimé (rétention) pendant une longue absence: tout relire
+                return self.load()
+            records, offset = self._read_records(path, offset)
+            for _, tenant_id, _, state in records:
+                changes[tenant_id] = state
+            if not os.path.exists(self._segment_path(seq + 1)):
+                break
+            seq, offset = seq + 1, 0
+        self._read_pos = (seq, offset)
+        self._active_seq = max(self._active_seq, seq)
+        return changes
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[None]:
+        with _flock(self.lock_file):
+            self._in_transaction = True
+            try:
+                yield
+            finally:
+                self._in_transaction = False
+
+    def save(self, states: Mapping[str, dict], tenant_ids: Iterable[str],
+             events: Mapping[str, list[str]] | None = None) -> None:
+        now = round(time.time(), 3)
+        lines = [
+            json.dumps([now, tid, (events or {}).get(tid) or ["update"], states[tid]],
+                       ensure_ascii=False, separators=(",", ":"))
+            for tid in tenant_ids if tid in states
+        ]
+        if not lines:
+            return
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        try:
+            if self._in_transaction:
+                self._append(data)
+            else:
+                with self.transaction():
+                    self._append(data)
+        except Exception as e:
+            logger.error(f"❌ Erreur écriture du journal {self.journal_dir}: {e}", exc_info=True)
+            raise
+
+    def _append(self, data: bytes) -> None:
+        """Ajoute des enregistrements au segment actif (sous flock)."""
+        # Un autre processus a pu ouvrir un nouveau segment
+        while os.path.exists(self._segment_path(self._active_seq + 1)):
+            self._active_seq += 1
+        path = self._segment_path(self._active_seq)
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            start = os.fstat(fd).st_size
+            os.write(fd, data)
+            started = time.perf_counter()
+            os.fsync(fd)
+            STATE_FSYNC.observe(time.perf_counter() - started, self.name)
+        finally:
+            os.close(fd)
+
+        # Nos propres lignes n'ont pas à être relues si on était à jour
+        if self._read_pos == (self._active_seq, start):
+            self._read_pos = (self._active_seq, start + len(data))
+
+        if start + len(data) >= self.segment_bytes:
+            self._rotate()
+
+    def _rotate(self) -> None:
+        """Ouvre un nouveau segment (sous flock) et compacte les précédents en arrière-plan."""
+        self._active_seq += 1
+        open(self._segment_path(self._active_seq), "ab").close()
+        if self._compactor is None or not self._compactor.is_alive():
+            self._compactor = threading.Thread(
+                target=self.compact, args=(self._active_seq,), name="journal-compactor", daemon=True
+            )
+            self._compactor.start()
+
+    def compact(self, upto_seq: int) -> None:
+        """Écrit un instantané couvrant les segments < `upto_seq` (segments immuables)."""
+        if os.name == "posix":
+            import fcntl  # type: ignore
+            fh = open(self.compact_lock_file, "a+", encoding="utf-8")
+            try:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                fh.close()
+                return  # compaction déjà en cours dans un autre processus
+        else:
+            fh = None
+        try:
+            first_seq, states = self._read_snapshot()
+            if first_seq >= upto_seq:
+                return
+            for seq in range(first_seq, upto_seq):
+                records, _ = self._read_records(self._segment_path(seq))
+                for _, tenant_id, _, state in records:
+                    states[tenant_id] = state
+            self._write_snapshot(upto_seq, states)
+            self._purge_history(upto_seq)
+            logger.info(f"🗜️ Journal compacté: {len(states)} tenant(s), segments < {upto_seq}")
+        except Exception as e:
+            logger.error(f"❌ Échec de la compaction du journal: {e}", exc_info=True)
+        finally:
+            if fh:
+                fh.close()
+
+    def _purge_history(self, upto_seq: int) -> None:
+        """Supprime les segments compactés plus vieux que la rétention."""
+        if self.retention_days <= 0:
+            return
+        limit = time.time() - self.retention_days * 86400
+        for seq in self._segments():
+            if seq >= upto_seq:
+                break
+            path = self._segment_path(seq)
+            try:
+                if os.stat(path).st_mtime < limit:
+                    os.remove(path)
+            except OSError:
+                continue
+
+    # ---------- Historique ----------
+
+    def iter_history(self, tenant_id: str | None = None, since: float | None = None) -> Iterator[dict]:
+        """Parcourt les transitions conservées, de la plus ancienne à la plus récente."""
+        for seq in self._segments():
+            records, _ = self._read_records(self._segment_path(seq))
+            for ts, tid, events, state in records:
+                if tenant_id is not None and tid != tenant_id:
+                    continue
+                if since is not None and ts < since:
+                    continue
+                yield {"ts": ts, "tenant": tid, "events": events, "state": state}
+
+    def close(self) -> None:
+        if self._compactor is not None:
+            self._compactor.join(5.0)
+
+
+def create_state_storage(backend: str = STATE_BACKEND) -> StateStorage:
+    """Instancie le backend configuré (`STATE_BACKEND`)."""
+    if backend == "sqlite":
+        return SqliteStateStorage(STATE_DB_FILE, legacy_json_file=STATE_FILE)
+    if backend == "journal":
+        return JournalStateStorage(STATE_JOURNAL_DIR, legacy_json_file=STATE_FILE)
+    if backend != "json":
+        logger.warning(f"⚠️ STATE_BACKEND inconnu ({backend}), utilisation de 'json'")
+    return JsonStateStorage(STATE_FILE)
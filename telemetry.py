@@ -0,0 +1,387 @@
+"""Métriques Prometheus des chemins chauds (compteurs, histogrammes, jauges).
+
+Pourquoi:
+- Les seules traces étaient les logs de `wa_call` et des tâches planifiées:
+  pas de latence de l'API Graph, de temps d'écriture de l'état ni de retard
+  des jobs exploitables par Prometheus/Grafana.
+
+Fonctionnement:
+- Chaque thread écrit dans sa propre copie des valeurs (`threading.local`):
+  une observation ne prend aucun verrou (0,3 à 0,6 µs, voir
+  benchmarks/bench_telemetry.py). Les copies des threads terminés sont
+  fusionnées à la lecture.
+- Les jauges (profondeur des files) sont des fonctions lues à l'export.
+- Multiprocess (workers Gunicorn): chaque process écrit un instantané JSON
+  dans METRICS_DIR (`<hôte>-<pid>.json`, toutes les METRICS_FLUSH_SEC
+  secondes et à chaque export). `/metrics` additionne les fichiers de l'hôte;
+  les jauges d'un process arrêté sont ignorées et son fichier supprimé après
+  une heure (Prometheus gère la remise à zéro des compteurs).
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import time
+import glob
+import bisect
+import socket
+import logging
+import tempfile
+import threading
+from typing import Callable
+
+from config import METRICS_DIR, METRICS_FLUSH_SEC
+
+logger = logging.getLogger("whatsapp_bot")
+
+# Seuils par défaut (secondes): de la milliseconde aux appels HTTP lents
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Retard des jobs planifiés: de 10 ms à 10 minutes
+LAG_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 600)
+
+# Fichier d'un process arrêté supprimé après ce délai (secondes)
+DEAD_FILE_TTL_SEC = 3600
+
+
+class _Metric:
+    """Valeurs par étiquettes, une copie par thread (écrite sans verrou)."""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards: list[tuple[threading.Thread, dict]] = []
+        self._retired: dict = {}
+        _registry.register(self)
+
+    def _new_shard(self) -> dict:
+        """Copie du thread courant (une fois par thread, hors chemin chaud)"""
+        values: dict = {}
+        with self._lock:
+            self._shards.append((threading.current_thread(), values))
+        self._local.values = values
+        _registry.ensure_writer()
+        return values
+
+    def _merge(self, into: dict, values: dict) -> None:
+        raise NotImplementedError
+
+    def collect(self) -> dict:
+        """Valeurs du process (toutes copies fusionnées)"""
+        total: dict = {}
+        with self._lock:
+            live = []
+            for thread, values in self._shards:
+                if thread.is_alive():
+                    live.append((thread, values))
+                else:
+                    self._merge(self._retired, values)
+            self._shards = live
+            self._merge(total, self._retired)
+            for _, values in live:
+                self._merge(total, dict(values))
+        return total
+
+    def reset(self) -> None:
+        """Après un fork: le process enfant repart de zéro"""
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = {}
+
+
+class Counter(_Metric):
+    """Compteur croissant (exporté avec le suffixe `_total`)."""
+
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        try:
+            values = self._local.values
+        except AttributeError:
+            values = self._new_shard()
+        values[labels] = values.get(labels, 0) + amount
+
+    def _merge(self, into: dict, values: dict) -> None:
+        for labels, value in values.items():
+            into[labels] = into.get(labels, 0) + value
+
+
+class Histogram(_Metric):
+    """Histogramme à seuils fixes; chaque cellule: [comptes par seuil..., +Inf, somme]."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value: float, *labels: str) -> None:
+        try:
+            values = self._local.values
+        except AttributeError:
+            values = self._new_shard()
+        cell = values.get(labels)
+        if cell is None:
+            cell = values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def _merge(self, into: dict, values: dict) -> None:
+        for labels, cell in values.items():
+            target = into.get(labels)
+            if target is None:
+                into[labels] = list(cell)
+            else:
+                for i, value in enumerate(cell):
+                    target[i] += value
+
+
+class Gauge:
+    """Jauge lue à l'export: `read()` renvoie une valeur ou {étiquettes: valeur}.
+
+    `aggregate`: "sum" (valeur propre à chaque process, ex: file en mémoire)
+    ou "max" (valeur partagée, ex: file SQLite lue par tous les workers).
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], object],
+                 labelnames: tuple = (), aggregate: str = "sum"):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.read = read
+        self.aggregate = aggregate
+        _registry.register(self)
+
+    def collect(self) -> dict:
+        try:
+            value = self.read()
+        except Exception as e:
+            logger.warning(f"⚠️ Jauge {self.name} illisible: {e}")
+            return {}
+        if isinstance(value, dict):
+            return {labels if isinstance(labels, tuple) else (labels,): v for labels, v in value.items()}
+        return {(): value}
+
+    def reset(self) -> None:
+        pass
+
+
+class _Registry:
+    """Métriques du process, instantanés par process et export texte Prometheus."""
+
+    def __init__(self, directory: str, flush_interval: float):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.host = socket.gethostname()
+        self._metrics: dict[str, _Metric | Gauge] = {}
+        self._writer: threading.Thread | None = None
+        self._writer_lock = threading.Lock()
+
+    def register(self, metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Métrique déjà déclarée: {metric.name}")
+        self._metrics[metric.name] = metric
+
+    def reset_after_fork(self) -> None:
+        for metric in self._metrics.values():
+            metric.reset()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+
+    # ---- instantanés multiprocess ----
+
+    def _path(self, pid: int | None = None) -> str:
+        return os.path.join(self.directory, f"{self.host}-{pid or os.getpid()}.json")
+
+    def snapshot(self) -> dict:
+        metrics = {}
+        for name, metric in self._metrics.items():
+            entry = {
+                "type": metric.kind,
+                "help": metric.documentation,
+                "labels": list(metric.labelnames),
+                "samples": [[list(labels), value] for labels, value in metric.collect().items()],
+            }
+            if isinstance(metric, Histogram):
+                entry["buckets"] = list(metric.buckets)
+            if isinstance(metric, Gauge):
+                entry["aggregate"] = metric.aggregate
+            metrics[name] = entry
+        return {"pid": os.getpid(), "time": time.time(), "metrics": metrics}
+
+    def write_snapshot(self) -> dict:
+        """Écrit l'instantané du process (tmp -> os.replace) et le renvoie"""
+        snapshot = self.snapshot()
+        if not self.directory:
+            return snapshot
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix=".metrics.", suffix=".tmp", dir=self.directory)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f, separators=(",", ":"))
+            os.replace(tmp_path, self._path())
+        except OSError as e:
+            logger.warning(f"⚠️ Écriture des métriques impossible ({self.directory}): {e}")
+        return snapshot
+
+    def ensure_writer(self) -> None:
+        """Démarre l'écriture périodique (premier thread qui observe, après un éventuel fork)"""
+        if self._writer is not None or not self.directory:
+            return
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run_writer, name="metrics-writer", daemon=True)
+                self._writer.start()
+
+    def _run_writer(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            self.write_snapshot()
+
+    @staticmethod
+    def _pid_alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def _snapshots(self) -> list[tuple[dict, bool]]:
+        """Instantanés des process de l'hôte: [(instantané, vivant)]"""
+        own = self.write_snapshot()
+        if not self.directory:
+            return [(own, True)]
+        result = [(own, True)]
+        now = time.time()
+        for path in glob.glob(os.path.join(self.directory, f"{self.host}-*.json")):
+            if path == self._path():
+                continue
+            try:
+                with open(path, encoding="utf-8") as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue  # en cours de remplacement ou supprimé
+            alive = self._pid_alive(int(snapshot.get("pid", 0)))
+            if not alive and now - snapshot.get("time", 0) > DEAD_FILE_TTL_SEC:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+                continue
+            result.append((snapshot, alive))
+        return result
+
+    # ---- export ----
+
+    def merged(self) -> dict:
+        """Métriques additionnées sur les process de l'hôte"""
+        merged: dict[str, dict] = {}
+        for snapshot, alive in self._snapshots():
+            for name, entry in snapshot["metrics"].items():
+                if entry["type"] == "gauge" and not alive:
+                    continue
+                target = merged.setdefault(name, {**entry, "samples": {}})
+                samples = target["samples"]
+                for labels, value in entry["samples"]:
+                    key = tuple(labels)
+                    current = samples.get(key)
+                    if current is None:
+                        samples[key] = list(value) if isinstance(value, list) else value
+                    elif entry["type"] == "histogram":
+                        for i, v in enumerate(value):
+                            current[i] += v
+                    elif entry.get("aggregate") == "max":
+                        samples[key] = max(current, value)
+                    else:
+                        samples[key] = current + value
+        return merged
+
+    def render(self) -> str:
+        """Format texte Prometheus (version 0.0.4)"""
+        lines = []
+        for name, entry in sorted(self.merged().items()):
+            exported = f"{name}_total" if entry["type"] == "counter" else name
+            lines.append(f"# HELP {exported} {_escape_help(entry['help'])}")
+            lines.append(f"# TYPE {exported} {entry['type']}")
+            labelnames = entry["labels"]
+            for labels, value in sorted(entry["samples"].items()):
+                pairs = list(zip(labelnames, labels))
+                if entry["type"] != "histogram":
+                    lines.append(f"{exported}{_labels(pairs)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(entry["buckets"] + ["+Inf"], value[:-1]):
+                    cumulative += count
+                    le = bound if bound == "+Inf" else _number(bound)
+                    lines.append(f"{name}_bucket{_labels(pairs + [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(pairs)} {_number(value[-1])}")
+                lines.append(f"{name}_count{_labels(pairs)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _labels(pairs: list[tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in pairs) + "}"
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+_registry = _Registry(METRICS_DIR, METRICS_FLUSH_SEC)
+os.register_at_fork(after_in_child=_registry.reset_after_fork)
+
+
+def render_metrics() -> str:
+    """Export texte Prometheus de toutes les métriques de l'hôte"""
+    return _registry.render()
+
+
+# ================== MÉTRIQUES ==================
+
+GRAPH_LATENCY = Histogram(
+    "whatsapp_graph_request_seconds", "Durée des appels à l'API Graph par statut HTTP et modèle",
+    ("status", "template"),
+)
+GRAPH_RETRIES = Counter(
+    "whatsapp_graph_retries", "Tentatives à réessayer (429, 5xx, erreur réseau)", ("reason",),
+)
+GRAPH_RATE_LIMITED = Counter("whatsapp_graph_rate_limited", "Réponses 429 de l'API Graph")
+
+STATE_SAVE = Histogram("state_save_seconds", "Durée d'écriture d'un lot de l'état", ("backend",))
+STATE_FSYNC = Histogram("state_fsync_seconds", "Durée des fsync (commit SQLite) de l'état", ("backend",))
+STATE_LOCK_WAIT = Histogram("state_lock_wait_seconds", "Attente du lock du StateManager avant une mutation")
+
+WEBHOOK_REQUEST = Histogram("webhook_request_seconds", "Durée de traitement HTTP d'un POST /webhook")
+WEBHOOK_EVENT = Histogram(
+    "webhook_event_seconds", "Durée de traitement d'un événement de la file webhook", ("type",),
+)
+
+SCHEDULER_JOB_LAG = Histogram(
+    "scheduler_job_lag_seconds", "Retard de lancement des jobs planifiés", ("job",), buckets=LAG_BUCKETS,
+)
+SCHEDULER_JOB_MISSED = Counter("scheduler_job_missed", "Exécutions de jobs manquées", ("job",))
+
+SPAN_WALL = Histogram("span_seconds", "Durée des opérations tracées (profiling.py, PROFILE_SPANS)", ("span",))
+SPAN_CPU = Histogram("span_cpu_seconds", "Temps CPU du thread des opérations tracées", ("span",))
@@ -0,0 +1,191 @@
+"""Registre des personnes surveillées (tenants).
+
+Contexte:
+- Historiquement le bot ne surveillait qu'une personne (`OWNER_PHONE`).
+- Le registre permet à un seul process de surveiller plusieurs personnes, chacune
+  avec son heure de ping, son délai de réponse, son fuseau horaire et ses contacts
+  d'alerte.
+
+Sources:
+- `TENANTS_FILE` (JSON) si présent: liste de tenants.
+- Variables d'environnement historiques (`OWNER_PHONE`, `ALERT_PHONES`, ...):
+  tenant `DEFAULT_TENANT_ID`, ajouté si son numéro n'est pas déjà dans le fichier.
+
+Les recherches par id et par numéro WhatsApp passent par des index (dict) en O(1).
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import logging
+from dataclasses import dataclass, field
+from zoneinfo import ZoneInfo
+
+from config import (
+    TZ, OWNER_PHONE, ALERT_PHONES, DAILY_HOUR, RESPONSE_TIMEOUT_MIN,
+    DEFAULT_TENANT_ID, TENANTS_FILE,
+)
+
+logger = logging.getLogger("whatsapp_bot")
+
+
+def normalize_phone(phone: str) -> str:
+    """Renvoie l'identifiant WhatsApp (chiffres sans '+' ni espaces) d'un numéro."""
+    return (phone or "").replace(" ", "").lstrip("+")
+
+
+@dataclass(frozen=True)
+class Tenant:
+    """Une personne surveillée et sa configuration."""
+    tenant_id: str
+    phone: str
+    daily_hour: int = DAILY_HOUR
+    timeout_min: int = RESPONSE_TIMEOUT_MIN
+    tz: ZoneInfo = TZ
+    alert_phones: tuple[str, ...] = field(default_factory=tuple)
+    name: str | None = None
+
+    @property
+    def wa_id(self) -> str:
+        """Numéro tel qu'il apparaît dans le champ `from` des webhooks Meta."""
+        return normalize_phone(self.phone)
+
+
+class TenantRegistry:
+    """Index en mémoire des tenants (par id et par numéro WhatsApp)."""
+
+    def __init__(self, tenants: list[Tenant] | None = None):
+        self._by_id: dict[str, Tenant] = {}
+        self._by_wa_id: dict[str, Tenant] = {}
+        for tenant in tenants or []:
+            self.add(tenant)
+
+    def add(self, tenant: Tenant) -> None:
+        """Ajoute un tenant (id et numéro doivent être uniques)."""
+        if tenant.tenant_id in self._by_id:
+            raise ValueError(f"Tenant en double: {tenant.tenant_id}")
+        if tenant.wa_id in self._by_wa_id:
+            raise ValueError(f"Numéro en double: {tenant.phone} ({tenant.tenant_id})")
+        self._by_id[tenant.tenant_id] = tenant
+        self._by_wa_id[tenant.wa_id] = tenant
+
+    def get(self, tenant_id: str) -> Tenant | None:
+        return self._by_id.get(tenant_id)
+
+    def get_by_phone(self, phone: str) -> Tenant | None:
+        """Recherche par numéro (avec ou sans '+')."""
+        return self._by_wa_id.get(normalize_phone(phone))
+
+    def all(self) -> list[Tenant]:
+        return list(self._by_id.values())
+
+    @property
+    def default_id(self) -> str | None:
+        """Tenant affiché par défaut (/health, /stats, debug)."""
+        if DEFAULT_TENANT_ID in self._by_id:
+            return DEFAULT_TENANT_ID
+        return next(iter(self._by_id), None)
+
+    def schedule_groups(self) -> dict[tuple[str, int], list[str]]:
+        """Regroupe les tenants par (timezone, heure de ping).
+
+        Un seul job cron par groupe plutôt qu'un job par tenant.
+        """
+        groups: dict[tuple[str, int], list[str]] = {}
+        for tenant in self._by_id.values():
+            groups.setdefault((str(tenant.tz), tenant.daily_hour), []).append(tenant.tenant_id)
+        return groups
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __contains__(self, tenant_id: str) -> bool:
+        return tenant_id in self._by_id
+
+
+def _parse_tenant(raw: dict, index: int) -> Tenant:
+    """Construit un Tenant depuis une entrée JSON (valeurs par défaut depuis config)."""
+    if not isinstance(raw, dict):
+        raise ValueError(f"tenants[{index}] doit être un objet JSON")
+
+    tenant_id = str(raw.get("id") or "").strip()
+    if not tenant_id:
+        raise ValueError(f"tenants[{index}]: champ 'id' manquant")
+
+    phone = str(raw.get("phone") or "").replace(" ", "")
+    if not normalize_phone(phone):
+        raise ValueError(f"tenants[{index}] ({tenant_id}): champ 'phone' manquant")
+
+    try:
+        daily_hour = int(raw.get("daily_hour", DAILY_HOUR))
+        timeout_min = int(raw.get("timeout_min", RESPONSE_TIMEOUT_MIN))
+    except (ValueError, TypeError):
+        raise ValueError(f"tenants[{index}] ({tenant_id}): daily_hour/timeout_min invalides")
+    if daily_hour < 0 or daily_hour > 23:
+        raise ValueError(f"tenants[{index}] ({tenant_id}): daily_hour doit être entre 0 et 23")
+    if timeout_min <= 0:
+        raise ValueError(f"tenants[{index}] ({tenant_id}): timeout_min doit être > 0")
+
+    tz = TZ
+    if raw.get("tz"):
+        try:
+            tz = ZoneInfo(str(raw["tz"]))
+        except Exception:
+            raise ValueError(f"tenants[{index}] ({tenant_id}): tz invalide ({raw['tz']})")
+
+    alert_phones = raw.get("alert_phones", [])
+    if isinstance(alert_phones, str):
+        alert_phones = alert_phones.split(",")
+    if not isinstance(alert_phones, list):
+        raise ValueError(f"tenants[{index}] ({tenant_id}): alert_phones doit être une liste")
+
+    return Tenant(
+        tenant_id=tenant_id,
+        phone=phone,
+        daily_hour=daily_hour,
+        timeout_min=timeout_min,
+        tz=tz,
+        alert_phones=tuple(str(p).replace(" ", "") for p in alert_phones if str(p).strip()),
+        name=raw.get("name"),
+    )
+
+
+def load_tenant_registry(tenants_file: str = TENANTS_FILE) -> TenantRegistry:
+    """Charge le registre depuis `tenants_file` + le tenant historique `OWNER_PHONE`.
+
+    Lève ValueError si le fichier est invalide (fail-fast comme validate_config).
+    """
+    registry = TenantRegistry()
+
+    if tenants_file and os.path.exists(tenants_file):
+        try:
+            with open(tenants_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Fichier tenants invalide ({tenants_file}): {e}")
+
+        entries = data.get("tenants", []) if isinstance(data, dict) else data
+        if not isinstance(entries, list):
+            raise ValueError(f"Fichier tenants invalide ({tenants_file}): liste attendue")
+
+        for i, raw in enumerate(entries):
+            registry.add(_parse_tenant(raw, i))
+        logger.info(f"👥 {len(registry)} tenant(s) chargé(s) depuis {tenants_file}")
+
+    if OWNER_PHONE:
+        if registry.get_by_phone(OWNER_PHONE):
+            logger.info("ℹ️ OWNER_PHONE déjà présent dans le fichier tenants")
+        elif DEFAULT_TENANT_ID in registry:
+            logger.warning(f"⚠️ Id '{DEFAULT_TENANT_ID}' déjà utilisé dans {tenants_file}, OWNER_PHONE ignoré")
+        else:
+            registry.add(Tenant(
+                tenant_id=DEFAULT_TENANT_ID,
+                phone=OWNER_PHONE,
+                alert_phones=tuple(ALERT_PHONES),
+            ))
+
+    if len(registry) == 0:
+        logger.warning("⚠️ Aucun tenant configuré (OWNER_PHONE vide et pas de fichier tenants)")
+
+    return registry
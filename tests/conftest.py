@@ -0,0 +1,23 @@
+"""Configuration commune des tests (pytest depuis la racine du dépôt)."""
+import os
+import sys
+
+# Variables lues à l'import de config.py: à définir avant tout import du bot
+os.environ.setdefault("WHATSAPP_TOKEN", "test-token")
+os.environ.setdefault("WHATSAPP_PHONE_ID", "123456789")
+os.environ.setdefault("WEBHOOK_VERIFY_TOKEN", "verify")
+os.environ.setdefault("OWNER_PHONE", "+33600000000")
+os.environ.setdefault("ALERT_PHONES", "+33611111111")
+os.environ.setdefault("WA_API_BASE_URL", "http://127.0.0.1:9")  # aucun envoi réel
+os.environ["METRICS_DIR"] = ""  # métriques du process courant, sans fichiers
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def _tmp_cwd(tmp_path, monkeypatch):
+    """Chaque test dans son dossier: les chemins relatifs (data/...) y sont créés"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,61 @@
+"""Déduplication des webhooks: partagée entre workers via SQLite."""
+import time
+
+import pytest
+
+from dedup_cache import DedupCache
+
+
+@pytest.fixture
+def make_cache(tmp_path):
+    opened = []
+
+    def make():
+        cache = DedupCache(max_size=100, ttl=60, db_file=str(tmp_path / "dedup.db"))
+        opened.append(cache)
+        return cache
+
+    yield make
+    for cache in opened:
+        cache.close()
+
+
+def test_duplicate_in_same_process(make_cache):
+    cache = make_cache()
+    assert cache.check_and_add("wamid.1")
+    assert not cache.check_and_add("wamid.1")
+    assert cache.metrics()["hits"] == 1
+
+
+def test_retry_on_other_worker_is_a_duplicate(make_cache):
+    first, second = make_cache(), make_cache()
+    assert first.check_and_add("wamid.1")
+    assert not second.check_and_add("wamid.1")
+    assert second.metrics()["shared_hits"] == 1
+    # Ensuite servi par la LRU locale, sans requête
+    assert not second.check_and_add("wamid.1")
+    assert second.metrics()["hits"] == 1
+
+
+def test_discard_allows_reprocessing_anywhere(make_cache):
+    first, second = make_cache(), make_cache()
+    assert first.check_and_add("wamid.1")
+    first.discard("wamid.1")
+    assert second.check_and_add("wamid.1")
+
+
+def test_expired_id_is_new_again(make_cache, monkeypatch):
+    first, second = make_cache(), make_cache()
+    assert first.check_and_add("wamid.1")
+    later = time.time() + 61
+    monkeypatch.setattr(time, "time", lambda: later)
+    assert second.check_and_add("wamid.1")
+    assert second.metrics()["shared_size"] == 1  # purgé puis réinséré
+
+
+def test_memory_only_without_database():
+    cache = DedupCache(max_size=2, ttl=60)
+    assert cache.check_and_add("a") and cache.check_and_add("b") and cache.check_and_add("c")
+    assert len(cache) == 2
+    assert cache.check_and_add("a")  # sorti de la LRU bornée
+
@@ -0,0 +1,54 @@
+"""Flux SSE: un abonné ne reçoit que les transitions de son tenant."""
+import json
+
+import pytest
+
+from event_hub import EventHub
+from state_manager import StateManager
+
+
+@pytest.fixture
+def hub_and_writer(tmp_path):
+    """Hub d'un worker abonné à son StateManager, et un autre worker qui écrit"""
+    state_file = str(tmp_path / "state.json")
+    writer = StateManager(state_file, commit_mode="sync")
+    for tenant_id in ("a", "b"):
+        writer.reset_waiting(tenant_id)
+    served = StateManager(state_file, commit_mode="sync")
+    hub = EventHub(keepalive=0.05)
+    served.add_listener(hub.on_state_change, replay=False)
+    return hub, writer, served
+
+
+def test_write_to_other_tenant_pushes_no_frame(hub_and_writer):
+    hub, writer, served = hub_and_writer
+    stream = hub.stream("b", lambda: [b"snapshot\n\n"], max_duration=5)
+    assert next(stream).startswith(b"retry:")
+    assert next(stream) == b"snapshot\n\n"
+
+    writer.set_reply("a")
+    served.refresh(force=True)
+    assert hub.published == 1
+    assert next(stream) == b": keepalive\n\n"
+
+    writer.set_reply("b")
+    served.refresh(force=True)
+    frame = next(stream).decode()
+    payload = json.loads(frame.split("data: ", 1)[1])
+    assert (payload["tenant"], payload["event"]) == ("b", "reply")
+    stream.close()
+
+
+def test_frames_use_tenant_timezone(hub_and_writer):
+    from zoneinfo import ZoneInfo
+
+    hub, writer, served = hub_and_writer
+    hub.tenant_tz = lambda tenant_id: ZoneInfo("America/New_York")
+    stream = hub.stream("a", lambda: [], max_duration=5)
+    next(stream)
+
+    writer.set_reply("a")
+    served.refresh(force=True)
+    payload = json.loads(next(stream).decode().split("data: ", 1)[1])
+    assert payload["last_reply"].endswith(("-04:00", "-05:00"))
+    stream.close()
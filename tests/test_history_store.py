@@ -0,0 +1,103 @@
+"""Historique quotidien: réponses créditées au seul ping en attente, séries."""
+import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from history_store import HistoryStore
+
+TZ = ZoneInfo("Europe/Paris")
+TODAY = datetime.date(2026, 3, 20)
+
+
+def _ts(day: datetime.date, hour: int = 9) -> int:
+    return int(datetime.datetime(day.year, day.month, day.day, hour, tzinfo=TZ).timestamp())
+
+
+def _day(offset: int) -> datetime.date:
+    return TODAY + datetime.timedelta(days=offset)
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = HistoryStore(str(tmp_path / "history.db"))
+    yield s
+    s.close()
+
+
+def _stats(store: HistoryStore, today: datetime.date = TODAY) -> dict:
+    return store.window_stats("t", days=30, tz=TZ, today=today.toordinal())
+
+
+def _replied_day(store: HistoryStore, offset: int) -> None:
+    store.record_ping("t", _ts(_day(offset)), TZ)
+    store.record_reply("t", _ts(_day(offset), hour=10))
+
+
+def _missed_day(store: HistoryStore, offset: int) -> None:
+    store.record_ping("t", _ts(_day(offset)), TZ)
+    store.record_alert("t", delivered=True)
+    store.record_reset("t")
+
+
+def test_streak_runs_through_yesterday_before_todays_ping(store):
+    for offset in (-3, -2, -1):
+        _replied_day(store, offset)
+    stats = _stats(store)
+    assert stats["current_streak_days"] == 3
+    assert stats["longest_streak_days"] == 3
+
+
+def test_streak_kept_while_todays_ping_is_pending(store):
+    for offset in (-2, -1):
+        _replied_day(store, offset)
+    store.record_ping("t", _ts(TODAY), TZ)
+    stats = _stats(store)
+    assert stats["pending"] is True
+    assert stats["current_streak_days"] == 2
+    assert stats["response_rate"] == 100
+
+
+def test_streak_reset_when_last_ping_has_no_reply(store):
+    for offset in (-3, -2):
+        _replied_day(store, offset)
+    _missed_day(store, -1)
+    stats = _stats(store)
+    assert stats["pending"] is False
+    assert stats["current_streak_days"] == 0
+    assert stats["longest_streak_days"] == 2
+
+
+def test_streak_reset_when_last_ping_is_older_than_yesterday(store):
+    for offset in (-5, -4, -3):
+        _replied_day(store, offset)
+    stats = _stats(store)
+    assert stats["current_streak_days"] == 0
+    assert stats["longest_streak_days"] == 3
+
+
+def test_late_reply_is_not_credited_to_closed_ping(store):
+    _missed_day(store, -3)
+    # Pas de ping délivré ensuite, réponse trois jours plus tard
+    store.record_reply("t", _ts(TODAY))
+    stats = _stats(store)
+    assert stats["replies"] == 0
+    assert stats["reply_latency_p50_s"] is None
+
+
+def test_reply_credited_to_waiting_ping_only_once(store):
+    store.record_ping("t", _ts(_day(-1)), TZ)
+    store.record_reply("t", _ts(_day(-1), hour=11))
+    store.record_reply("t", _ts(_day(-1), hour=12))
+    stats = _stats(store)
+    assert stats["replies"] == 1
+    assert stats["reply_latency_p50_s"] == 2 * 3600
+
+
+def test_new_ping_closes_previous_waiting_ping(store):
+    store.record_ping("t", _ts(_day(-2)), TZ)  # jamais résolu (process arrêté)
+    store.record_ping("t", _ts(_day(-1)), TZ)
+    store.record_reply("t", _ts(_day(-1), hour=10))
+    stats = _stats(store)
+    assert stats["replies"] == 1
+    assert stats["current_streak_days"] == 1
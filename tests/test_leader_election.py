@@ -0,0 +1,85 @@
+"""Élection par bail: reprise à expiration et refus des jetons périmés."""
+import time
+
+import pytest
+
+from leader_election import LeaderElector, SqliteLeaseBackend
+
+TTL = 0.2
+
+
+@pytest.fixture
+def backends(tmp_path):
+    """Deux connexions à la même base, comme deux conteneurs"""
+    opened = [SqliteLeaseBackend(str(tmp_path / "leases.db")) for _ in range(2)]
+    yield opened
+    for backend in opened:
+        backend.close()
+
+
+def test_lease_is_exclusive_until_expiry(backends):
+    a, b = backends
+    lease_a = a.try_acquire("scheduler", "a", TTL)
+    assert lease_a is not None and lease_a.token == 1
+    assert b.try_acquire("scheduler", "b", TTL) is None
+    # Renouvellement par le détenteur: même jeton
+    assert a.try_acquire("scheduler", "a", TTL).token == 1
+    assert a.renew(lease_a, TTL) is not None
+
+
+def test_takeover_after_expiry_bumps_fencing_token(backends):
+    a, b = backends
+    lease_a = a.try_acquire("scheduler", "a", TTL)
+    time.sleep(TTL * 1.5)
+
+    lease_b = b.try_acquire("scheduler", "b", TTL)
+    assert lease_b is not None
+    assert lease_b.token == lease_a.token + 1
+    # L'ancien leader qui se réveille ne peut ni renouveler ni exécuter
+    assert a.renew(lease_a, TTL) is None
+    assert not a.claim(lease_a, "daily_ping:2026-03-20")
+    assert b.claim(lease_b, "daily_ping:2026-03-20")
+
+
+def test_run_key_is_claimed_once_per_token_holder(backends):
+    a, b = backends
+    lease_a = a.try_acquire("scheduler", "a", 30)
+    assert a.claim(lease_a, "daily_ping:2026-03-20")
+    assert not a.claim(lease_a, "daily_ping:2026-03-20")
+    a.release(lease_a)
+
+    # Bail rendu: repris sans attendre, la clé déjà exécutée reste refusée
+    lease_b = b.try_acquire("scheduler", "b", 30)
+    assert lease_b.token == lease_a.token + 1
+    assert not b.claim(lease_b, "daily_ping:2026-03-20")
+    assert b.claim(lease_b, "daily_ping:2026-03-21")
+
+
+def test_elector_steps_down_when_lease_may_have_expired(backends, monkeypatch):
+    a, b = backends
+    revoked = []
+    elector = LeaderElector(a, candidate_id="a", ttl=30, on_revoked=lambda: revoked.append(True))
+    elector._step()
+    assert elector.is_leader() and elector.claim("run-1")
+
+    # Processus suspendu plus longtemps que le bail (horloge monotone)
+    later = time.monotonic() + 31
+    monkeypatch.setattr(time, "monotonic", lambda: later)
+    assert not elector.is_leader()
+    assert not elector.claim("run-2")
+    elector._step()
+    assert revoked == [True]
+
+
+def test_elector_loses_lease_taken_by_other_candidate(backends):
+    a, b = backends
+    elector = LeaderElector(a, candidate_id="a", ttl=TTL)
+    elector._step()
+    old_token = elector.lease.token
+    time.sleep(TTL * 1.5)
+    assert b.try_acquire("scheduler", "b", 30).token == old_token + 1
+
+    elector._valid_until = time.monotonic() + 30  # horloge locale en retard sur le backend
+    elector._step()
+    assert not elector.is_leader()
+    assert elector.revocations == 1
@@ -0,0 +1,161 @@
+"""Outbox: déduplication, retries avec délai exponentiel, alertes non bloquées."""
+import sqlite3
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from outbound_dispatcher import Attempt, PRIORITY_HIGH
+from outbox import KIND_ALERT, KIND_PING, Outbox, OutboxMessage
+
+
+class _Response:
+    def __init__(self, message_id: str):
+        self._message_id = message_id
+
+    def json(self):
+        return {"messages": [{"id": self._message_id}]}
+
+
+class FakeTransport:
+    """Futures résolus à la main par le test"""
+
+    def __init__(self):
+        self.calls: list[tuple[dict, int, Future]] = []
+
+    def __call__(self, payload: dict, priority: int) -> Future:
+        future = Future()
+        self.calls.append((payload, priority, future))
+        return future
+
+    def payloads(self) -> list[str]:
+        return [payload["id"] for payload, _, _ in self.calls]
+
+
+@pytest.fixture
+def transport():
+    return FakeTransport()
+
+
+@pytest.fixture
+def outbox(tmp_path, transport):
+    box = Outbox(str(tmp_path / "outbox.db"), transport, batch_size=2, max_attempts=3,
+                 backoff_base=10, backoff_max=25)
+    yield box
+    box.close()
+
+
+def _rows(outbox: Outbox) -> dict:
+    conn = sqlite3.connect(outbox.db_file)
+    try:
+        return {
+            row[0]: row[1:]
+            for row in conn.execute("SELECT json_extract(payload, '$.id'), status, attempts, next_attempt_at, message_id FROM outbox")
+        }
+    finally:
+        conn.close()
+
+
+def _ping(n: int, **kwargs) -> OutboxMessage:
+    return OutboxMessage(KIND_PING, f"+3360000000{n}", {"id": f"ping-{n}"}, tenant_id=f"t{n}", **kwargs)
+
+
+def _alert(n: int, **kwargs) -> OutboxMessage:
+    return OutboxMessage(KIND_ALERT, f"+3361111111{n}", {"id": f"alert-{n}"}, tenant_id="t0",
+                         priority=PRIORITY_HIGH, **kwargs)
+
+
+def test_dedup_key_is_enqueued_once(outbox):
+    key = "alert:t0:2026-01-01T11:00:00:+33611111110"
+    assert outbox.enqueue([_alert(0, dedup_key=key)]) == 1
+    assert outbox.enqueue([_alert(0, dedup_key=key), _ping(1)]) == 1
+    assert outbox.metrics()["deduplicated"] == 1
+    assert sorted(_rows(outbox)) == ["alert-0", "ping-1"]
+
+
+def test_sent_message_is_finalized_from_its_future(outbox, transport):
+    outbox.stop()  # pas de thread de vidage: tours pilotés par le test
+    outbox.enqueue([_ping(1)])
+    assert outbox.drain_once() == 1
+    transport.calls[0][2].set_result(Attempt(response=_Response("wamid.1")))
+    outbox.drain_once()
+    assert _rows(outbox)["ping-1"][0] == "sent"
+    assert _rows(outbox)["ping-1"][3] == "wamid.1"
+
+
+def test_temporary_failure_is_retried_with_backoff_then_abandoned(outbox, transport):
+    outbox.stop()
+    outbox.enqueue([_ping(1)])
+    delays = []
+    for attempt in range(1, 4):
+        # Message redevenu dû: on avance son échéance au lieu d'attendre
+        conn = sqlite3.connect(outbox.db_file)
+        conn.execute("UPDATE outbox SET next_attempt_at = 0 WHERE status = 'pending'")
+        conn.commit()
+        conn.close()
+        assert outbox.drain_once() == 1
+        started = time.time()
+        transport.calls[-1][2].set_result(Attempt(retry_after=0.0))
+        outbox.drain_once()
+        status, attempts, next_attempt_at, _ = _rows(outbox)["ping-1"]
+        assert attempts == attempt
+        if attempt < 3:
+            assert status == "pending"
+            delays.append(next_attempt_at - started)
+    assert status == "failed"
+    # Délai exponentiel (base 10 s, ±20 %), plafonné à 25 s
+    assert 8 <= delays[0] <= 12.5
+    assert 16 <= delays[1] <= 25.1
+
+
+def test_rate_limit_retry_after_is_respected(outbox, transport):
+    outbox.stop()
+    outbox.enqueue([_ping(1)])
+    outbox.drain_once()
+    started = time.time()
+    transport.calls[0][2].set_result(Attempt(retry_after=60.0, rate_limited=True))
+    outbox.drain_once()
+    assert _rows(outbox)["ping-1"][2] - started >= 60
+
+
+def test_permanent_error_is_not_retried(outbox, transport):
+    outbox.stop()
+    outbox.enqueue([_ping(1)])
+    outbox.drain_once()
+    transport.calls[0][2].set_result(Attempt())
+    outbox.drain_once()
+    assert _rows(outbox)["ping-1"][:2] == ("failed", 1)
+
+
+def test_alert_is_claimed_while_pings_are_still_in_flight(outbox, transport):
+    outbox.stop()
+    outbox.enqueue([_ping(n) for n in range(6)])
+    # Plafond (2 lots de 2) atteint, aucun envoi terminé
+    while outbox.drain_once():
+        pass
+    assert len(transport.calls) == outbox.max_inflight == 4
+
+    outbox.enqueue([_alert(0)])
+    assert outbox.drain_once() == 1
+    assert transport.payloads()[-1] == "alert-0"
+    assert transport.calls[-1][1] == PRIORITY_HIGH
+    assert _rows(outbox)["ping-5"][0] == "pending"
+
+
+def test_drain_thread_does_not_wait_for_slow_batch(outbox, transport):
+    outbox.enqueue([_ping(1), _ping(2)])
+    deadline = time.time() + 5
+    while len(transport.calls) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+
+    outbox.enqueue([_alert(0)])
+    while len(transport.calls) < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    assert transport.payloads()[-1] == "alert-0"
+
+    transport.calls[-1][2].set_result(Attempt(response=_Response("wamid.a")))
+    while _rows(outbox)["alert-0"][0] != "sent" and time.time() < deadline:
+        time.sleep(0.01)
+    assert _rows(outbox)["alert-0"][0] == "sent"
+    assert _rows(outbox)["ping-1"][0] == "sending"
+    outbox.stop()
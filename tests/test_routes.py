@@ -0,0 +1,93 @@
+"""Routes HTTP: contrôle d'accès et codes d'erreur."""
+import pytest
+from flask import Flask
+
+import routes.debug
+from routes import health, metrics
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(health.bp)
+    app.register_blueprint(metrics.bp)
+    return app.test_client()
+
+
+@pytest.mark.parametrize("path", ["/metrics/queues", "/metrics/delivery"])
+def test_internal_metrics_require_debug_access(client, monkeypatch, path):
+    monkeypatch.setattr(routes.debug, "ENABLE_DEBUG", False)
+    assert client.get(path).status_code == 403
+
+    monkeypatch.setattr(routes.debug, "ENABLE_DEBUG", True)
+    monkeypatch.setattr(routes.debug, "DEBUG_TOKEN", "secret")
+    assert client.get(path).status_code == 403
+    assert client.get(path, headers={"X-Debug-Token": "secret"}).status_code == 200
+
+
+@pytest.mark.parametrize("path", ["/health", "/stats"])
+def test_unknown_tenant_is_404(client, path):
+    assert client.get(f"{path}?tenant=inconnu").status_code == 404
+    assert client.get(path).status_code == 200
+
+
+@pytest.fixture
+def shared_state(tmp_path, monkeypatch):
+    """Deux workers sur le même state.json: (écrivain, StateManager servi par les routes)"""
+    import state_manager
+    from state_manager import StateManager
+    from tenants import Tenant, TenantRegistry
+
+    registry = TenantRegistry([Tenant("t1", "+33600000001"), Tenant("t2", "+33600000002")])
+    state_file = str(tmp_path / "state.json")
+    writer = StateManager(state_file, commit_mode="sync")
+    for tenant_id in ("t1", "t2"):
+        writer.reset_waiting(tenant_id)
+    served = StateManager(state_file, commit_mode="sync")
+    monkeypatch.setattr(state_manager, "STATE_REFRESH_INTERVAL", 0)
+    monkeypatch.setattr(health, "get_state_manager", lambda: served)
+    monkeypatch.setattr(health, "get_tenant_registry", lambda: registry)
+    monkeypatch.setattr(health, "_stats_cache", {})
+    return writer, served
+
+
+def test_stats_etag_ignores_other_tenants_writes(client, shared_state):
+    writer, served = shared_state
+    etag = client.get("/stats?tenant=t1").headers["ETag"]
+    cached = health._stats_cache["t1"]
+
+    writer.set_reply("t2")
+    assert client.get("/stats?tenant=t2").get_json()["stats"]["total_replies"] == 1
+    response = client.get("/stats?tenant=t1", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    # Document de t1 servi depuis le cache, pas reconstruit
+    assert health._stats_cache["t1"] is cached
+
+    writer.set_reply("t1")
+    assert client.get("/stats?tenant=t1", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_all_tenants_stream_requires_debug_access(monkeypatch):
+    from routes import events
+
+    app = Flask(__name__)
+    app.register_blueprint(events.bp)
+    monkeypatch.setattr(routes.debug, "ENABLE_DEBUG", False)
+    assert app.test_client().get("/events?tenant=all").status_code == 403
+
+
+def test_health_uses_tenant_timezone(client, shared_state, monkeypatch):
+    from zoneinfo import ZoneInfo
+
+    from tenants import Tenant, TenantRegistry
+
+    writer, served = shared_state
+    registry = TenantRegistry([Tenant("t1", "+33600000001", tz=ZoneInfo("America/New_York"))])
+    monkeypatch.setattr(health, "get_tenant_registry", lambda: registry)
+    writer.set_reply("t1")
+
+    health_doc = client.get("/health?tenant=t1").get_json()
+    stats_doc = client.get("/stats?tenant=t1").get_json()
+    assert health_doc["last_reply"] == stats_doc["current_state"]["last_reply"]
+    assert health_doc["last_reply"].endswith(("-04:00", "-05:00"))
@@ -0,0 +1,74 @@
+"""Hachage cohérent: seuls les tenants du membre arrivé ou parti changent de propriétaire."""
+import time
+
+import pytest
+
+from sharding import HashRing, ShardCoordinator, SqliteMembership
+
+TENANTS = [f"tenant-{i}" for i in range(2000)]
+
+
+def _owners(ring: HashRing) -> dict[str, str]:
+    return {tid: ring.owner(tid) for tid in TENANTS}
+
+
+def test_ring_is_deterministic_and_order_independent():
+    assert _owners(HashRing(["a", "b", "c"])) == _owners(HashRing(["c", "a", "b", "a"]))
+    assert HashRing([]).owner("tenant-0") is None
+
+
+def test_member_joining_only_takes_tenants():
+    before = _owners(HashRing(["a", "b", "c", "d"]))
+    after = _owners(HashRing(["a", "b", "c", "d", "e"]))
+    moved = [tid for tid in TENANTS if before[tid] != after[tid]]
+
+    assert all(after[tid] == "e" for tid in moved)
+    # ~1/5 des tenants (points virtuels: répartition proche de l'équilibre)
+    assert 0.12 < len(moved) / len(TENANTS) < 0.28
+
+
+def test_member_leaving_only_releases_its_tenants():
+    before = _owners(HashRing(["a", "b", "c", "d"]))
+    after = _owners(HashRing(["a", "b", "d"]))
+    moved = {tid for tid in TENANTS if before[tid] != after[tid]}
+
+    assert moved == {tid for tid in TENANTS if before[tid] == "c"}
+    assert all(after[tid] != "c" for tid in TENANTS)
+
+
+@pytest.fixture
+def membership(tmp_path):
+    backend = SqliteMembership(str(tmp_path / "leases.db"))
+    yield backend
+    backend.close()
+
+
+def test_coordinators_split_tenants_and_claim_each_once(membership):
+    a = ShardCoordinator(membership, member_id="a", ttl=30)
+    b = ShardCoordinator(membership, member_id="b", ttl=30)
+    a.step()
+    b.step()
+    a.step()
+    assert a.ring.members == b.ring.members == ("a", "b")
+
+    tenants = TENANTS[:200]
+    owned_a = [tid for tid in tenants if a.owns(tid)]
+    owned_b = [tid for tid in tenants if b.owns(tid)]
+    assert sorted(owned_a + owned_b) == sorted(tenants)
+
+    assert a.claim_owned("daily_ping:2026-03-20", tenants) == owned_a
+    # Vue divergente (rééquilibrage en cours): déjà réservé, pas de second envoi
+    assert membership.claim("b", [f"daily_ping:2026-03-20:{tid}" for tid in owned_a]) == [False] * len(owned_a)
+
+
+def test_expired_member_leaves_the_ring(membership):
+    a = ShardCoordinator(membership, member_id="a", ttl=30)
+    b = ShardCoordinator(membership, member_id="b", ttl=0.1)
+    b.step()
+    a.step()
+    assert a.ring.members == ("a", "b")
+
+    time.sleep(0.2)
+    a.step()
+    assert a.ring.members == ("a",)
+    assert all(a.owns(tid) for tid in TENANTS[:50])
@@ -0,0 +1,98 @@
+"""Backends d'état: aller-retour et relecture des écritures d'un autre process."""
+import pytest
+
+from state_storage import JournalStateStorage, SqliteStateStorage
+
+
+def _state(replies: int = 0, waiting: bool = False) -> dict:
+    return {
+        "waiting": waiting,
+        "deadline": "2026-01-01T11:00:00+01:00" if waiting else None,
+        "last_reply": None,
+        "last_ping": "2026-01-01T09:00:00+01:00",
+        "alert_sent": False,
+        "stats": {"total_pings": 1, "total_alerts": 0, "total_replies": replies, "first_ping_date": "2026-01-01"},
+    }
+
+
+@pytest.fixture(params=["sqlite", "journal"])
+def make_storage(request, tmp_path):
+    """Fabrique: chaque appel ouvre le même stockage, comme un autre worker"""
+    opened = []
+
+    def make():
+        if request.param == "sqlite":
+            storage = SqliteStateStorage(str(tmp_path / "state.db"))
+        else:
+            storage = JournalStateStorage(str(tmp_path / "journal"))
+        opened.append(storage)
+        return storage
+
+    yield make
+    for storage in opened:
+        storage.close()
+
+
+def test_round_trip(make_storage):
+    storage = make_storage()
+    states = {"alice": _state(replies=3, waiting=True), "bob": _state()}
+    storage.save(states, states.keys(), {"alice": ["ping"], "bob": ["reply"]})
+
+    assert make_storage().load() == states
+
+
+def test_load_changes_sees_other_process(make_storage):
+    a, b = make_storage(), make_storage()
+    a.save({"alice": _state()}, ["alice"])
+    assert b.load() == {"alice": _state()}
+    assert not b.has_changed()
+
+    a.save({"alice": _state(replies=1)}, ["alice"])
+    assert b.has_changed()
+    assert b.load_changes() == {"alice": _state(replies=1)}
+    assert b.load_changes() == {}
+
+
+def test_own_write_does_not_hide_unread_foreign_write(make_storage):
+    # Mode par lots: un process écrit sans avoir relu les écritures des autres
+    a, b = make_storage(), make_storage()
+    a.load()
+    b.load()
+    b.save({"bob": _state(replies=2)}, ["bob"])
+    a.save({"alice": _state(replies=1)}, ["alice"])
+
+    assert a.has_changed()
+    assert a.load_changes().get("bob") == _state(replies=2)
+
+
+def test_sqlite_load_changes_inside_transaction(tmp_path):
+    a = SqliteStateStorage(str(tmp_path / "state.db"))
+    b = SqliteStateStorage(str(tmp_path / "state.db"))
+    a.save({"alice": _state()}, ["alice"])
+    with b.transaction():
+        assert b.load() == {"alice": _state()}
+        b.save({"bob": _state()}, ["bob"])
+    assert a.load_changes() == {"bob": _state()}
+
+
+def test_json_refresh_publishes_only_changed_tenants(tmp_path):
+    # Deux workers sur le même state.json (réécrit en entier à chaque écriture)
+    from state_manager import StateManager
+
+    state_file = str(tmp_path / "state.json")
+    a = StateManager(state_file, commit_mode="sync")
+    for tenant_id in ("t1", "t2", "t3"):
+        a.reset_waiting(tenant_id)
+    b = StateManager(state_file, commit_mode="sync")
+    published = []
+    b.add_listener(lambda tenant_id, state: published.append(tenant_id), replay=False)
+    versions = {tid: b.get_version(tid) for tid in ("t1", "t2", "t3")}
+
+    a.set_reply("t2")
+    b.refresh(force=True)
+
+    assert published == ["t2"]
+    assert b.get_state("t2").total_replies == 1
+    assert b.get_version("t1") == versions["t1"]
+    assert b.get_version("t3") == versions["t3"]
+    assert b.get_version("t2") > versions["t2"]
@@ -0,0 +1,82 @@
+"""Webhook entrant: déduplication des renvois et 503 quand la file est pleine."""
+import pytest
+from flask import Flask
+
+import routes.webhooks
+from dedup_cache import DedupCache
+
+
+class _StubQueue:
+    def __init__(self):
+        self.accept = True
+        self.events = []
+
+    def submit(self, event) -> bool:
+        if not self.accept:
+            return False
+        self.events.append(event)
+        return True
+
+
+@pytest.fixture
+def queue(monkeypatch, tmp_path):
+    stub = _StubQueue()
+    dedup = DedupCache(max_size=100, ttl=3600, db_file=str(tmp_path / "dedup.db"))
+    monkeypatch.setattr(routes.webhooks, "get_webhook_queue", lambda: stub)
+    monkeypatch.setattr(routes.webhooks, "get_dedup_cache", lambda: dedup)
+    yield stub
+    dedup.close()
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(routes.webhooks.bp)
+    return app.test_client()
+
+
+def _payload(message_id: str) -> dict:
+    message = {"from": "33600000000", "id": message_id, "type": "text", "text": {"body": "OK"}}
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{"changes": [{"value": {"messages": [message]}}]}],
+    }
+
+
+def test_redelivered_message_is_processed_once(client, queue):
+    for _ in range(3):
+        assert client.post("/whatsapp/webhook", json=_payload("wamid.1")).status_code == 200
+    assert [event.message_id for event in queue.events] == ["wamid.1"]
+
+
+def test_full_queue_returns_503_and_accepts_retry(client, queue):
+    queue.accept = False
+    response = client.post("/whatsapp/webhook", json=_payload("wamid.2"))
+    assert response.status_code == 503
+    assert response.get_json() == {"status": "error", "message": "Queue full"}
+
+    # Le renvoi de Meta ne doit pas être pris pour un doublon
+    queue.accept = True
+    assert client.post("/whatsapp/webhook", json=_payload("wamid.2")).status_code == 200
+    assert [event.message_id for event in queue.events] == ["wamid.2"]
+
+
+def test_failed_reply_releases_message_id(monkeypatch, tmp_path):
+    import dedup_cache
+    import services
+    from webhook_queue import InboundReply, process_reply
+
+    dedup = DedupCache(max_size=100, ttl=3600, db_file=str(tmp_path / "dedup.db"))
+    monkeypatch.setattr(dedup_cache, "get_dedup_cache", lambda: dedup)
+
+    def broken_state_manager():
+        raise RuntimeError("disque plein")
+
+    monkeypatch.setattr(services, "get_state_manager", broken_state_manager)
+    assert dedup.check_and_add("wamid.3")
+    with pytest.raises(RuntimeError):
+        process_reply(InboundReply("t1", "+33600000001", "ok", message_id="wamid.3"))
+
+    # Le renvoi de Meta est retraité
+    assert dedup.check_and_add("wamid.3")
+    dedup.close()
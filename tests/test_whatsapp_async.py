@@ -0,0 +1,30 @@
+"""Transport httpx: les jetons du seau vont aux alertes avant les pings en attente."""
+import asyncio
+import time
+
+import pytest
+
+whatsapp_async = pytest.importorskip("whatsapp_async")
+if not whatsapp_async.HTTPX_AVAILABLE:
+    pytest.skip("httpx non installé", allow_module_level=True)
+
+from outbound_dispatcher import PRIORITY_HIGH, PRIORITY_NORMAL
+
+
+def test_high_priority_waiter_takes_next_token():
+    client = whatsapp_async.AsyncWhatsAppClient(rate=50)
+    client.bucket.pause(time.monotonic() + 0.05)  # seau vide: tout le monde attend
+    granted = []
+
+    async def take(name, priority):
+        await client._take_token(priority)
+        granted.append(name)
+
+    async def scenario():
+        pings = [asyncio.ensure_future(take(f"ping-{i}", PRIORITY_NORMAL)) for i in range(3)]
+        await asyncio.sleep(0.01)
+        alert = asyncio.ensure_future(take("alert", PRIORITY_HIGH))
+        await asyncio.gather(*pings, alert)
+
+    asyncio.run(scenario())
+    assert granted == ["alert", "ping-0", "ping-1", "ping-2"]
@@ -0,0 +1,204 @@
+"""File de traitement asynchrone des webhooks entrants.
+
+Pourquoi:
+- Meta attend une réponse rapide au webhook; sinon il renvoie le payload.
+- `set_reply()` (écriture disque) et l'envoi de la confirmation `TEMPLATE_OK`
+  (appel HTTP avec retry) n'ont pas à bloquer la requête.
+
+Le webhook valide le payload, dépose les événements dans une file bornée et
+répond tout de suite. Un pool de threads consommateurs applique ensuite les
+changements d'état et envoie les confirmations. Les statuts de livraison de
+nos propres messages (`statuses`) passent par la même file
+(delivery_tracker.py).
+"""
+
+from __future__ import annotations
+
+import time
+import queue
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Callable
+
+from config import TEMPLATE_OK, WEBHOOK_QUEUE_SIZE, WEBHOOK_WORKERS
+from telemetry import Gauge, WEBHOOK_EVENT
+
+logger = logging.getLogger("whatsapp_bot")
+
+
+@dataclass
+class InboundReply:
+    """Réponse d'une personne surveillée, reçue par webhook."""
+    tenant_id: str
+    phone: str
+    text: str = ""
+    message_id: str | None = None
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class DeliveryStatus:
+    """Statut de livraison d'un message sortant (sent, delivered, read, failed)."""
+    message_id: str
+    status: str
+    timestamp: float
+    recipient: str | None = None
+    error: str | None = None
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+    @classmethod
+    def from_webhook(cls, raw) -> "DeliveryStatus | None":
+        """Statut d'un élément de `value["statuses"]` (None si invalide)"""
+        if not isinstance(raw, dict):
+            return None
+        message_id, status = raw.get("id"), raw.get("status")
+        if not isinstance(message_id, str) or not message_id or not isinstance(status, str):
+            return None
+        try:
+            timestamp = float(raw.get("timestamp"))
+        except (TypeError, ValueError):
+            timestamp = time.time()
+        error = None
+        errors = raw.get("errors")
+        if isinstance(errors, list) and errors and isinstance(errors[0], dict):
+            first = errors[0]
+            error = f"{first.get('code', 'unknown')}: {first.get('title') or first.get('message') or ''}".strip()
+        recipient = raw.get("recipient_id")
+        return cls(message_id, status, timestamp, recipient if isinstance(recipient, str) else None, error)
+
+
+class WebhookQueue:
+    """File bornée + pool de consommateurs (threads démarrés au premier dépôt)."""
+
+    def __init__(self, handler: Callable[[InboundReply | DeliveryStatus], None], maxsize: int = 1000, workers: int = 2):
+        self.handler = handler
+        self.maxsize = maxsize
+        self.workers = max(1, workers)
+        self._queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self._threads: list[threading.Thread] = []
+        self._start_lock = threading.Lock()
+
+        # Métriques (mises à jour sans lock: compteurs indicatifs)
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+
+    def start(self) -> None:
+        """Démarre les consommateurs (idempotent, à appeler après un éventuel fork)."""
+        with self._start_lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"webhook-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, event: InboundReply | DeliveryStatus) -> bool:
+        """Dépose un événement. Renvoie False si la file est pleine."""
+        if not self._threads:
+            self.start()
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.rejected += 1
+            logger.warning(f"⚠️ File webhook pleine ({self.maxsize}), événement refusé")
+            return False
+        self.enqueued += 1
+        return True
+
+    def _run(self) -> None:
+        while True:
+            event = self._queue.get()
+            try:
+                if event is None:
+                    return
+                lag_ms = (time.monotonic() - event.enqueued_at) * 1000
+                self.last_lag_ms = lag_ms
+                if lag_ms > self.max_lag_ms:
+                    self.max_lag_ms = lag_ms
+                started = time.perf_counter()
+                self.handler(event)
+                WEBHOOK_EVENT.observe(
+                    time.perf_counter() - started, "status" if isinstance(event, DeliveryStatus) else "reply"
+                )
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"❌ Erreur de traitement du webhook: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Arrêt propre: traite ce qui est déjà en file (dans la limite de `timeout`)."""
+        with self._start_lock:
+            threads, self._threads = self._threads, []
+        if not threads:
+            return
+        for _ in threads:
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                break
+        deadline = time.monotonic() + timeout
+        for t in threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+
+    def metrics(self) -> dict:
+        return {
+            "depth": self._queue.qsize(),
+            "capacity": self.maxsize,
+            "workers": len(self._threads),
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "last_lag_ms": round(self.last_lag_ms, 3),
+            "max_lag_ms": round(self.max_lag_ms, 3),
+        }
+
+
+def process_reply(event: InboundReply) -> None:
+    """Applique une réponse: fin de l'attente + confirmation `TEMPLATE_OK`.
+
+    En cas d'échec, l'id du message est libéré dans le cache de déduplication:
+    le renvoi de Meta sera traité au lieu d'être écarté comme doublon.
+    """
+    # Imports tardifs: évite de charger l'API et l'état à l'import du module
+    from services import get_state_manager
+    from history_store import get_history_store
+    from whatsapp_api import submit_template
+
+    try:
+        get_state_manager().set_reply(event.tenant_id)
+        get_history_store().record_reply(event.tenant_id, int(time.time()))
+        # Confirmation non bloquante: le consommateur passe à l'événement suivant
+        submit_template(event.phone, TEMPLATE_OK)
+    except Exception:
+        if event.message_id:
+            from dedup_cache import get_dedup_cache
+            get_dedup_cache().discard(event.message_id)
+        raise
+
+
+def process_event(event: InboundReply | DeliveryStatus) -> None:
+    """Consommateur de la file: réponse d'une personne ou statut de livraison"""
+    if isinstance(event, DeliveryStatus):
+        from delivery_tracker import get_delivery_tracker
+        get_delivery_tracker().record(event)
+    else:
+        process_reply(event)
+
+
+# Singleton : une file par process.
+webhook_queue = WebhookQueue(process_event, maxsize=WEBHOOK_QUEUE_SIZE, workers=WEBHOOK_WORKERS)
+
+
+def get_webhook_queue() -> WebhookQueue:
+    return webhook_queue
+
+
+Gauge("webhook_queue_depth", "Événements webhook en attente de traitement", lambda: webhook_queue.metrics()["depth"])
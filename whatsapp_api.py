@@ -1,94 +1,178 @@
 """Fonctions d'appel à l'API WhatsApp"""
 import json
-import logging
 import time
+import asyncio
+import logging
+from concurrent.futures import Future
 import requests
-from config import WHATSAPP_TOKEN, WHATSAPP_PHONE_ID
+from requests.adapters import HTTPAdapter
+from config import (
+    WHATSAPP_TOKEN, WHATSAPP_PHONE_ID, WA_API_BASE_URL, WA_RATE_PER_SEC, WA_SENDER_THREADS,
+    WA_TRANSPORT, WA_HTTP_TIMEOUT_SEC,
+)
+from outbound_dispatcher import OutboundDispatcher, Attempt, PRIORITY_NORMAL, PRIORITY_HIGH
+from profiling import traced
+from telemetry import Gauge, GRAPH_LATENCY, GRAPH_RATE_LIMITED, GRAPH_RETRIES
 
 logger = logging.getLogger("whatsapp_bot")
 _session = requests.Session()
+# Une connexion keep-alive par thread d'envoi (le pool par défaut est de 10)
+_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=WA_SENDER_THREADS))
+_session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=WA_SENDER_THREADS))
 
+__all__ = [
+    "wa_call", "wa_submit", "template_payload", "send_template", "send_text", "submit_template", "submit_text",
+    "send_template_async", "send_text_async", "get_dispatcher", "PRIORITY_NORMAL", "PRIORITY_HIGH",
+]
 
-def wa_call(payload: dict, retry=2):
-    """Appelle l'API WhatsApp avec retry automatique et gestion d'erreurs améliorée"""
-    # Vérifier que les tokens sont configurés
-    if not WHATSAPP_TOKEN or not WHATSAPP_PHONE_ID:
-        logger.error("❌ WHATSAPP_TOKEN ou WHATSAPP_PHONE_ID manquant")
-        return None
+
+def parse_body(r):
+    """Parsing sécurisé du body JSON (requests ou httpx)"""
+    try:
+        if r.headers.get("content-type", "").startswith("application/json"):
+            return r.json()
+        return r.text
+    except (ValueError, json.JSONDecodeError) as e:
+        logger.warning(f"⚠️ Impossible de parser le JSON de la réponse: {e}")
+        return r.text
+
+
+def classify_response(r, attempt: int) -> Attempt:
+    """Traduit une réponse HTTP en résultat de tentative (commun aux transports)"""
+    body = parse_body(r)
     
-    url = f"https://graph.facebook.com/v24.0/{WHATSAPP_PHONE_ID}/messages"
-    headers = {"Authorization": f"Bearer {WHATSAPP_TOKEN}", "Content-Type": "application/json"}
+    if r.status_code == 200:
+        logger.info("✅ WhatsApp API OK", extra={"body": body})
+        return Attempt(response=r)
+    
+    # Gestion spécifique des erreurs HTTP
+    elif r.status_code == 401:
+        logger.error("❌ Token WhatsApp expiré ou invalide (401). Régénérez votre token dans Meta Developer Dashboard.")
+        return Attempt()  # Ne pas retry pour les erreurs d'authentification
     
-    for attempt in range(retry):
+    elif r.status_code == 429:
+        # Rate limiting - retry planifié par l'appelant (pas de sleep ici)
         try:
-            r = _session.post(url, headers=headers, json=payload, timeout=15)
-            
-            # Parsing sécurisé du body JSON
-            try:
-                if r.headers.get("content-type", "").startswith("application/json"):
-                    body = r.json()
-                else:
-                    body = r.text
-            except (ValueError, json.JSONDecodeError) as e:
-                logger.warning(f"⚠️ Impossible de parser le JSON de la réponse: {e}")
-                body = r.text
-            
-            if r.status_code == 200:
-                logger.info("✅ WhatsApp API OK", extra={"body": body})
-                return r
-            
-            # Gestion spécifique des erreurs HTTP
-            elif r.status_code == 401:
-                logger.error("❌ Token WhatsApp expiré ou invalide (401). Régénérez votre token dans Meta Developer Dashboard.")
-                return None  # Ne pas retry pour les erreurs d'authentification
-            
-            elif r.status_code == 429:
-                # Rate limiting - attendre avant de retry
-                retry_after = int(r.headers.get("Retry-After", 60))
-                logger.warning(f"⚠️ Rate limit atteint (429). Attente de {retry_after}s avant retry...")
-                if attempt < retry - 1:  # Pas de sleep sur la dernière tentative
-                    time.sleep(retry_after)
-                continue
-            
-            elif r.status_code >= 500:
-                # Erreurs serveur - retry avec backoff
-                logger.warning(f"⚠️ Erreur serveur WhatsApp {r.status_code}: {body}")
-                if attempt < retry - 1:
-                    time.sleep(2 ** attempt)  # Backoff exponentiel: 1s, 2s, 4s...
-                continue
-            
-            else:
-                # Autres erreurs (400, 403, etc.) - ne pas retry
-                error_code = body.get("error", {}).get("code", "unknown") if isinstance(body, dict) else "unknown"
-                error_message = body.get("error", {}).get("message", str(body)) if isinstance(body, dict) else str(body)
-                logger.error(f"❌ WhatsApp API erreur {r.status_code} (code: {error_code}): {error_message}")
-                return None
-                
-        except requests.exceptions.Timeout as e:
-            logger.error(f"❌ Timeout sur tentative {attempt+1}/{retry}: {e}")
-            if attempt == retry - 1:
-                return None
-            time.sleep(2 ** attempt)  # Backoff exponentiel
-            
-        except requests.exceptions.RequestException as e:
-            logger.error(f"❌ Tentative {attempt+1}/{retry} - Erreur réseau: {e}")
-            if attempt == retry - 1:  # dernière tentative
-                return None
-            time.sleep(2 ** attempt)  # Backoff exponentiel
+            retry_after = int(r.headers.get("Retry-After", 60))
+        except (ValueError, TypeError):
+            retry_after = 60
+        logger.warning(f"⚠️ Rate limit atteint (429). Nouvelle tentative dans {retry_after}s...")
+        return Attempt(retry_after=retry_after, rate_limited=True)
+    
+    elif r.status_code >= 500:
+        # Erreurs serveur - retry avec backoff
+        logger.warning(f"⚠️ Erreur serveur WhatsApp {r.status_code}: {body}")
+        return Attempt(retry_after=2 ** attempt)  # Backoff exponentiel: 1s, 2s, 4s...
     
-    return None
+    else:
+        # Autres erreurs (400, 403, etc.) - ne pas retry
+        error_code = body.get("error", {}).get("code", "unknown") if isinstance(body, dict) else "unknown"
+        error_message = body.get("error", {}).get("message", str(body)) if isinstance(body, dict) else str(body)
+        logger.error(f"❌ WhatsApp API erreur {r.status_code} (code: {error_code}): {error_message}")
+        return Attempt()
+
+
+def observe_attempt(payload: dict, status: str, elapsed: float, result: Attempt) -> None:
+    """Métriques d'une tentative (commun aux transports): `status` = code HTTP, timeout ou network"""
+    template = payload.get("template", {}).get("name") or payload.get("type", "unknown")
+    GRAPH_LATENCY.observe(elapsed, status, template)
+    if result.retry_after is not None:
+        GRAPH_RETRIES.inc("rate_limited" if result.rate_limited else "server_error" if status.isdigit() else status)
+    if result.rate_limited:
+        GRAPH_RATE_LIMITED.inc()
+
+
+@traced("wa_attempt")
+def _wa_attempt(payload: dict, attempt: int) -> Attempt:
+    """Une tentative d'appel à l'API WhatsApp (sans attente: le délai de retry est renvoyé)"""
+    url = f"{WA_API_BASE_URL}/{WHATSAPP_PHONE_ID}/messages"
+    headers = {"Authorization": f"Bearer {WHATSAPP_TOKEN}", "Content-Type": "application/json"}
+
+    started = time.perf_counter()
+    try:
+        r = _session.post(url, headers=headers, json=payload, timeout=WA_HTTP_TIMEOUT_SEC)
+        status = str(r.status_code)
+        result = classify_response(r, attempt)
+            
+    except requests.exceptions.Timeout as e:
+        logger.error(f"❌ Timeout sur tentative {attempt+1}: {e}")
+        status, result = "timeout", Attempt(retry_after=2 ** attempt)  # Backoff exponentiel
+        
+    except requests.exceptions.RequestException as e:
+        logger.error(f"❌ Tentative {attempt+1} - Erreur réseau: {e}")
+        status, result = "network", Attempt(retry_after=2 ** attempt)  # Backoff exponentiel
+
+    observe_attempt(payload, status, time.perf_counter() - started, result)
+    return result
+
+
+# Singleton : un répartiteur (seau à jetons + pool d'envoi) par process.
+_dispatcher = OutboundDispatcher(_wa_attempt, rate=WA_RATE_PER_SEC, senders=WA_SENDER_THREADS)
+
+
+def get_dispatcher() -> OutboundDispatcher:
+    return _dispatcher
+
+
+Gauge(
+    "whatsapp_outbound_jobs", "Envois WhatsApp du répartiteur par état (prêts, en attente de retry, en cours)",
+    lambda: {state: value for state, value in _dispatcher.metrics().items() if state in ("ready", "delayed", "inflight")},
+    ("state",),
+)
+
+
+def wa_submit(payload: dict, retry=2, priority: int = PRIORITY_NORMAL, detailed: bool = False) -> Future:
+    """Planifie un appel à l'API WhatsApp. Le Future renvoie la réponse (200) ou None
+    (ou la dernière `Attempt` si `detailed`, voir OutboundDispatcher.submit)"""
+    # Vérifier que les tokens sont configurés
+    if not WHATSAPP_TOKEN or not WHATSAPP_PHONE_ID:
+        logger.error("❌ WHATSAPP_TOKEN ou WHATSAPP_PHONE_ID manquant")
+        future = Future()
+        future.set_result(None)
+        return future
+    if WA_TRANSPORT == "httpx":
+        # Transport asyncio (HTTP/2), voir whatsapp_async.py
+        import whatsapp_async
+        return whatsapp_async.submit(payload, retry=retry, priority=priority, detailed=detailed)
+    return _dispatcher.submit(payload, retry=retry, priority=priority, detailed=detailed)
+
+
+@traced("wa_call")
+def wa_call(payload: dict, retry=2):
+    """Appelle l'API WhatsApp avec retry automatique et gestion d'erreurs améliorée.
+
+    Version bloquante de `wa_submit`: attend le résultat final.
+    """
+    return wa_submit(payload, retry=retry).result()
+
+
+def template_payload(to: str, template_name: str, lang_code: str) -> dict:
+    return {
+        "messaging_product": "whatsapp",
+        "to": to,
+        "type": "template",
+        "template": {"name": template_name, "language": {"code": lang_code}},
+    }
+
+
+def _text_payload(to: str, text: str) -> dict:
+    return {"messaging_product": "whatsapp", "to": to, "type": "text", "text": {"body": text}}
+
+
+def submit_template(to: str, template_name: str, lang_code: str = "fr", priority: int = PRIORITY_NORMAL) -> Future:
+    """Planifie l'envoi d'un template WhatsApp (non bloquant)"""
+    return wa_submit(template_payload(to, template_name, lang_code), priority=priority)
+
+
+def submit_text(to: str, text: str, priority: int = PRIORITY_NORMAL) -> Future:
+    """Planifie l'envoi d'un message texte WhatsApp (non bloquant)"""
+    return wa_submit(_text_payload(to, text), priority=priority)
 
 
 def send_template(to: str, template_name: str, lang_code: str = "fr"):
     """Envoie un template WhatsApp"""
     try:
-        payload = {
-            "messaging_product": "whatsapp",
-            "to": to,
-            "type": "template",
-            "template": {"name": template_name, "language": {"code": lang_code}},
-        }
-        return wa_call(payload)
+        return wa_call(template_payload(to, template_name, lang_code))
     except Exception as e:
         logger.error(f"❌ Impossible d'envoyer le template {template_name} à {to}: {e}")
         return None
@@ -97,9 +181,17 @@ def send_template(to: str, template_name: str, lang_code: str = "fr"):
 def send_text(to: str, text: str):
     """Envoie un message texte WhatsApp"""
     try:
-        payload = {"messaging_product": "whatsapp", "to": to, "type": "text", "text": {"body": text}}
-        return wa_call(payload)
+        return wa_call(_text_payload(to, text))
     except Exception as e:
         logger.error(f"❌ Impossible d'envoyer le texte à {to}: {e}")
         return None
 
+
+async def send_template_async(to: str, template_name: str, lang_code: str = "fr"):
+    """Envoie un template WhatsApp (coroutine; n'occupe pas la boucle de l'appelant)"""
+    return await asyncio.wrap_future(submit_template(to, template_name, lang_code))
+
+
+async def send_text_async(to: str, text: str):
+    """Envoie un message texte WhatsApp (coroutine; n'occupe pas la boucle de l'appelant)"""
+    return await asyncio.wrap_future(submit_text(to, text))
@@ -0,0 +1,185 @@
+"""Transport asyncio (httpx) pour l'API WhatsApp.
+
+Activé par `WA_TRANSPORT=httpx` (paquet optionnel `httpx[http2]`):
+- un seul `httpx.AsyncClient` avec limites de pool explicites et keep-alive réglé;
+- HTTP/2 vers graph.facebook.com (multiplexage de tous les envois sur quelques
+  connexions) si le paquet `h2` est installé, HTTP/1.1 sinon;
+- les retries et le seau à jetons attendent avec `asyncio.sleep`: aucun thread
+  n'est bloqué;
+- les jetons sont distribués par priorité puis par ordre d'arrivée: comme avec
+  le répartiteur synchrone, une alerte (`PRIORITY_HIGH`) passe avant les pings
+  déjà en attente.
+
+Le client vit dans une boucle asyncio dédiée (thread daemon démarré au premier
+envoi). `submit()` renvoie un `concurrent.futures.Future`, utilisable depuis le
+code synchrone (`whatsapp_api.send_template`) comme depuis une coroutine
+(`whatsapp_api.send_template_async`).
+"""
+
+from __future__ import annotations
+
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+import threading
+from concurrent.futures import Future
+
+from config import (
+    WHATSAPP_TOKEN, WHATSAPP_PHONE_ID, WA_API_BASE_URL, WA_RATE_PER_SEC,
+    WA_HTTP_MAX_CONNECTIONS, WA_HTTP_MAX_KEEPALIVE, WA_HTTP_KEEPALIVE_EXPIRY, WA_HTTP_TIMEOUT_SEC,
+)
+from outbound_dispatcher import TokenBucket, Attempt, PRIORITY_NORMAL
+from whatsapp_api import classify_response, observe_attempt
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except Exception:
+    HTTPX_AVAILABLE = False
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except Exception:
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger("whatsapp_bot")
+
+
+class AsyncWhatsAppClient:
+    """Client asynchrone de l'API WhatsApp (à utiliser depuis une seule boucle)."""
+
+    def __init__(
+        self,
+        base_url: str = WA_API_BASE_URL,
+        token: str | None = WHATSAPP_TOKEN,
+        phone_id: str | None = WHATSAPP_PHONE_ID,
+        rate: float = WA_RATE_PER_SEC,
+        max_connections: int = WA_HTTP_MAX_CONNECTIONS,
+        max_keepalive: int = WA_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry: float = WA_HTTP_KEEPALIVE_EXPIRY,
+        http2: bool = True,
+    ):
+        if not HTTPX_AVAILABLE:
+            raise RuntimeError("Le transport httpx nécessite le paquet httpx[http2]")
+        self.url = f"{base_url}/{phone_id}/messages"
+        self.headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+        self.bucket = TokenBucket(rate)
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._client: httpx.AsyncClient | None = None
+        # Envois en attente d'un jeton: (priorité, ordre d'arrivée, attente)
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._granter: asyncio.Task | None = None
+
+    def _get_client(self) -> "httpx.AsyncClient":
+        # Créé dans la boucle qui l'utilise
+        if self._client is None:
+            self._client = httpx.AsyncClient(http2=self.http2, limits=self.limits, timeout=httpx.Timeout(WA_HTTP_TIMEOUT_SEC))
+        return self._client
+
+    async def _take_token(self, priority: int = PRIORITY_NORMAL) -> None:
+        if not self._waiters and self.bucket.try_take(time.monotonic()) == 0:
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), waiter))
+        if self._granter is None or self._granter.done():
+            self._granter = asyncio.ensure_future(self._grant_tokens())
+        await waiter
+
+    async def _grant_tokens(self) -> None:
+        """Distribue les jetons aux envois en attente, le plus prioritaire d'abord"""
+        while self._waiters:
+            if self._waiters[0][2].done():
+                heapq.heappop(self._waiters)  # envoi annulé
+                continue
+            wait = self.bucket.try_take(time.monotonic())
+            if wait:
+                await asyncio.sleep(wait)
+                continue
+            heapq.heappop(self._waiters)[2].set_result(None)
+
+    async def call(self, payload: dict, retry: int = 2, detailed: bool = False, priority: int = PRIORITY_NORMAL):
+        """Appelle l'API avec retry. Renvoie la réponse (200) ou None (dernière `Attempt` si `detailed`)."""
+        client = self._get_client()
+        for attempt in range(retry):
+            await self._take_token(priority)
+            started = time.perf_counter()
+            try:
+                r = await client.post(self.url, headers=self.headers, json=payload)
+                status = str(r.status_code)
+                result = classify_response(r, attempt)
+            except httpx.TimeoutException as e:
+                logger.error(f"❌ Timeout sur tentative {attempt+1}/{retry}: {e}")
+                status, result = "timeout", Attempt(retry_after=2 ** attempt)
+            except httpx.HTTPError as e:
+                logger.error(f"❌ Tentative {attempt+1}/{retry} - Erreur réseau: {e}")
+                status, result = "network", Attempt(retry_after=2 ** attempt)
+            observe_attempt(payload, status, time.perf_counter() - started, result)
+
+            if result.retry_after is None:
+                return result if detailed else result.response
+            if result.rate_limited:
+                self.bucket.pause(time.monotonic() + result.retry_after)
+            if attempt < retry - 1:  # Pas d'attente après la dernière tentative
+                await asyncio.sleep(result.retry_after)
+        return result if detailed else None
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class _LoopThread:
+    """Boucle asyncio dans un thread daemon, démarrée à la demande."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.client: AsyncWhatsAppClient | None = None
+
+    def ensure_started(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self.loop is None:
+                self.client = AsyncWhatsAppClient()
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, name="wa-async", daemon=True).start()
+            return self.loop
+
+    def stop(self, timeout: float = 5.0) -> None:
+        with self._lock:
+            loop, client = self.loop, self.client
+            self.loop = self.client = None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop).result(timeout)
+        except Exception:
+            pass
+        loop.call_soon_threadsafe(loop.stop)
+
+
+_runner = _LoopThread()
+
+
+def get_client() -> AsyncWhatsAppClient:
+    _runner.ensure_started()
+    return _runner.client
+
+
+def submit(payload: dict, retry: int = 2, detailed: bool = False, priority: int = PRIORITY_NORMAL) -> Future:
+    """Planifie un appel sur la boucle asyncio dédiée. Renvoie un Future."""
+    loop = _runner.ensure_started()
+    return asyncio.run_coroutine_threadsafe(_runner.client.call(payload, retry, detailed, priority), loop)
+
+
+def stop() -> None:
+    _runner.stop()